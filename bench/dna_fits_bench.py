@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dna_fits import dna_fits_header, DNA_FITS_BLOCK, DNA_FITS_CARD
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_fits_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_CARDS = 120
+DEF_FILES = 50
+DEF_SIZE = 14904000
+DEF_REPEAT = 3
+DEF_KEYS = ('ARTNOID', 'TARGET', 'OBJECT')
+
+
+# +
+# function: bench_card()
+# -
+def bench_card(_key: str = '', _value: object = None) -> bytes:
+    """ returns an 80 character header card """
+    if isinstance(_value, bool):
+        _v = f"{'T' if _value else 'F':>20}"
+    elif isinstance(_value, str):
+        _v = f"'{_value:<8}'"
+    else:
+        _v = f'{_value:>20}'
+    return f'{_key:<8}= {_v}'.ljust(DNA_FITS_CARD).encode('ascii')
+
+
+# +
+# function: bench_frame()
+# -
+def bench_frame(_file: str = '', _i: int = 0, _size: int = DEF_SIZE, _dense: bool = False) -> None:
+    """ writes a Mont4k sized 16-bit frame with a realistic number of header cards """
+    _nhdr = -(-(DEF_CARDS + 9) * DNA_FITS_CARD // DNA_FITS_BLOCK) * DNA_FITS_BLOCK
+    _cards = [bench_card('SIMPLE', True), bench_card('BITPIX', 16), bench_card('NAXIS', 2),
+              bench_card('NAXIS1', (_size - _nhdr) // 2), bench_card('NAXIS2', 1)]
+    _cards += [bench_card(f'KEY{_k:04d}', float(_k)) for _k in range(DEF_CARDS)]
+    _cards += [bench_card('ARTNOID', f'{_i:032x}'), bench_card('TARGET', f'M{_i}'), bench_card('OBJECT', f'M{_i}'),
+               f'{"END":<{DNA_FITS_CARD}}'.encode('ascii')]
+    _hdr = b''.join(_cards)
+    _hdr += b' ' * (-len(_hdr) % DNA_FITS_BLOCK)
+    with open(_file, 'wb') as _fw:
+        _fw.write(_hdr)
+        if _dense:
+            _chunk = b'\0' * (1024 * 1024)
+            _left = _size - len(_hdr)
+            while _left > 0:
+                _left -= _fw.write(_chunk[:min(_left, len(_chunk))])
+        else:
+            _fw.truncate(_size)
+
+
+# +
+# function: bench()
+# -
+def bench(_files: int = DEF_FILES, _size: int = DEF_SIZE, _repeat: int = DEF_REPEAT, _dense: bool = False) -> None:
+    """ compare dna_fits_header() with astropy.io.fits.open() """
+
+    try:
+        from astropy.io import fits
+    except ImportError:
+        fits = None
+
+    with tempfile.TemporaryDirectory() as _tmp:
+        _paths = [os.path.join(_tmp, f'frame{_i:04d}.fits') for _i in range(_files)]
+        for _i, _p in enumerate(_paths):
+            bench_frame(_p, _i, _size, _dense)
+
+        # check values agree
+        if fits is not None:
+            for _p in _paths:
+                with fits.open(_p) as _hdulist:
+                    _a = {_k: _hdulist[0].header[_k] for _k in DEF_KEYS}
+                if _a != dna_fits_header(_p, DEF_KEYS):
+                    print(f'value mismatch for {_p}')
+
+        # time them
+        _results = {}
+        for _r in range(_repeat):
+            _t0 = time.perf_counter()
+            for _p in _paths:
+                dna_fits_header(_p, DEF_KEYS)
+            _results.setdefault('dna_fits_header', []).append(time.perf_counter() - _t0)
+            if fits is not None:
+                _t0 = time.perf_counter()
+                for _p in _paths:
+                    with fits.open(_p) as _hdulist:
+                        _ = [_hdulist[0].header[_k] for _k in DEF_KEYS]
+                _results.setdefault('astropy.io.fits', []).append(time.perf_counter() - _t0)
+
+    print(f'{_files} files of {_size} bytes ({"dense" if _dense else "sparse"}), best of {_repeat}')
+    for _k, _v in _results.items():
+        print(f'{_k:>16}: {min(_v) * 1000.0:10.2f} ms total, {min(_v) * 1.0e6 / _files:10.1f} us/file')
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark header-only FITS reader against astropy',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--files', default=DEF_FILES, help=f"""number of files <int>, defaults to %(default)s""")
+    _p.add_argument(f'--size', default=DEF_SIZE, help=f"""file size <int>, defaults to %(default)s""")
+    _p.add_argument(f'--repeat', default=DEF_REPEAT, help=f"""repeats <int>, defaults to %(default)s""")
+    _p.add_argument(f'--dense', default=False, action='store_true', help=f'if present, write real (not sparse) data')
+    _a = _p.parse_args()
+
+    # execute
+    bench(_files=int(_a.files), _size=int(_a.size), _repeat=int(_a.repeat), _dense=bool(_a.dense))
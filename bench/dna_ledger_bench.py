@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from datetime import datetime
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dna_ledger import DnaLedger
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_ledger_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_FRAMES = 5000
+DEF_RUNS = 168
+DEF_REPORT = 12
+
+
+# +
+# function: bench_element()
+# -
+def bench_element(_i: int = 0, _mtime: float = 0.0) -> dict:
+    """ returns a synthetic .dna.json element """
+    return {'file': f'/rts2data/Kuiper/Mont4k/20200414/object/frame{_i:05d}.fits', 'user': 'artn',
+            'email': 'artn@example.com', 'oid': f'{_i // 10:032x}', 'tgt': 'M51', 'size': 14904000,
+            'mtime': _mtime, 'timestamp': f'{datetime.fromtimestamp(_mtime).isoformat()}'}
+
+
+# +
+# function: bench_list()
+# -
+def bench_list(_json: str = '', _files: list = None, _new: dict = None) -> None:
+    """ one cron run using the legacy list scan """
+    try:
+        with open(_json, 'r') as _fr:
+            dna_json = list(json.load(_fr))
+    except Exception:
+        dna_json = []
+    for _file in _files:
+        if [_f for _f in dna_json if _file in _f['file']] != []:
+            continue
+        dna_json.append(_new[_file])
+    with open(_json, 'w') as _fw:
+        json.dump(dna_json, _fw)
+
+
+# +
+# function: bench_ledger()
+# -
+def bench_ledger(_json: str = '', _files: list = None, _new: dict = None) -> None:
+    """ one cron run using the indexed ledger """
+    dna_json = DnaLedger(_json)
+    dna_json.load()
+    for _file in _files:
+        _e = _new[_file]
+        if dna_json.processed(_file, _e['mtime'], _e['size']):
+            continue
+        dna_json.add(_e)
+    dna_json.save()
+
+
+# +
+# function: bench()
+# -
+def bench(_frames: int = DEF_FRAMES, _runs: int = DEF_RUNS, _report: int = DEF_REPORT) -> None:
+    """ simulate a night of cron runs, each run sees every frame written so far """
+
+    _elements = [bench_element(_i, 1586822400.0 + _i * 6.0) for _i in range(_frames)]
+    _new = {_e['file']: _e for _e in _elements}
+    _per_run = max(1, _frames // _runs)
+
+    with tempfile.TemporaryDirectory() as _tmp:
+        _results = {}
+        for _name, _func in (('list', bench_list), ('ledger', bench_ledger)):
+            _json = os.path.join(_tmp, f'.dna.{_name}.json')
+            _results[_name] = []
+            for _r in range(_runs):
+                _files = [_e['file'] for _e in _elements[:min(_frames, (_r + 1) * _per_run)]]
+                _t0 = time.perf_counter()
+                _func(_json, _files, _new)
+                _results[_name].append((len(_files), time.perf_counter() - _t0))
+
+    print(f"{'run':>6} {'frames':>8} {'list (ms)':>12} {'ledger (ms)':>12}")
+    for _r in range(0, _runs, max(1, _runs // _report)):
+        print(f"{_r:>6} {_results['list'][_r][0]:>8} {_results['list'][_r][1] * 1000.0:>12.2f} "
+              f"{_results['ledger'][_r][1] * 1000.0:>12.2f}")
+    print(f"{'total':>6} {_frames:>8} {sum(_t for _, _t in _results['list']) * 1000.0:>12.2f} "
+          f"{sum(_t for _, _t in _results['ledger']) * 1000.0:>12.2f}")
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark .dna.json ledger over a simulated night',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--frames', default=DEF_FRAMES, help=f"""frames in the night <int>, defaults to %(default)s""")
+    _p.add_argument(f'--runs', default=DEF_RUNS, help=f"""cron runs in the night <int>, defaults to %(default)s""")
+    _p.add_argument(f'--report', default=DEF_REPORT, help=f"""rows to report <int>, defaults to %(default)s""")
+    _a = _p.parse_args()
+
+    # execute
+    bench(_frames=int(_a.frames), _runs=int(_a.runs), _report=int(_a.report))
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+import argparse
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dna_fits_bench import bench_card
+from dna_fits import DNA_FITS_BLOCK, DNA_FITS_CARD
+from PsqlConnection import DB_AUTHORIZATION, DB_HOST, DB_NAME, DB_PORT
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_night_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_FRAMES = '100,1000,10000'
+DEF_MIX = 'object:50,bias:10,dark:10,flat:10,focus:5,skyflat:10,standard:5'
+DEF_PER_OID = 10
+DEF_SIZE = 655360
+DEF_USERS = 5
+
+BENCH_ISO = 20200414
+BENCH_STREAM_URL = 'http://localhost/dna'
+BENCH_STAGES = (('scan', ('scan',)), ('headers', ('headers',)), ('db', ('db_connect', 'db_query', 'db_commit')),
+                ('archive', ('tgz',)), ('notify', ('gmail',)))
+
+
+# +
+# class: BenchSmtpHandler() inherits from the socketserver.StreamRequestHandler class
+# -
+class BenchSmtpHandler(socketserver.StreamRequestHandler):
+    """ just enough SMTP (no TLS, no AUTH) to accept and count messages """
+
+    def handle(self) -> None:
+        self.server.connections += 1
+        self.wfile.write(b'220 localhost dna_night_bench SMTP sink\r\n')
+        _data = False
+        for _line in self.rfile:
+            if _data:
+                if _line.rstrip(b'\r\n') == b'.':
+                    _data = False
+                    with self.server.lock:
+                        self.server.messages += 1
+                    self.wfile.write(b'250 OK\r\n')
+                continue
+            _cmd = _line[:4].upper()
+            if _cmd == b'DATA':
+                _data = True
+                self.wfile.write(b'354 End data with <CR><LF>.<CR><LF>\r\n')
+            elif _cmd == b'QUIT':
+                self.wfile.write(b'221 Bye\r\n')
+                return
+            else:
+                self.wfile.write(b'250 OK\r\n')
+
+
+# +
+# class: BenchSmtp() inherits from the socketserver.ThreadingTCPServer class
+# -
+class BenchSmtp(socketserver.ThreadingTCPServer):
+    """ local SMTP sink on an ephemeral port """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('localhost', 0), BenchSmtpHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+
+# +
+# function: bench_frame()
+# -
+def bench_frame(_file: str = '', _size: int = DEF_SIZE, _oid: str = '', _target: str = '') -> None:
+    """ writes a sparse Mont4k frame of _size bytes with ARTNOID, TARGET and OBJECT header card(s) """
+    _cards = [bench_card('SIMPLE', True), bench_card('BITPIX', 16), bench_card('NAXIS', 0),
+              bench_card('ARTNOID', _oid), bench_card('TARGET', _target), bench_card('OBJECT', _target),
+              f'{"END":<{DNA_FITS_CARD}}'.encode('ascii')]
+    _hdr = b''.join(_cards)
+    _hdr += b' ' * (-len(_hdr) % DNA_FITS_BLOCK)
+    with open(_file, 'wb') as _fw:
+        _fw.write(_hdr)
+        _fw.truncate(max(_size, len(_hdr)))
+
+
+# +
+# function: bench_night()
+# -
+def bench_night(_root: str = '', _iso: int = BENCH_ISO, _frames: int = 0, _mix: dict = None, _per_oid: int = 0,
+                _size: int = DEF_SIZE) -> tuple:
+    """ writes a night of _frames split by _mix and returns (night directory, {oid: target}) """
+    _night = os.path.join(_root, 'Kuiper', 'Mont4k', f'{_iso}')
+    _weights = sum(_mix.values())
+    _counts = {_t: _frames * _w // _weights for _t, _w in _mix.items()}
+    _counts['object'] = _counts.get('object', 0) + _frames - sum(_counts.values())
+    _oids = {}
+    for _typ, _n in _counts.items():
+        os.makedirs(os.path.join(_night, _typ), exist_ok=True)
+        for _i in range(_n):
+            _file = os.path.join(_night, _typ, f'{_typ}{_i:05d}.fits')
+            if _typ == 'object':
+                _oid = f'{_iso:08d}{_i // _per_oid:024x}'
+                _oids[_oid] = f'M{_i // _per_oid + 1}'
+                bench_frame(_file, _size, _oid, _oids[_oid])
+            else:
+                bench_frame(_file, _size, '', _typ)
+    return _night, _oids
+
+
+# +
+# function: bench_seed()
+# -
+def bench_seed(_url: str = '', _oids: dict = None, _users: int = DEF_USERS, _rts2: int = 0) -> None:
+    """ seeds (completed) ObsReq2 row(s) for _oids and their User owner(s) into the stand-in database """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from src.models.Models import Base, ObsReq2, User
+    _engine = create_engine(_url)
+    Base.metadata.create_all(_engine)
+    _s = sessionmaker(bind=_engine)()
+    for _u in range(_users):
+        if _s.query(User).filter(User.username == f'bench{_u}').first() is None:
+            _s.add(User(id=900000 + _u, username=f'bench{_u}', email=f'bench{_u}@example.com'))
+    for _i, (_oid, _target) in enumerate(sorted(_oids.items())):
+        _s.add(ObsReq2(username=f'bench{_i % _users}', user_id=900000 + _i % _users, observation_id=_oid,
+                       percent_completed=100.0, completed=False, rts2_id=_rts2 + _i, object_name=_target,
+                       telescope='Kuiper', instrument='Mont4k', ra_hms='13:29:52.7', dec_dms='+47:11:43',
+                       num_exp=DEF_PER_OID, exp_time=30.0, filter_name='V', airmass=1.1))
+    _s.commit()
+    _s.close()
+    _engine.dispose()
+
+
+# +
+# function: bench_metrics()
+# -
+def bench_metrics(_jsonl: str = '', _job: str = 'dna') -> dict:
+    """ returns the last run of _job in the metrics history """
+    _last = {}
+    with open(_jsonl, 'r') as _fr:
+        for _line in _fr:
+            _r = json.loads(_line)
+            if _r.get('job', '') == _job:
+                _last = _r
+    return _last
+
+
+# +
+# function: bench()
+# -
+def bench(_frames: str = DEF_FRAMES, _mix: str = DEF_MIX, _per_oid: int = DEF_PER_OID, _users: int = DEF_USERS,
+          _size: int = DEF_SIZE, _log: bool = False, _postgres: bool = False, _kuiper: bool = False,
+          _stream: bool = False, _authorization: str = DB_AUTHORIZATION, _server: str = DB_HOST, _database: str = DB_NAME,
+          _port: int = DB_PORT) -> None:
+    """ runs dna() (and dna_kuiper()) end-to-end over synthetic night(s) against local database and SMTP stand-ins """
+
+    _sizes = [int(_n) for _n in f'{_frames}'.split(',') if _n.strip() != '']
+    _mix = {_k.strip(): int(_v) for _k, _v in (_m.split(':') for _m in f'{_mix}'.split(',') if ':' in _m)}
+    if _postgres and _database == DB_NAME:
+        raise Exception(f'refusing to seed the {DB_NAME} database, use a scratch one (-d <name>)')
+    if _kuiper and not _postgres:
+        raise Exception(f'dna_kuiper() only talks to Postgres, use --postgres too')
+
+    _smtp = BenchSmtp()
+    threading.Thread(target=_smtp.serve_forever, daemon=True).start()
+    with tempfile.TemporaryDirectory() as _tmp:
+
+        # stand-in(s) are set up through the environment, before dna and friends read it at import
+        _user, _pass = f'{_authorization}:'.split(':')[:2]
+        _url = f'postgresql+psycopg2://{_user}:{_pass}@{_server}:{_port}/{_database}' if _postgres else \
+            f"sqlite:///{os.path.join(_tmp, 'orp.sqlite')}"
+        _logs, _files = os.path.join(_tmp, 'logs'), os.path.join(_tmp, 'files')
+        os.makedirs(_logs)
+        os.makedirs(_files)
+        os.environ.update({'DNA_DB_URL': _url, 'DNA_LOGS': _logs, 'DNA_METRICS_TEXTFILE': '',
+                           'DNA_METRICS_JSONL': os.path.join(_logs, 'dna.metrics.jsonl'),
+                           'MAIL_SERVER': 'localhost', 'MAIL_PORT': f'{_smtp.server_address[1]}',
+                           'MAIL_USE_TLS': 'false', 'MAIL_USERNAME': '', 'DNA_MAIL_RATE': '0'})
+        if _stream:
+            os.environ['DNA_STREAM_URL'] = BENCH_STREAM_URL
+        import logging
+        import dna
+        dna.DNA_TGZ_DIR = _files
+        if not _log:
+            dna.dna_logger().setLevel(logging.WARNING)
+        if _kuiper:
+            import dna_kuiper
+            dna_kuiper.DNA_TGZ_DIR, dna_kuiper.DB_NAME, dna_kuiper.DB_HOST, dna_kuiper.DB_PORT = \
+                _files, _database, _server, _port
+            if not _log:
+                dna_kuiper.dna_log.setLevel(logging.WARNING)
+
+        _rows = []
+        for _r, _n in enumerate(_sizes):
+            _iso = BENCH_ISO + _r
+            _t0 = time.perf_counter()
+            _night, _oids = bench_night(os.path.join(_tmp, 'rts2data'), _iso, _n, _mix, _per_oid, _size)
+            bench_seed(_url, _oids, _users, _iso * 100000)
+            _setup = time.perf_counter() - _t0
+            _jobs = [('dna', lambda: dna.dna(_night, 'Mont4k', f'{_iso}', os.path.join(_night, '.dna.json'),
+                                             _dna_tel='Kuiper', _gmail=True, _cache='none', _stream=_stream))]
+            if _kuiper:
+                _jobs.append(('dna_kuiper', lambda: dna_kuiper.dna_kuiper(_night, _iso, _authorization, True,
+                                                                          _cache='none')))
+            for _job, _func in _jobs:
+                if _job == 'dna':
+                    open(os.path.join(_night, '.dna.json'), 'w').close()
+                _m0 = _smtp.messages
+                _func()
+                _m = bench_metrics(os.environ['DNA_METRICS_JSONL'], _job)
+                _t = {_k: sum(_m.get('timers', {}).get(_s, {}).get('seconds', 0.0) for _s in _v)
+                      for _k, _v in BENCH_STAGES}
+                _c = _m.get('counters', {})
+                _rows.append((_job, _n, _setup, _t, _m.get('wall', 0.0), len(_oids),
+                              sum(_v for _k, _v in _c.items() if _k.startswith('archives_') and _k != 'archives_failed'),
+                              _c.get('archive_bytes_in', 0), _smtp.messages - _m0))
+
+            # --stream must link every calibration type of the night given as --data, as DNA.sh does
+            if _stream:
+                _links = dna.dna_stream_tgzs({'dir': _night, 'file': os.path.join(_night, '.dna.json'),
+                                              'tel': 'Kuiper', 'ins': 'Mont4k', 'iso': f'{_iso}'})
+                _missing = sorted(_t for _t in _mix if _t in dna.DNA_TGZ_TYPES and _t not in _links)
+                if _missing:
+                    raise Exception(f'--stream linked {sorted(_links)} but not {_missing} for --data={_night}')
+    _smtp.shutdown()
+
+    # report
+    print(f"synthetic night(s): mix={_mix}, {_per_oid} frame(s) per OID, {_size} bytes per frame, "
+          f"{'postgres' if _postgres else 'sqlite'} database, SMTP sink on port {_smtp.server_address[1]}"
+          f"{', on-demand (--stream) archives' if _stream else ''}")
+    print(f"{'job':<11} {'frames':>7} {'setup':>8} " + ' '.join(f'{_k:>8}' for _k, _ in BENCH_STAGES) +
+          f" {'wall':>8} {'oids':>6} {'archives':>8} {'MB in':>9} {'gmails':>7} {'ms/frame':>9}")
+    for _job, _n, _setup, _t, _wall, _noids, _narchives, _bytes, _gmails in _rows:
+        print(f'{_job:<11} {_n:>7} {_setup:>8.2f} ' + ' '.join(f'{_t[_k]:>8.2f}' for _k, _ in BENCH_STAGES) +
+              f' {_wall:>8.2f} {_noids:>6} {_narchives:>8} {_bytes / 1048576.0:>9.1f} {_gmails:>7} '
+              f'{_wall * 1000.0 / max(_n, 1):>9.3f}')
+    print(f'(seconds; setup is writing the frames and seeding the database, not part of the run)')
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark dna() end-to-end over synthetic night(s)',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--frames', default=DEF_FRAMES, help=f"""Comma separated frames per night <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--mix', default=DEF_MIX, help=f"""Observation type weights <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--per-oid', default=DEF_PER_OID, help=f"""Object frames per OID <int>, defaults to %(default)s""")
+    _p.add_argument(f'--users', default=DEF_USERS, help=f"""Owners of the OIDs <int>, defaults to %(default)s""")
+    _p.add_argument(f'--size', default=DEF_SIZE,
+                    help=f"""Bytes per (sparse) frame <int>, defaults to %(default)s, 14904000 for full Mont4k frames""")
+    _p.add_argument(f'--log', default=False, action='store_true', help=f'if present, keep dna logging (at DEBUG)')
+    _p.add_argument(f'--postgres', default=False, action='store_true',
+                    help=f'if present, seed tables in a scratch Postgres database instead of SQLite')
+    _p.add_argument(f'--kuiper', default=False, action='store_true',
+                    help=f'if present (with --postgres), also run dna_kuiper() over each night')
+    _p.add_argument(f'--stream', default=False, action='store_true',
+                    help=f'if present, link on-demand archives (and check the calibration links) instead of building')
+    _p.add_argument(f'-a', f'--authorization', default=DB_AUTHORIZATION,
+                    help=f"""database authorization=<str>:<str>, defaults to '%(default)s'""")
+    _p.add_argument(f'-d', f'--database', default=DB_NAME,
+                    help=f"""scratch database name=<str> (not {DB_NAME}), defaults to '%(default)s'""")
+    _p.add_argument(f'-p', f'--port', default=DB_PORT, help=f"""database port=<int>, defaults to %(default)s""")
+    _p.add_argument(f'-s', f'--server', default=DB_HOST, help=f"""database server=<address>, defaults to '%(default)s'""")
+    _a = _p.parse_args()
+
+    # execute
+    bench(_frames=_a.frames, _mix=_a.mix, _per_oid=int(_a.per_oid), _users=int(_a.users), _size=int(_a.size),
+          _log=bool(_a.log), _postgres=bool(_a.postgres), _kuiper=bool(_a.kuiper), _stream=bool(_a.stream),
+          _authorization=_a.authorization, _server=_a.server, _database=_a.database, _port=int(_a.port))
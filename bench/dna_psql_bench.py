@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+import argparse
+import hashlib
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from PsqlConnection import psql_like_prefix, DB_AUTHORIZATION, DB_HOST, DB_NAME, DB_PORT
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_psql_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_REQUESTS = 100000
+DEF_USERS = 2000
+DEF_OIDS = 50
+DEF_REPEAT = 3
+
+BENCH_LIKE_PREFIX = "observation_id LIKE ? ESCAPE '\\'"
+
+
+# +
+# function: bench_oid()
+# -
+def bench_oid(_i: int = 0) -> str:
+    """ returns a 32 character hex OID (md5, as generated by Postgres below) """
+    return hashlib.md5(f'{_i}'.encode()).hexdigest()
+
+
+# +
+# function: bench_time()
+# -
+def bench_time(_repeat: int = DEF_REPEAT, _func=None) -> tuple:
+    """ returns (best time, rows) of _repeat calls of _func """
+    _best, _rows = None, []
+    for _ in range(_repeat):
+        _t0 = time.perf_counter()
+        _rows = _func()
+        _dt = time.perf_counter() - _t0
+        _best = _dt if _best is None else min(_best, _dt)
+    return _best, _rows
+
+
+# +
+# function: bench_sqlite()
+# -
+def bench_sqlite(_requests: int = DEF_REQUESTS, _users: int = DEF_USERS, _oids: list = None,
+                 _repeat: int = DEF_REPEAT) -> dict:
+    """ seeds an in-memory SQLite fixture and times the three lookups, before and after indexing """
+
+    _db = sqlite3.connect(':memory:')
+    _db.execute('PRAGMA case_sensitive_like=ON')
+    _db.execute('CREATE TABLE obsreq2 (id INTEGER PRIMARY KEY, observation_id TEXT, username TEXT)')
+    _db.execute('CREATE TABLE users (id INTEGER PRIMARY KEY, username TEXT, email TEXT)')
+    _db.executemany('INSERT INTO obsreq2 (observation_id, username) VALUES (?, ?)',
+                    ((bench_oid(_i), f'user{_i % _users}') for _i in range(_requests)))
+    _db.executemany('INSERT INTO users (username, email) VALUES (?, ?)',
+                    ((f'user{_i}', f'user{_i}@example.com') for _i in range(_users)))
+    _db.commit()
+
+    def _like():
+        return [_r for _k in _oids for _r in _db.execute(
+            "SELECT observation_id, username FROM obsreq2 WHERE observation_id LIKE ?", (f'%{_k}%',)).fetchall()]
+
+    def _exact():
+        return _db.execute(f"SELECT observation_id, username FROM obsreq2 WHERE observation_id IN "
+                           f"({', '.join('?' * len(_oids))})", _oids).fetchall()
+
+    def _prefix():
+        return _db.execute(f"SELECT observation_id, username FROM obsreq2 WHERE "
+                           f"{' OR '.join([BENCH_LIKE_PREFIX] * len(_oids))}",
+                           [psql_like_prefix(_k) for _k in _oids]).fetchall()
+
+    _results = {}
+    for _stage in ('no index', 'index'):
+        if _stage == 'index':
+            _db.execute('CREATE INDEX obsreq2_observation_id_idx ON obsreq2 (observation_id)')
+            _db.execute('CREATE INDEX users_username_idx ON users (username)')
+            _db.execute('ANALYZE')
+        for _name, _func in (("LIKE '%oid%' per OID", _like), ('= ANY (exact)', _exact),
+                             ("LIKE 'oid%' (prefix)", _prefix)):
+            _results[(_stage, _name)] = bench_time(_repeat, _func)
+    _db.close()
+    return _results
+
+
+# +
+# function: bench_postgres()
+# -
+def bench_postgres(_requests: int = DEF_REQUESTS, _users: int = DEF_USERS, _oids: list = None,
+                   _repeat: int = DEF_REPEAT, _authorization: str = DB_AUTHORIZATION, _server: str = DB_HOST,
+                   _database: str = DB_NAME, _port: int = DB_PORT) -> dict:
+    """ seeds TEMPORARY ObsReq2/Users tables (they shadow the real ones in this session only) and times lookups """
+
+    from PsqlConnection import PsqlConnection
+    _db = PsqlConnection(database=_database, authorization=_authorization, server=_server, port=_port)
+    _db.connect()
+    for _cmd in ('CREATE TEMPORARY TABLE ObsReq2 (id serial PRIMARY KEY, observation_id text, username text);',
+                 'CREATE TEMPORARY TABLE Users (id serial PRIMARY KEY, username text, email text);',
+                 f"INSERT INTO ObsReq2 (observation_id, username) SELECT md5(_i::text), 'user' || (_i % {_users}) "
+                 f"FROM generate_series(0, {_requests - 1}) AS _i;",
+                 f"INSERT INTO Users (username, email) SELECT 'user' || _i, 'user' || _i || '@example.com' "
+                 f"FROM generate_series(0, {_users - 1}) AS _i;",
+                 'ANALYZE ObsReq2;', 'ANALYZE Users;'):
+        if not _db.execute(_cmd):
+            raise Exception(f'failed to seed fixture, command={_cmd}')
+
+    def _like():
+        return [_r for _k in _oids for _r in _db.fetchall(
+            "SELECT observation_id, username FROM ObsReq2 WHERE observation_id LIKE %s;", (f'%{_k}%',))]
+
+    _results = {}
+    for _stage in ('no index', 'index'):
+        if _stage == 'index':
+            _db.create_indexes()
+        for _name, _func in (("LIKE '%oid%' per OID", _like),
+                             ('= ANY (exact)', lambda: _db.obsreqs(_oids)),
+                             ("LIKE 'oid%' (prefix)", lambda: _db.obsreqs(_oids, prefix=True))):
+            _results[(_stage, _name)] = bench_time(_repeat, _func)
+    _db.disconnect()
+    return _results
+
+
+# +
+# function: bench()
+# -
+def bench(_requests: int = DEF_REQUESTS, _users: int = DEF_USERS, _noids: int = DEF_OIDS, _repeat: int = DEF_REPEAT,
+          _postgres: bool = False, _authorization: str = DB_AUTHORIZATION, _server: str = DB_HOST,
+          _database: str = DB_NAME, _port: int = DB_PORT) -> None:
+    """ compare leading-wildcard, exact and prefix OID lookups with and without the supporting index """
+
+    _oids = [bench_oid(_i) for _i in random.Random(0).sample(range(_requests), min(_noids, _requests))]
+    if _postgres:
+        _results = bench_postgres(_requests, _users, _oids, _repeat, _authorization, _server, _database, _port)
+    else:
+        _results = bench_sqlite(_requests, _users, _oids, _repeat)
+
+    print(f"{_requests} requests, {len(_oids)} OIDs per night, {'postgres' if _postgres else 'sqlite'}, "
+          f"best of {_repeat}")
+    print(f"{'stage':>10} {'lookup':>24} {'rows':>6} {'ms':>10}")
+    for (_stage, _name), (_t, _rows) in _results.items():
+        print(f'{_stage:>10} {_name:>24} {len(_rows):>6} {_t * 1000.0:>10.2f}')
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark ObsReq2 OID lookups',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--requests', default=DEF_REQUESTS, help=f"""requests in ObsReq2 <int>, defaults to %(default)s""")
+    _p.add_argument(f'--users', default=DEF_USERS, help=f"""users <int>, defaults to %(default)s""")
+    _p.add_argument(f'--oids', default=DEF_OIDS, help=f"""OIDs looked up per night <int>, defaults to %(default)s""")
+    _p.add_argument(f'--repeat', default=DEF_REPEAT, help=f"""repeats <int>, defaults to %(default)s""")
+    _p.add_argument(f'--postgres', default=False, action='store_true',
+                    help=f'if present, use temporary tables on a Postgres server instead of SQLite')
+    _p.add_argument(f'-a', f'--authorization', default=DB_AUTHORIZATION,
+                    help=f"""database authorization=<str>:<str>, defaults to '%(default)s'""")
+    _p.add_argument(f'-d', f'--database', default=DB_NAME, help=f"""database name=<str>, defaults to '%(default)s'""")
+    _p.add_argument(f'-p', f'--port', default=DB_PORT, help=f"""database port=<int>, defaults to %(default)s""")
+    _p.add_argument(f'-s', f'--server', default=DB_HOST, help=f"""database server=<address>, defaults to '%(default)s'""")
+    _a = _p.parse_args()
+
+    # execute
+    bench(_requests=int(_a.requests), _users=int(_a.users), _noids=int(_a.oids), _repeat=int(_a.repeat),
+          _postgres=bool(_a.postgres), _authorization=_a.authorization, _server=_a.server, _database=_a.database,
+          _port=int(_a.port))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from datetime import datetime
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dna_ledger import DnaLedger
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_startup_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_FRAMES = 500
+DEF_RUNS = 10
+DEF_TOP = 15
+DNA_SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src'))
+DNA_HEAVY = ('sqlalchemy', 'src.models.Models', 'astropy', 'smtplib', 'ssl', 'http.server', 'colorlog')
+
+
+# +
+# function: bench_importtime()
+# -
+def bench_importtime(_args: list = None, _env: dict = None) -> dict:
+    """ runs python -X importtime <_args> and returns {module: (self us, cumulative us, level)} """
+    _p = subprocess.run([sys.executable, '-X', 'importtime'] + list(_args or []), env=_env, cwd=DNA_SRC,
+                        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    _modules = {}
+    for _line in _p.stderr.splitlines():
+        if not _line.startswith('import time:') or 'self [us]' in _line:
+            continue
+        _self, _cumulative, _name = [_f for _f in _line[len('import time:'):].split('|')]
+        _level = (len(_name) - len(_name.lstrip())) // 2
+        _modules.setdefault(_name.strip(), (int(_self), int(_cumulative), _level))
+    return _modules
+
+
+# +
+# function: bench_wall()
+# -
+def bench_wall(_args: list = None, _env: dict = None, _runs: int = DEF_RUNS) -> list:
+    """ returns the wall-clock seconds of _runs runs of python <_args> """
+    _times = []
+    for _ in range(_runs):
+        _t0 = time.perf_counter()
+        subprocess.run([sys.executable] + list(_args or []), env=_env, cwd=DNA_SRC,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _times.append(time.perf_counter() - _t0)
+    return _times
+
+
+# +
+# function: bench_night()
+# -
+def bench_night(_tmp: str = '', _frames: int = DEF_FRAMES) -> list:
+    """ creates a night of _frames (already in the ledger) and returns the dna.py argument(s) to process it """
+    _night = os.path.join(_tmp, 'Kuiper', 'Mont4k', '20200414')
+    _dir, _json = os.path.join(_night, 'object'), os.path.join(_night, '.dna.json')
+    os.makedirs(_dir, exist_ok=True)
+    _ledger = DnaLedger(_json)
+    for _i in range(_frames):
+        _file = os.path.join(_dir, f'frame{_i:05d}.fits')
+        with open(_file, 'wb') as _fw:
+            _fw.write(b' ' * 2880)
+        _ledger.add({'file': _file, 'user': 'artn', 'email': 'artn@example.com', 'oid': f'{_i // 10:032x}',
+                     'tgt': 'M51', 'size': 2880, 'mtime': os.stat(_file).st_mtime,
+                     'timestamp': f'{datetime.now().isoformat()}'})
+    _ledger.save()
+    return ['dna.py', f'--data={_dir}', f'--json={_json}', '--iso=20200414', '--telescope=Kuiper',
+            '--instrument=Mont4k', '--cache=none']
+
+
+# +
+# function: bench()
+# -
+def bench(_frames: int = DEF_FRAMES, _runs: int = DEF_RUNS, _top: int = DEF_TOP) -> None:
+    """ reports import time(s) of dna.py and wall-clock of --help and of a night with no new frames """
+
+    with tempfile.TemporaryDirectory() as _tmp:
+        _env = {**os.environ, 'DNA_LOGS': _tmp}
+        _night = bench_night(_tmp, _frames)
+
+        # import profile
+        _modules = bench_importtime(['-c', 'import dna'], _env)
+        _total = _modules.get('dna', (0, 0, 0))[1]
+        print(f"{'import dna':<40} {'self (ms)':>10} {'cumulative (ms)':>16}")
+        for _name, (_self, _cumulative, _) in sorted(
+                [(_k, _v) for _k, _v in _modules.items() if _v[2] <= 1 and _k != 'dna'],
+                key=lambda _x: -_x[1][1])[:_top]:
+            print(f'{_name:<40} {_self / 1000.0:>10.2f} {_cumulative / 1000.0:>16.2f}')
+        print(f"{'total':<40} {'':>10} {_total / 1000.0:>16.2f}")
+
+        # heavy module(s) loaded by each path
+        print()
+        print(f"{'path':<24} " + ' '.join(f'{_h:>17}' for _h in DNA_HEAVY))
+        for _label, _args in (('import dna', ['-c', 'import dna']), ('dna.py --help', ['dna.py', '--help']),
+                              (f'no new frames', _night)):
+            _loaded = bench_importtime(_args, _env)
+            print(f'{_label:<24} ' + ' '.join(f"{'loaded' if _h in _loaded else '-':>17}" for _h in DNA_HEAVY))
+
+        # wall-clock
+        print()
+        print(f"{'wall-clock':<24} {'runs':>6} {'min (ms)':>10} {'median (ms)':>12}")
+        for _label, _args in (('python -c pass', ['-c', 'pass']), ('dna.py --help', ['dna.py', '--help']),
+                              (f'no new frames ({_frames})', _night)):
+            _times = bench_wall(_args, _env, _runs)
+            print(f'{_label:<24} {_runs:>6} {min(_times) * 1000.0:>10.2f} {statistics.median(_times) * 1000.0:>12.2f}')
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark dna.py start-up (imports, --help, a night with no new frames)',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--frames', default=DEF_FRAMES, help=f"""frames in the night <int>, defaults to %(default)s""")
+    _p.add_argument(f'--runs', default=DEF_RUNS, help=f"""runs per wall-clock timing <int>, defaults to %(default)s""")
+    _p.add_argument(f'--top', default=DEF_TOP, help=f"""imports to report <int>, defaults to %(default)s""")
+    _a = _p.parse_args()
+
+    # execute
+    bench(_frames=int(_a.frames), _runs=int(_a.runs), _top=int(_a.top))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+import argparse
+import glob
+import os
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+
+from dna_fits import DNA_FITS_BLOCK
+from dna_tgz import dna_tgz_build, dna_tgz_codec, dna_tgz_name, DNA_TGZ_MANIFEST
+
+
+# +
+# doc string
+# -
+__doc__ = """python3 dna_tgz_bench.py --help"""
+
+
+# +
+# constant(s)
+# -
+DEF_CODECS = 'tarfile,tar,gz:1,gz:6,gz:9,xz:0,xz:6,zstd:3,zstd:19'
+DEF_FILES = 4
+DEF_SIZE = 14904000
+DEF_SKY = 896
+DEF_NOISE = 6
+
+
+# +
+# function: bench_frame()
+# -
+def bench_frame(_file: str = '', _size: int = DEF_SIZE) -> None:
+    """ writes a Mont4k sized 16-bit frame of sky plus read noise (roughly the entropy of a real dark or flat) """
+    _hdr = f'{"SIMPLE  =                    T":<80}{"BITPIX  =                   16":<80}{"END":<80}'.encode('ascii')
+    _hdr += b' ' * (-len(_hdr) % DNA_FITS_BLOCK)
+    _noise = bytes((DEF_SKY + (_b & ((1 << DEF_NOISE) - 1))) & 0xff for _b in range(256))
+    with open(_file, 'wb') as _fw:
+        _fw.write(_hdr)
+        _left = (_size - len(_hdr)) // 2
+        while _left > 0:
+            _n = min(_left, 1048576)
+            _chunk = bytearray(2 * _n)
+            _chunk[0::2] = bytes([DEF_SKY >> 8]) * _n
+            _chunk[1::2] = os.urandom(_n).translate(_noise)
+            _left -= _fw.write(_chunk) // 2
+        _fw.write(b'\0' * (_size - _fw.tell()))
+
+
+# +
+# function: bench_tarfile()
+# -
+def bench_tarfile(_tar: str = '', _frames: list = None) -> dict:
+    """ builds an uncompressed archive with tarfile.add() (the pre-zero-copy path) for comparison """
+    _t0 = time.monotonic()
+    with tarfile.open(_tar, mode='w') as _wf:
+        for _f in _frames:
+            _wf.add(_f)
+    return {'bytes': sum(os.path.getsize(_f) for _f in _frames), 'size': os.path.getsize(_tar),
+            'seconds': time.monotonic() - _t0, 'publish': 0.0, 'error': ''}
+
+
+# +
+# function: bench()
+# -
+def bench(_dir: str = '', _codecs: str = DEF_CODECS, _files: int = DEF_FILES, _size: int = DEF_SIZE) -> None:
+    """ reports throughput and ratio of each codec over a directory of Mont4k frames, where write is the time to
+        produce the archive and publish the time to fsync, verify and rename it (which tarfile does not do) """
+
+    with tempfile.TemporaryDirectory() as _tmp:
+        if _dir.strip() != '':
+            _frames = sorted(glob.glob(os.path.join(os.path.abspath(os.path.expanduser(_dir)), '*.fits')))[:_files]
+        else:
+            _frames = [os.path.join(_tmp, f'frame_{_i:04d}.fits') for _i in range(_files)]
+            for _f in _frames:
+                bench_frame(_f, _size)
+        if not _frames:
+            print(f'no frames found in {_dir}')
+            return
+        _mb = sum(os.path.getsize(_f) for _f in _frames) / 1048576.0
+        print(f"{len(_frames)} frame(s), {_mb:.1f} MB, {_dir if _dir.strip() != '' else 'synthetic'}")
+        print(f"{'codec':>10} {'MB':>10} {'ratio':>8} {'write (s)':>10} {'MB/s':>10} {'publish (s)':>12}")
+
+        for _codec in [_c.strip() for _c in _codecs.split(',') if _c.strip() != '']:
+            try:
+                dna_tgz_codec('tar' if _codec == 'tarfile' else _codec)
+            except ValueError as _e:
+                print(f'{_codec:>10} skipped, {_e}')
+                continue
+            _tgz = dna_tgz_name(os.path.join(_tmp, 'bench.tgz'), 'tar' if _codec == 'tarfile' else _codec)
+            _r = bench_tarfile(_tgz, _frames) if _codec == 'tarfile' else dna_tgz_build(_tgz, _frames, _codec)
+            if _r['error'] != '':
+                print(f"{_codec:>10} failed, {_r['error']}")
+            else:
+                _out, _sec = _r['size'] / 1048576.0, _r['seconds'] - _r['publish']
+                print(f"{_codec:>10} {_out:>10.1f} {_r['size'] / max(_r['bytes'], 1):>8.3f} "
+                      f"{_sec:>10.2f} {_mb / max(_sec, 1.0e-6):>10.1f} {_r['publish']:>12.2f}")
+            for _f in (_tgz, f'{_tgz}{DNA_TGZ_MANIFEST}'):
+                if os.path.exists(_f):
+                    os.remove(_f)
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'Benchmark archive codecs on Mont4k frames',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--dir', default='', help=f"""Directory of .fits frames <str>, defaults to synthetic frames""")
+    _p.add_argument(f'--codecs', default=DEF_CODECS,
+                    help=f"""Comma separated codec(s) <str>[:<level>] ('tarfile' is tarfile.add() without
+compression, for comparison with 'tar'), defaults to '%(default)s'""")
+    _p.add_argument(f'--files', default=DEF_FILES, help=f"""frames <int>, defaults to %(default)s""")
+    _p.add_argument(f'--size', default=DEF_SIZE, help=f"""synthetic frame size <int>, defaults to %(default)s""")
+    _a = _p.parse_args()
+
+    # execute
+    bench(_dir=_a.dir, _codecs=_a.codecs, _files=int(_a.files), _size=int(_a.size))
@@ -25,8 +25,13 @@ def_dna_tel="Kuiper"
 def_dna_home="/var/www/ARTN-DNA"
 def_orp_home="/var/www/ARTN-ORP"
 
+all=0
+daemon=0
 dry_run=0
+incremental=0
+journal=0
 over_ride=0
+profile=0
 send_gmail=0
 
 
@@ -75,7 +80,7 @@ usage () {
   write_blue   "DNA Control"                                                                                                                    2>&1
   write_blue   ""                                                                                                                               2>&1
   write_green  "Use:"                                                                                                                           2>&1
-  write_green  "  %% bash $0 --ins=<str> --iso=<int> --json=<str> --tel=<str> --dna=<str> --orp=<str> [--dry-run] [--over-ride] [--send-gmail]" 2>&1
+  write_green  "  %% bash $0 --ins=<str> --iso=<int> --json=<str> --tel=<str> --dna=<str> --orp=<str> [--all] [--daemon] [--dry-run] [--incremental] [--journal] [--over-ride] [--profile] [--send-gmail]" 2>&1
   write_green  ""                                                                                                                               2>&1
   write_yellow "Input(s):"                                                                                                                      2>&1
   write_yellow "  --ins=<str>,  where <str> is the instrument name,  default=${def_dna_ins}, (choices:${_all_ins})"                             2>&1
@@ -86,8 +91,13 @@ usage () {
   write_yellow "  --orp=<str>,  where <str> is ORP code directory,   default=${def_orp_home}"                                                   2>&1
   write_yellow ""                                                                                                                               2>&1
   write_cyan   "Flag(s):"                                                                                                                       2>&1
+  write_cyan   "  --all,        all telescopes in one process,       default=false"                                                             2>&1
+  write_cyan   "  --daemon,     watch data directory (inotify),      default=false"                                                             2>&1
   write_cyan   "  --dry-run,    show (but do not execute) commands,  default=false"                                                             2>&1
+  write_cyan   "  --incremental, only scan new or changed files,     default=false"                                                             2>&1
+  write_cyan   "  --journal,    append to json log file,             default=false"                                                             2>&1
   write_cyan   "  --over-ride,  replace existing json log file,      default=false"                                                             2>&1
+  write_cyan   "  --profile,    profile the run (logs/*.prof),       default=false"                                                             2>&1
   write_cyan   "  --send-gmail, send gmail to data owners,           default=false"                                                             2>&1
   write_cyan   ""                                                                                                                               2>&1
 }
@@ -126,6 +136,22 @@ while test $# -gt 0; do
       dry_run=1
       shift
       ;;
+    --all)
+      all=1
+      shift
+      ;;
+    --daemon)
+      daemon=1
+      shift
+      ;;
+    --incremental)
+      incremental=1
+      shift
+      ;;
+    --journal)
+      journal=1
+      shift
+      ;;
     --gmail|--send-gmail)
       send_gmail=1
       shift
@@ -134,6 +160,10 @@ while test $# -gt 0; do
       over_ride=1
       shift
       ;;
+    --profile)
+      profile=1
+      shift
+      ;;
     --help*|*)
       usage
       exit 0
@@ -158,7 +188,7 @@ done
 [[ ! -d ${orp_home} ]] && write_red "<ERROR> directory (${orp_home}) is invalid!" && exit 0
 
 data_dir=$(echo "/rts2data/${dna_tel}/${dna_ins}/${dna_iso}")
-[[ ! -d ${data_dir} ]] && write_red "<ERROR> directory (${data_dir}) is invalid!" && exit 0
+[[ ${all} -eq 0 ]] && [[ ! -d ${data_dir} ]] && write_red "<ERROR> directory (${data_dir}) is invalid!" && exit 0
 
 
 # set up
@@ -169,15 +199,45 @@ source ${dna_home}/etc/DNA.sh  ${dna_home}
 export PYTHONPATH=${dna_home}/src:${dna_home}:${PYTHONPATH}
 
 
+# +
+# execute (all telescope(s) and instrument(s) in one process)
+# -
+if [[ ${all} -eq 1 ]]; then
+  all_args="--iso=${dna_iso} --json=${dna_json}"
+  [[ ${send_gmail} -eq 1 ]] && all_args="${all_args} --gmail"
+  [[ ${incremental} -eq 1 ]] && all_args="${all_args} --incremental"
+  [[ ${journal} -eq 1 ]] && all_args="${all_args} --journal"
+  if [[ ${dry_run} -eq 1 ]]; then
+    write_yellow "Dry-Run> python3 ${dna_home}/src/dna_all.py ${all_args} >> ${dna_home}/logs/dna.${dna_iso}.log"
+  else
+    write_green "`date`> python3 ${dna_home}/src/dna_all.py ${all_args} >> ${dna_home}/logs/dna.${dna_iso}.log"
+    python3 ${dna_home}/src/dna_all.py ${all_args} >> ${dna_home}/logs/dna.${dna_iso}.log && chown -R www-data:www-data ${dna_home}
+  fi
+  exit 0
+fi
+
+
 # +
 # execute
 # -
-write_blue "%% bash $0 --ins=${dna_ins} --iso=${dna_iso} --json=${dna_json} --tel=${dna_tel} --dna=${dna_home} --orp=${orp_home} --dry-run=${dry_run} --over-ride=${over_ride} --send-gmail=${send_gmail}"
+write_blue "%% bash $0 --ins=${dna_ins} --iso=${dna_iso} --json=${dna_json} --tel=${dna_tel} --dna=${dna_home} --orp=${orp_home} --daemon=${daemon} --dry-run=${dry_run} --incremental=${incremental} --journal=${journal} --over-ride=${over_ride} --profile=${profile} --send-gmail=${send_gmail}"
 
 cli_args="--data=${data_dir} --json=${data_dir}/${dna_json} --iso=${dna_iso} --telescope=${dna_tel} --instrument=${dna_ins}"
 if [[ ${send_gmail} -eq 1 ]]; then
   cli_args="${cli_args} --gmail"
 fi
+if [[ ${daemon} -eq 1 ]]; then
+  cli_args="${cli_args} --daemon"
+fi
+if [[ ${incremental} -eq 1 ]]; then
+  cli_args="${cli_args} --incremental"
+fi
+if [[ ${journal} -eq 1 ]]; then
+  cli_args="${cli_args} --journal"
+fi
+if [[ ${profile} -eq 1 ]]; then
+  cli_args="${cli_args} --profile"
+fi
 
 if [[ ${dry_run} -eq 1 ]]; then
   if [[ ${over_ride} -eq 1 ]]; then
@@ -200,7 +260,18 @@ else
   chown artn-eng:users ${data_dir}/${dna_json}
 fi
 
-if [[ ${dry_run} -eq 1 ]]; then
+# the daemon runs until the next morning: set the json's time stamp and ownership before it starts, not after
+if [[ ${daemon} -eq 1 ]]; then
+  if [[ ${dry_run} -eq 1 ]]; then
+    write_yellow "Dry-Run> touch -t ${dna_iso}0000 ${data_dir}/${dna_json} && chown -R www-data:www-data ${dna_home}"
+    write_yellow "Dry-Run> python3 ${dna_home}/src/dna.py ${cli_args} >> ${dna_home}/logs/dna.${dna_iso}.log"
+  else
+    write_green "`date`> touch -t ${dna_iso}0000 ${data_dir}/${dna_json} && chown -R www-data:www-data ${dna_home}"
+    touch -t ${dna_iso}0000 ${data_dir}/${dna_json} && chown -R www-data:www-data ${dna_home}
+    write_green "`date`> python3 ${dna_home}/src/dna.py ${cli_args} >> ${dna_home}/logs/dna.${dna_iso}.log"
+    python3 ${dna_home}/src/dna.py ${cli_args} >> ${dna_home}/logs/dna.${dna_iso}.log
+  fi
+elif [[ ${dry_run} -eq 1 ]]; then
   write_yellow "Dry-Run> python3 ${dna_home}/src/dna.py ${cli_args} >> ${dna_home}/logs/dna.${dna_tel}.${dna_ins}.${dna_iso}.log 2&>1 && touch -t ${dna_iso}0000 ${data_dir}/${dna_json} && chown -R www-data:www-data ${dna_home}"
 else
   write_green "`date`> python3 ${dna_home}/src/dna.py ${cli_args} >> ${dna_home}/logs/dna.${dna_tel}.${dna_ins}.${dna_iso}.log 2&>1 && touch -t ${dna_iso}0000 ${data_dir}/${dna_json} && chown -R www-data:www-data ${dna_home}"
@@ -123,56 +123,20 @@ done
 [[ -z ${telescopes[${tgz_tel}]} ]]                && write_red "<ERROR> ${tgz_tel} not supported!" && exit 0
 
 
-# +
-# work function(s)
-# -
-_tar_files () {
-  # $1 = dry run, $2 = directory, $3 = type
-  _tel=$(echo ${2} | cut -d'/' -f3)
-  _ins=$(echo ${2} | cut -d'/' -f4)
-  _iso=$(echo ${2} | cut -d'/' -f5)
-  _typ=$(echo ${2} | cut -d'/' -f6)
-  if [[ ${1} -eq 1 ]]; then
-    if [[ -d ${2} ]]; then
-      _f=$(find ${2} -name "*.fits" -print)
-      if [[ ! -z ${_f} ]]; then
-        write_yellow "Dry-Run> rm -f /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz >> /dev/null 2>&1"
-        write_yellow "Dry-Run> tar -czpvf /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz ${2}/*.fits >> /dev/null 2>&1"
-        write_yellow "Dry-Run> chown www-data:www-data /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz"
-        write_yellow "Dry-Run> chmod 775 /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz"
-      fi
-    fi
-  else
-    if [[ -d ${2} ]]; then
-      _f=$(find ${2} -name "*.fits" -print)
-      if [[ ! -z ${_f} ]]; then
-        write_green "`date`> rm -f /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz >> /dev/null 2>&1"
-        rm -f /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz >> /dev/null 2>&1
-        write_green "`date`> tar -czpvf /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz ${2}/*.fits >> /dev/null 2>&1"
-        tar -czpvf /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz ${2}/*.fits >> /dev/null 2>&1
-        write_green "`date`> chown www-data:www-data /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz"
-        chown www-data:www-data /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz
-        write_green "`date`> chmod 775 /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz"
-        chmod 775 /var/www/ARTN-ORP/instance/files/${_tel}.${_ins}.${_iso}.${_typ}.tgz
-      fi
-    fi
-  fi
-}
-
-
 # +
 # execute
 # -
 write_blue "%% bash $0 --ins=${tgz_ins} --iso=${tgz_iso} --tel=${tgz_tel} --dry-run=${dry_run}"
 
-# create data directory(s)
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/bias
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/calibration
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/dark
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/flat
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/focus
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/skyflat
-_tar_files ${dry_run} /rts2data/${tgz_tel}/${tgz_ins}/${tgz_iso}/standard
+# create bias/calibration/dark/flat/focus/skyflat/standard archive(s) concurrently
+_tgz_cmd="python3 /var/www/ARTN-DNA/src/dna_tgz.py --tel=${tgz_tel} --ins=${tgz_ins} --iso=${tgz_iso} --data=/rts2data --dir=/var/www/ARTN-ORP/instance/files"
+if [[ ${dry_run} -eq 1 ]]; then
+  write_yellow "Dry-Run> ${_tgz_cmd}"
+  ${_tgz_cmd} --dry-run
+else
+  write_green "`date`> ${_tgz_cmd}"
+  ${_tgz_cmd}
+fi
 
 # fix code-base
 chown -R www-data:www-data /var/www/ARTN-DNA
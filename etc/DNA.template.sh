@@ -30,6 +30,31 @@ export MAIL_USE_SSL=1
 export MAIL_USERNAME="app_username"
 export MAIL_PASSWORD="app_password"
 
+# gmail(s) per batch and per second (0 for no limit) over one SMTP session
+export DNA_MAIL_BATCH=20
+export DNA_MAIL_RATE=1.0
+
+# gmail outbox retries and first backoff (seconds, doubled per attempt)
+export DNA_OUTBOX_RETRIES=8
+export DNA_OUTBOX_BACKOFF=60
+
+# run metrics: node-exporter textfile collector directory ('' for none), JSON-Lines history ('none' for none)
+export DNA_METRICS_TEXTFILE=""
+# export DNA_METRICS_JSONL=/var/www/ARTN-DNA/logs/dna.metrics.jsonl
+
+# ORP database as any SQLAlchemy URL, overriding DNA_DB_* (eg a stand-in for bench/dna_night_bench.py)
+# export DNA_DB_URL=""
+
+# archive codec(s): tar, gz[:0-9], xz[:0-9] or zstd[:1-22] (needs python zstandard)
+export DNA_TGZ_CALIBRATION=gz
+export DNA_TGZ_OBJECT=gz
+
+# re-read and re-hash every archive before publishing it, even when its sha256 was streamed while writing
+# export DNA_TGZ_VERIFY=true
+
+# public URL of src/dna_stream.py (on-demand archives, used by dna.py --stream)
+export DNA_STREAM_URL=""
+
 # +
 # PYTHONPATH
 # -
@@ -4,13 +4,23 @@
 # +
 # import(s)
 # -
+from psycopg2 import extensions
+from psycopg2 import sql
 from typing import Any
 
 import argparse
+import collections
+import contextlib
+import csv
+import itertools
+import json
 import pprint
 import psycopg2
 import os
+import re
 import sys
+import threading
+import time
 
 
 # +
@@ -24,8 +34,29 @@ DB_NAME = 'artn'
 DB_PORT = 5432
 
 DEF_COMMAND = "SELECT * FROM ObsReq2;"
-FETCH_METHOD = ['fetchall', 'fetchone', 'fetchmany', 'raw']
+FETCH_METHOD = ['fetchall', 'fetchone', 'fetchmany', 'raw', 'indexes']
 FETCH_MANY = 5
+EXPORT_FORMATS = ['csv', 'jsonl']
+
+# index(es) supporting lookup(): text_pattern_ops serves both '=' and prefix 'LIKE' in any locale
+PSQL_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+PSQL_INDEXES = {
+    'obsreq2_observation_id_pattern_idx': ('ObsReq2', 'observation_id'),
+    'users_username_pattern_idx': ('Users', 'username')
+}
+
+# pool(s): connections idle for PSQL_POOL_CHECK seconds are checked (SELECT 1) before re-use
+PSQL_POOL_CHECK = 30.0
+PSQL_POOL_IDLE = 300.0
+PSQL_POOL_MAX = 4
+PSQL_POOL_MIN = 1
+PSQL_POOL_TIMEOUT = 30.0
+PSQL_POOLS = {}
+PSQL_POOLS_LOCK = threading.Lock()
+
+# streaming: rows per round trip of a named (server-side) cursor
+PSQL_STREAM_SIZE = 2000
+PSQL_STREAM_IDS = itertools.count()
 
 
 # +
@@ -62,7 +93,7 @@ class PsqlConnection(object):
 
     @database.setter
     def database(self, database: str = DB_NAME):
-        self.__database = database if database.strip() == '' else DB_NAME
+        self.__database = database if (isinstance(database, str) and database.strip() != '') else DB_NAME
 
     @property
     def authorization(self):
@@ -79,7 +110,7 @@ class PsqlConnection(object):
 
     @server.setter
     def server(self, server: str = DB_HOST):
-        self.__server = server if server.strip() == '' else DB_HOST
+        self.__server = server if (isinstance(server, str) and server.strip() != '') else DB_HOST
 
     @property
     def port(self):
@@ -87,23 +118,22 @@ class PsqlConnection(object):
 
     @port.setter
     def port(self, port: int = DB_PORT):
-        self.__port = port if port > 0 else DB_PORT
+        self.__port = int(port) if (isinstance(port, int) and port > 0) else DB_PORT
 
     # +
     # method: connect()
     # -
-    def connect(self):
-        """ connect to database """
+    def connect(self, connection: Any = None):
+        """ connect to database (or use an already open connection, e.g. from a PsqlPool) """
 
         # set variable(s)
         self.__connection = None
         self.__cursor = None
-        self.__connection_string = f"host='{self.server}' dbname='{self.database}' " \
-            f"user='{self.__username}' password='{self.__password}'"
+        self.__connection_string = self.dsn()
 
         # get connection
         try:
-            self.__connection = psycopg2.connect(self.__connection_string)
+            self.__connection = connection if connection is not None else psycopg2.connect(self.__connection_string)
         except Exception as _e1:
             self.__connection = None
             print(f"failed to connect to {self.database} on {self.server}:{self.port} with '{self.authorization}', error='{_e1}'")
@@ -113,7 +143,34 @@ class PsqlConnection(object):
             self.__cursor = self.__connection.cursor()
         except Exception as _e2:
             self.__cursor = None
-            print(f"failed to get cursor for {self.database} on {self.server}:{self.port} with '{self.authorization}', error='{_e1}'")
+            print(f"failed to get cursor for {self.database} on {self.server}:{self.port} with '{self.authorization}', error='{_e2}'")
+
+    # +
+    # method: dsn()
+    # -
+    def dsn(self) -> str:
+        """ return the connection string """
+        return f"host='{self.server}' port={self.port} dbname='{self.database}' " \
+            f"user='{self.__username}' password='{self.__password}'"
+
+    # +
+    # method: release()
+    # -
+    def release(self) -> Any:
+        """ close the cursor and return the connection without closing it (e.g. to a PsqlPool) """
+
+        # disconnect cursor
+        if self.__cursor is not None:
+            try:
+                self.__cursor.close()
+            except Exception:
+                pass
+
+        # reset variable(s)
+        _connection = self.__connection
+        self.__connection = None
+        self.__cursor = None
+        return _connection
 
     # +
     # method: disconnect()
@@ -136,8 +193,8 @@ class PsqlConnection(object):
     # +
     # method: fetchall()
     # -
-    def fetchall(self, command: str = '') -> str:
-        """ execute fetchall() command """
+    def fetchall(self, command: str = '', params: Any = None) -> str:
+        """ execute fetchall() command (with optional query parameters) """
 
         # check input(s)
         if command.strip() == '' or self.__cursor is None:
@@ -145,7 +202,7 @@ class PsqlConnection(object):
 
         # execute query
         try:
-            self.__cursor.execute(command)
+            self.__cursor.execute(command, params)
             self.__results = self.__cursor.fetchall()
             return self.__results
         except Exception as _:
@@ -165,7 +222,7 @@ class PsqlConnection(object):
         # execute query
         try:
             self.__cursor.execute(command)
-            self.__results = self.__cursor.fetchall()
+            self.__results = self.__cursor.fetchmany(number)
             return self.__results
         except Exception as _:
             print(f"error in fetchmany(), error='{_}'")
@@ -210,6 +267,379 @@ class PsqlConnection(object):
             print(f"error in raw(), error='{_}'")
             return ''
 
+    # +
+    # method: stream()
+    # -
+    def stream(self, command: Any = '', params: Any = None, size: int = PSQL_STREAM_SIZE, header: bool = False):
+        """ yield rows (after the column names, if header) using a named server-side cursor, size rows at a time """
+
+        # check input(s)
+        if (isinstance(command, str) and command.strip() == '') or self.__connection is None:
+            return
+        size = size if (isinstance(size, int) and size > 0) else PSQL_STREAM_SIZE
+
+        # a named cursor keeps the result set on the server, only size rows are held here at any time; it needs a
+        # transaction, which is only ended (rolled back) here if this method began it, never the caller's own
+        _idle = self.__connection.get_transaction_status() == extensions.TRANSACTION_STATUS_IDLE
+        _cursor = self.__connection.cursor(name=f'psql_stream_{id(self):x}_{next(PSQL_STREAM_IDS)}')
+        _cursor.itersize = size
+        try:
+            _cursor.execute(command, params)
+            _rows = _cursor.fetchmany(size)
+            if header:
+                yield tuple(_d[0] for _d in (_cursor.description or []))
+            while _rows:
+                yield from _rows
+                _rows = _cursor.fetchmany(size)
+        finally:
+            try:
+                _cursor.close()
+                if _idle:
+                    self.__connection.rollback()
+            except Exception:
+                pass
+
+    # +
+    # method: export()
+    # -
+    def export(self, command: Any = '', stream: Any = None, fmt: str = EXPORT_FORMATS[0], params: Any = None,
+               size: int = PSQL_STREAM_SIZE) -> int:
+        """ write the result of command to stream as CSV or JSON-Lines in constant memory and return the row count """
+
+        # check input(s)
+        if fmt not in EXPORT_FORMATS or stream is None:
+            return 0
+
+        # write row(s)
+        _n, _rows = 0, self.stream(command, params, size, header=True)
+        _names = next(_rows, None)
+        if _names is None:
+            return 0
+        if fmt == 'csv':
+            _writer = csv.writer(stream)
+            _writer.writerow(_names)
+            for _row in _rows:
+                _writer.writerow(_row)
+                _n += 1
+        else:
+            for _row in _rows:
+                stream.write(json.dumps(dict(zip(_names, _row)), default=str) + '\n')
+                _n += 1
+        return _n
+
+    # +
+    # method: execute()
+    # -
+    def execute(self, command: Any = '', params: Any = None) -> bool:
+        """ execute (and commit) a command that returns no rows """
+
+        # check input(s)
+        if (isinstance(command, str) and command.strip() == '') or self.__cursor is None:
+            return False
+
+        # execute command
+        try:
+            self.__cursor.execute(command, params)
+            self.__connection.commit()
+            return True
+        except Exception as _:
+            print(f"error in execute(), error='{_}'")
+            self.__connection.rollback()
+            return False
+
+    # +
+    # method: lookup()
+    # -
+    def lookup(self, table: str = '', column: str = '', values: Any = None, columns: tuple = (),
+               prefix: bool = False) -> list:
+        """ execute an index friendly exact (= ANY) or prefix (LIKE 'value%') lookup of values in table.column """
+
+        # check input(s)
+        _values = sorted({f'{_v}' for _v in (values or []) if f'{_v}'.strip() != ''})
+        if not _values or self.__cursor is None or \
+                not all(PSQL_IDENTIFIER.match(f'{_n}') for _n in (table, column, *columns)):
+            return []
+
+        # build query (identifiers are validated and left unquoted so they fold to lower case as before)
+        _columns = sql.SQL(', ').join(sql.SQL(_c) for _c in columns) if columns else sql.SQL('*')
+        if prefix:
+            _where = sql.SQL(' OR ').join(sql.SQL('{} LIKE %s').format(sql.SQL(column)) for _ in _values)
+            _params = [psql_like_prefix(_v) for _v in _values]
+        else:
+            _where = sql.SQL('{} = ANY(%s)').format(sql.SQL(column))
+            _params = [_values]
+        _query = sql.SQL('SELECT {} FROM {} WHERE {};').format(_columns, sql.SQL(table), _where)
+
+        # execute query
+        try:
+            self.__cursor.execute(_query, _params)
+            self.__results = self.__cursor.fetchall()
+            return self.__results
+        except Exception as _:
+            print(f"error in lookup(), error='{_}'")
+            self.__connection.rollback()
+            return []
+
+    # +
+    # method: obsreqs()
+    # -
+    def obsreqs(self, oids: Any = None, columns: tuple = ('observation_id', 'username'), prefix: bool = False) -> list:
+        """ return ObsReq2 row(s) whose observation_id is (or starts with) one of oids """
+        return self.lookup('ObsReq2', 'observation_id', oids, columns, prefix)
+
+    # +
+    # method: users()
+    # -
+    def users(self, usernames: Any = None, columns: tuple = ('username', 'email')) -> list:
+        """ return Users row(s) for usernames """
+        return self.lookup('Users', 'username', usernames, columns)
+
+    # +
+    # method: create_indexes()
+    # -
+    def create_indexes(self) -> list:
+        """ create (if necessary) the index(es) used by lookup() and return their names """
+        _created = []
+        for _name, (_table, _column) in PSQL_INDEXES.items():
+            if self.execute(sql.SQL('CREATE INDEX IF NOT EXISTS {} ON {} ({} text_pattern_ops);').format(
+                    sql.SQL(_name), sql.SQL(_table), sql.SQL(_column))) and \
+                    self.execute(sql.SQL('ANALYZE {};').format(sql.SQL(_table))):
+                _created.append(_name)
+        return _created
+
+
+# +
+# class: PsqlPool()
+# -
+class PsqlPool(object):
+
+    # +
+    # method: __init__()
+    # -
+    def __init__(self, database: str = DB_NAME, authorization: str = DB_AUTHORIZATION, server: str = DB_HOST,
+                 port: int = DB_PORT, minconn: int = PSQL_POOL_MIN, maxconn: int = PSQL_POOL_MAX,
+                 idle: float = PSQL_POOL_IDLE, timeout: float = PSQL_POOL_TIMEOUT):
+        """ initialize the class """
+
+        # get input(s) (a PsqlConnection validates the connection parameters)
+        self.__template = PsqlConnection(database, authorization, server, port)
+        self.maxconn = maxconn
+        self.minconn = minconn
+        self.idle = idle
+        self.timeout = timeout
+
+        # private variable(s)
+        self.__lock = threading.Condition()
+        self.__free = collections.deque()
+        self.__used = 0
+        self.__opened = 0
+        self.__closed = False
+
+    # +
+    # decorator(s)
+    # -
+    @property
+    def minconn(self):
+        return self.__minconn
+
+    @minconn.setter
+    def minconn(self, minconn: int = PSQL_POOL_MIN):
+        self.__minconn = min(int(minconn), self.__maxconn) if (isinstance(minconn, int) and minconn >= 0) \
+            else min(PSQL_POOL_MIN, self.__maxconn)
+
+    @property
+    def maxconn(self):
+        return self.__maxconn
+
+    @maxconn.setter
+    def maxconn(self, maxconn: int = PSQL_POOL_MAX):
+        self.__maxconn = int(maxconn) if (isinstance(maxconn, int) and maxconn > 0) else PSQL_POOL_MAX
+
+    @property
+    def idle(self):
+        return self.__idle
+
+    @idle.setter
+    def idle(self, idle: float = PSQL_POOL_IDLE):
+        self.__idle = float(idle) if (isinstance(idle, (int, float)) and idle > 0.0) else PSQL_POOL_IDLE
+
+    @property
+    def timeout(self):
+        return self.__timeout
+
+    @timeout.setter
+    def timeout(self, timeout: float = PSQL_POOL_TIMEOUT):
+        self.__timeout = float(timeout) if (isinstance(timeout, (int, float)) and timeout > 0.0) \
+            else PSQL_POOL_TIMEOUT
+
+    @property
+    def closed(self):
+        return self.__closed
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return {'free': len(self.__free), 'used': self.__used, 'opened': self.__opened}
+
+    # +
+    # method: __enter__(), __exit__()
+    # -
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: getconn()
+    # -
+    def getconn(self) -> Any:
+        """ check out a healthy connection, opening one if fewer than maxconn exist """
+
+        _end = time.monotonic() + self.__timeout
+        with self.__lock:
+            while True:
+                if self.__closed:
+                    raise Exception(f'pool for {self.__template.database} on {self.__template.server} is closed')
+                self.__prune()
+                if self.__free:
+                    _connection, _last = self.__free.pop()
+                    self.__used += 1
+                    break
+                if self.__used + len(self.__free) < self.__maxconn:
+                    _connection, _last = None, None
+                    self.__used += 1
+                    break
+                if not self.__lock.wait(max(0.0, _end - time.monotonic())) and time.monotonic() >= _end:
+                    raise Exception(f'timed out waiting for a connection after {self.__timeout}s')
+
+        # check (outside the lock) a connection that has been idle for a while or open a new one
+        try:
+            if _connection is not None and (_connection.closed != 0 or (
+                    time.monotonic() - _last > PSQL_POOL_CHECK and not self.__healthy(_connection))):
+                self.__discard(_connection)
+                _connection = None
+            if _connection is None:
+                _connection = psycopg2.connect(self.__template.dsn())
+                with self.__lock:
+                    self.__opened += 1
+            return _connection
+        except Exception:
+            with self.__lock:
+                self.__used -= 1
+                self.__lock.notify()
+            raise
+
+    # +
+    # method: putconn()
+    # -
+    def putconn(self, connection: Any = None, broken: bool = False) -> None:
+        """ return a connection to the pool (closing it if broken or the pool is closed) """
+
+        if connection is None:
+            return
+        try:
+            if not broken and connection.closed == 0 and \
+                    connection.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            broken = True
+        with self.__lock:
+            self.__used -= 1
+            if broken or self.__closed or connection.closed != 0:
+                self.__discard(connection)
+            else:
+                self.__free.append((connection, time.monotonic()))
+            self.__lock.notify()
+
+    # +
+    # method: connection()
+    # -
+    @contextlib.contextmanager
+    def connection(self):
+        """ context manager yielding a connected PsqlConnection on a pooled connection """
+
+        _connection = self.getconn()
+        _db = PsqlConnection(self.__template.database, self.__template.authorization, self.__template.server,
+                             self.__template.port)
+        _db.connect(_connection)
+        _broken = False
+        try:
+            yield _db
+        except psycopg2.OperationalError:
+            _broken = True
+            raise
+        finally:
+            self.putconn(_db.release(), _broken)
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ close all idle connections and refuse further checkouts """
+        with self.__lock:
+            self.__closed = True
+            while self.__free:
+                self.__discard(self.__free.pop()[0])
+            self.__lock.notify_all()
+
+    # +
+    # method: __prune() (called with the lock held)
+    # -
+    def __prune(self) -> None:
+        """ close connections idle for longer than idle seconds, keeping minconn """
+        _now = time.monotonic()
+        while self.__free and len(self.__free) + self.__used > self.__minconn and \
+                _now - self.__free[0][1] > self.__idle:
+            self.__discard(self.__free.popleft()[0])
+
+    # +
+    # method: __healthy()
+    # -
+    @staticmethod
+    def __healthy(connection: Any = None) -> bool:
+        """ return True if the connection answers SELECT 1 """
+        try:
+            with connection.cursor() as _cursor:
+                _cursor.execute('SELECT 1;')
+                _cursor.fetchone()
+            connection.rollback()
+            return True
+        except Exception:
+            return False
+
+    # +
+    # method: __discard()
+    # -
+    @staticmethod
+    def __discard(connection: Any = None) -> None:
+        """ close a connection quietly """
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+# +
+# function: psql_pool()
+# -
+def psql_pool(database: str = DB_NAME, authorization: str = DB_AUTHORIZATION, server: str = DB_HOST,
+              port: int = DB_PORT, **kwargs) -> PsqlPool:
+    """ return the process wide pool for these connection parameters (creating it if necessary) """
+    _key = (database, authorization, server, port)
+    with PSQL_POOLS_LOCK:
+        if _key not in PSQL_POOLS or PSQL_POOLS[_key].closed:
+            PSQL_POOLS[_key] = PsqlPool(database, authorization, server, port, **kwargs)
+        return PSQL_POOLS[_key]
+
+
+# +
+# function: psql_like_prefix()
+# -
+def psql_like_prefix(value: str = '') -> str:
+    """ return a LIKE pattern matching strings that start with value """
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
 
 # +
 # function: psql_connection_test()
@@ -220,27 +650,36 @@ def psql_connection_test(iargs: Any = None):
     if iargs is None:
         print(f"invalid input(s), iargs={iargs}")
         return
-    print(f"iargs={iargs}")
+
+    # exported data goes to stdout (by default) so messages go to stderr
+    _log = sys.stderr if iargs.export != '' else sys.stdout
+    print(f"iargs={iargs}", file=_log)
 
     # get a command (edit default command as you see fit)
-    _cmd = iargs.command.strip() == '' if iargs.command.strip() else DEF_COMMAND
+    _cmd = iargs.command.strip() if iargs.command.strip() != '' else DEF_COMMAND
 
     # instantiate class
     try:
-        _t = PsqlConnection(iargs.database, iargs.authorization, iargs.server, iargs.port)
-        print(f"_t={_t}")
-        _t.connect()
-        if iargs.method.lower() == 'fetchall':
-            print(_t.fetchall(iargs.command))
-        elif iargs.method.lower() == 'fetchone':
-            print(_t.fetchone(iargs.command))
-        elif iargs.method.lower() == 'fetchmany':
-            print(_t.fetchmany(iargs.command, int(iargs.nelms)))
-        elif iargs.method.lower() == 'raw':
-            print(_t.raw(iargs.command))
-        _t.disconnect()
-    except:
-        pass
+        with psql_pool(iargs.database, iargs.authorization, iargs.server, int(iargs.port)) as _p, \
+                _p.connection() as _t:
+            print(f"_t={_t}", file=_log)
+            if iargs.export != '':
+                with (open(iargs.output, 'w', newline='') if iargs.output != '-' else
+                      contextlib.nullcontext(sys.stdout)) as _fw:
+                    _n = _t.export(_cmd, _fw, iargs.export.lower(), size=int(iargs.chunk))
+                print(f"exported {_n} row(s) as {iargs.export} to {iargs.output}", file=_log)
+            elif iargs.method.lower() == 'fetchall':
+                print(_t.fetchall(_cmd))
+            elif iargs.method.lower() == 'fetchone':
+                print(_t.fetchone(_cmd))
+            elif iargs.method.lower() == 'fetchmany':
+                print(_t.fetchmany(_cmd, int(iargs.nelms)))
+            elif iargs.method.lower() == 'raw':
+                print(_t.raw(_cmd))
+            elif iargs.method.lower() == 'indexes':
+                print(_t.create_indexes())
+    except Exception as _:
+        print(f"error in psql_connection_test(), error='{_}'", file=_log)
 
 
 
@@ -256,6 +695,9 @@ if __name__ == '__main__':
     _p.add_argument(f'-d', f'--database', default=DB_NAME, help=f"""database name=<str>, defaults to '%(default)s'""")
     _p.add_argument(f'-m', f'--method', default=FETCH_METHOD[0], help=f"""database method=<str>, in {FETCH_METHOD} defaults to %(default)s""")
     _p.add_argument(f'-n', f'--nelms', default=FETCH_MANY, help=f"""database nelms=<int> (for fetchmany) defaults to %(default)s""")
+    _p.add_argument(f'-k', f'--chunk', default=PSQL_STREAM_SIZE, help=f"""rows per round trip=<int> (for export) defaults to %(default)s""")
+    _p.add_argument(f'-e', f'--export', default='', help=f"""stream the command result in format=<str>, in {EXPORT_FORMATS} defaults to '%(default)s'""")
+    _p.add_argument(f'-o', f'--output', default='-', help=f"""export output file=<str> ('-' is stdout), defaults to '%(default)s'""")
     _p.add_argument(f'-p', f'--port', default=DB_PORT, help=f"""database port=<int>, defaults to %(default)s""")
     _p.add_argument(f'-s', f'--server', default=DB_HOST, help=f"""database server=<address>,  defaults to '%(default)s'""")
     args = _p.parse_args()
@@ -4,30 +4,35 @@
 # +
 # import(s)
 # -
-from astropy.io import fits
 from datetime import datetime
-from datetime import timedelta
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-
-# noinspection PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences
-# from src import ARTN_ZERO_ISO, ARTN_ZERO_MJD, ARTN_ENCODE_DICT, ARTN_DECODE_DICT
-# noinspection PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences
-from src import encode_verboten, decode_verboten, get_iso, iso_to_mjd
-# noinspection PyUnresolvedReferences,PyUnresolvedReferences,PyUnresolvedReferences
-# from src.models.Models import ObsReq, obsreq_filters, User, user_filters
-from src.models.Models import ObsReq2, obsreq2_filters, User, user_filters
+
+# heavy module(s) are imported where first needed so start-up (--help, a night with no new frames) stays cheap:
+#   sqlalchemy                  dna_connect_database()
+#   src, src.models.Models      dna_resolve(), dna_process() (ORP, pulls in astropy)
+#   dna_inotify                 dna_daemon()
+#   dna_mail                    dna_outbox_drain(), when a gmail is due
+#   dna_stream                  --stream only
+from dna_cache import dna_cache_path, DnaHeaderCache
+from dna_fits import dna_fits_header, dna_fits_headers, DNA_FITS_DEPTH, DNA_FITS_POOLS, DNA_FITS_WORKERS
+from dna_ledger import DnaLedger
+from dna_metrics import DnaMetrics
+from dna_outbox import dna_outbox_drain, dna_outbox_path, DnaOutbox, DnaOutboxWorker
+from dna_scan import DnaScanner
+from dna_tgz import dna_tgz_builds, dna_tgz_codec, dna_tgz_name, dna_tgz_version
+from dna_tgz import DNA_TGZ_CALIBRATION, DNA_TGZ_OBJECT, DNA_TGZ_TYPES
+from dna_tgz import DNA_TGZ_WORKERS
 
 import argparse
-import json
+import contextlib
 import itertools
 import logging
 import logging.config
 import os
 import pytz
 import re
-import smtplib
-import tarfile
+import signal
+import threading
+import time
 
 
 # +
@@ -42,6 +47,10 @@ __doc__ = """
 # constant(s)
 # -
 DNA_TGZ_DIR = '/var/www/ARTN-ORP/instance/files'
+DNA_SCAN_STATE = '.dna.scan.json'
+DNA_ARTN_KEYS = ('ARTNOID', 'TARGET')
+DNA_DAEMON_HOURS = 15.0
+DNA_DAEMON_TIMEOUT = 5.0
 DNA_ISO_MATCH = re.compile(r'\d{8}')
 DNA_LOG_CLR_FMT = \
     '%(log_color)s%(asctime)-20s %(levelname)-9s %(filename)-15s line:%(lineno)-5d %(message)s'
@@ -55,6 +64,7 @@ DNA_LOG_MAX_BYTES = 9223372036854775807
 DNA_MONT4K_SIZES = [2880, 11520, 14400, 20480, 49152, 57600, 256000, 358400, 432128, 655360, 2206080, 3841920, 3856320, 3859200, 3862080, 3864960, 3867840, 7704000, 14904000, 14906880, 14921280]
 DNA_MONT4K_TYPES = ['fit', 'fits', 'FIT', 'FITS']
 DNA_TGZ_OWNER = {'www-data': 33}
+DNA_TGZ_URL = 'https://scopenet.as.arizona.edu/orp/files/'
 DNA_TGZ_GROUP = {'www-data': 33}
 DNA_TIMEZONE = pytz.timezone('America/Phoenix')
 
@@ -80,6 +90,7 @@ DNA_DB_NAME = os.getenv("DNA_DB_NAME", os.getenv("ARTN_DB_NAME", None))
 DNA_DB_PASS = os.getenv("DNA_DB_PASS", os.getenv("ARTN_DB_PASS", None))
 DNA_DB_PORT = os.getenv("DNA_DB_PORT", os.getenv("ARTN_DB_PORT", None))
 DNA_DB_USER = os.getenv("DNA_DB_USER", os.getenv("ARTN_DB_USER", None))
+DNA_DB_URL = os.getenv("DNA_DB_URL", '')
 
 DNA_GMAIL_PASS = os.getenv("MAIL_PASSWORD", None)
 DNA_GMAIL_PORT = os.getenv("MAIL_PORT", None)
@@ -211,7 +222,19 @@ class DnaLogger(object):
 # +
 # variable(s)
 # -
-dna_log = DnaLogger('ARTN-DNA').logger
+dna_log = logging.getLogger('ARTN-DNA')
+dna_db_lock = threading.Lock()
+dna_db_sessions = {}
+
+
+# +
+# function: dna_logger()
+# -
+def dna_logger():
+    """ configures the ARTN-DNA logger on first use (not at import) and returns it """
+    if not dna_log.handlers:
+        DnaLogger('ARTN-DNA')
+    return dna_log
 
 
 # +
@@ -220,6 +243,7 @@ dna_log = DnaLogger('ARTN-DNA').logger
 def_dna_iso = datetime.now(tz=DNA_TIMEZONE).isoformat().split('T')[0].replace('-', '')
 def_dna_ins = f'Mont4k'
 def_dna_dir = f'/rts2data/Kuiper/Mont4k/{def_dna_iso}/object'
+def_dna_night = f'/rts2data/Kuiper/Mont4k/{def_dna_iso}'
 def_dna_json = f'/rts2data/Kuiper/Mont4k/{def_dna_iso}/.dna.json'
 def_dna_obj = f''
 def_dna_tel = f'Kuiper'
@@ -230,47 +254,74 @@ def_dna_user = f''
 # function: dna_artn_ids()
 # -
 # noinspection PyBroadException
-def dna_artn_ids(_file=''):
-    """ returns IDs from FITS headers """
+def dna_artn_ids(_file='', _hdr=None):
+    """ returns IDs from FITS headers (or from a header already read by dna_fits_headers()) """
     # check input(s)
     # _gid, _oid, _tgt, _file = '', '', '', os.path.abspath(os.path.expanduser(f'{_file}'))
     _oid, _tgt, _file = '', '', os.path.abspath(os.path.expanduser(f'{_file}'))
-    if not isinstance(_file, str) or _file.strip() == '' or not os.path.exists(f'{_file}'):
+    if _hdr is None and (not isinstance(_file, str) or _file.strip() == '' or not os.path.exists(f'{_file}')):
         dna_log.error(f'invalid input, _file={_file}')
         # return _gid, _oid, _tgt
         return _oid, _tgt
     # get header(s)
-    _hdulist = fits.open(f'{_file}')
     try:
-        # _gid = f"{_hdulist[0].header['ARTNGID']}"
-        _oid = f"{_hdulist[0].header['ARTNOID']}"
-        _tgt = f"{_hdulist[0].header['TARGET']}"
+        if isinstance(_hdr, Exception):
+            raise _hdr
+        _hdr = _hdr if _hdr is not None else dna_fits_header(f'{_file}', DNA_ARTN_KEYS)
+        # _gid = f"{_hdr['ARTNGID']}"
+        _oid = f"{_hdr['ARTNOID']}"
+        _tgt = f"{_hdr['TARGET']}"
     except Exception as _e:
         dna_log.error(f'failed to get fits header(s), error={_e}')
-    else:
-        _hdulist.close()
 
     # return
     # return _gid, _oid, _tgt
     return _oid, _tgt
 
 
+# +
+# function: dna_file_oid()
+# -
+def dna_file_oid(_file=''):
+    """ returns the OID used for (non-object) frames without an ARTNOID """
+    return f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}oid"
+
+
 # +
 # function: dna_connect_database()
 # -
 # noinspection PyBroadException
 def dna_connect_database():
-    """ return database session """
+    """ return database session (one engine, and so one connection pool, is shared by the process) """
     try:
-        engine = create_engine(
-            f'postgresql+psycopg2://{DNA_DB_USER}:{DNA_DB_PASS}@{DNA_DB_HOST}:{DNA_DB_PORT}/{DNA_DB_NAME}')
-        get_session = sessionmaker(bind=engine)
-        return get_session()
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        with dna_db_lock:
+            if 'factory' not in dna_db_sessions:
+                # DNA_DB_URL (any SQLAlchemy URL) overrides the ORP database, eg for a stand-in
+                engine = create_engine(
+                    DNA_DB_URL or
+                    f'postgresql+psycopg2://{DNA_DB_USER}:{DNA_DB_PASS}@{DNA_DB_HOST}:{DNA_DB_PORT}/{DNA_DB_NAME}',
+                    pool_pre_ping=True)
+                dna_db_sessions['factory'] = sessionmaker(bind=engine, expire_on_commit=False)
+        return dna_db_sessions['factory']()
     except Exception as _e:
         dna_log.error('failed to connect database, error={_e}')
         return None
 
 
+# +
+# function: dna_database()
+# -
+def dna_database(_ctx=None):
+    """ returns the context's database session, connecting on first use (and only trying once) """
+    if _ctx['db'] is None:
+        dna_log.info(f'connecting database')
+        with _ctx['metrics'].timer('db_connect'):
+            _ctx['db'] = dna_connect_database() or False
+    return _ctx['db']
+
+
 # +
 # function: dna_disconnect_database()
 # -
@@ -284,67 +335,6 @@ def dna_disconnect_database(_s=None):
         dna_log.error(f'failed to disconnect database, error={_e}')
 
 
-# +
-# function: dna_gmail_close()
-# -
-# noinspection PyBroadException
-def dna_gmail_close(_s=None):
-    """ close gmail """
-    try:
-        if _s is not None:
-            _s.quit()
-    except Exception as _e:
-        dna_log.error(f'failed to disconnect from gmail, error={_e}')
-
-
-# +
-# function: dna_gmail_open()
-# -
-# noinspection PyBroadException
-def dna_gmail_open():
-    """ open gmail """
-    try:
-        _s = smtplib.SMTP(DNA_GMAIL_HOST, DNA_GMAIL_PORT)
-        _s.ehlo()
-        _s.starttls()
-        _s.login(DNA_GMAIL_USER, DNA_GMAIL_PASS)
-        return _s
-    except Exception as _e:
-        dna_log.error(f'failed to open gmail, error={_e}')
-        return None
-
-
-# +
-# function: dna_gmail_send()
-# -
-# noinspection PyBroadException
-def dna_gmail_send(_s=None, _to=None, _from='', _subject='', _text=''):
-    """ send gmail """
-    # check input(s)
-    if _s is None:
-        dna_log.error(f'invalid input, _s={_s}')
-        return
-    if not isinstance(_to, list) or _to is None or _to is []:
-        dna_log.error(f'invalid input, _to={_to}')
-        return
-    if not isinstance(_from, str) or _from.strip() == '':
-        dna_log.error(f'invalid input, _from={_from}')
-        return
-    if not isinstance(_subject, str) or _from.strip() == '':
-        dna_log.error(f'invalid input, _subject={_subject}')
-        return
-    if not isinstance(_text, str) or _text.strip() == '':
-        dna_log.error(f'invalid input, _text={_text}')
-        return
-    # send gmail
-    try:
-        _tos = ', '.join([_n for _n in _to])
-        _body = '\r\n'.join([f'To: {_tos}', f'From: {DNA_GMAIL_USER}', f'Subject: {_subject}', '',  f'{_text}'])
-        _s.sendmail(DNA_GMAIL_USER, _to, _body)
-    except Exception as _e:
-        dna_log.error(f'failed to send gmail, error={_e}')
-
-
 # +
 # function: dna_seek()
 # -
@@ -375,129 +365,551 @@ def dna_seek(_path='', _type=''):
 
 
 # +
-# function: dna()
+# function: dna_open()
 # -
 # noinspection PyBroadException
-def dna(_dna_dir=def_dna_dir, _dna_ins=def_dna_ins, _dna_iso=def_dna_iso, _dna_json=def_dna_json, 
-        _dna_obj=def_dna_obj, _dna_tel=def_dna_tel, _dna_user=def_dna_user, _gmail=False):
-    """ finds data, tarballs it up and send the user a notification on location """
-
-    # entry message
-    dna_log.info(f'dna(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
-                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}) ... entry')
+def dna_open(_dna_dir=def_dna_dir, _dna_ins=def_dna_ins, _dna_iso=def_dna_iso, _dna_json=def_dna_json,
+             _dna_obj=def_dna_obj, _dna_tel=def_dna_tel, _dna_user=def_dna_user, _gmail=False, _journal=False,
+             _drain=True):
+    """ checks input(s), connects gmail and database, loads the ledger and returns the context or None """
 
     # check input(s)
     _dna_dir = os.path.abspath(os.path.expanduser(f'{_dna_dir}'))
     if not isinstance(_dna_dir, str) or _dna_dir.strip() == '' or not os.path.isdir(f'{_dna_dir}'):
         dna_log.error(f'invalid input, _dna_dir={_dna_dir}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_dir={_dna_dir}')
 
     if not isinstance(_dna_ins, str) or _dna_ins.strip() == '' or _dna_ins not in INSTRUMENTS:
         dna_log.error(f'invalid input, _dna_ins={_dna_ins}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_ins={_dna_ins}')
 
     if not isinstance(_dna_iso, str) or len(_dna_iso) != 8 or re.match(DNA_ISO_MATCH, _dna_iso) is None:
         dna_log.error(f'invalid input, _dna_iso={_dna_iso}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_iso={_dna_iso}')
 
     _dna_json = os.path.abspath(os.path.expanduser(f'{_dna_json}'))
     if not isinstance(_dna_json, str) or _dna_json.strip() == '' or not os.path.isfile(f'{_dna_json}'):
         dna_log.error(f'invalid input, _dna_json={_dna_json}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_json={_dna_json}')
 
     if not isinstance(_dna_obj, str):
         dna_log.error(f'invalid input, _dna_obj={_dna_obj}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_obj={_dna_obj}')
 
     if not isinstance(_dna_tel, str) or _dna_tel.strip() == '' or _dna_tel not in TELESCOPES:
         dna_log.error(f'invalid input, _dna_tel={_dna_tel}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_tel={_dna_tel}')
 
     if not isinstance(_dna_user, str):
         dna_log.error(f'invalid input, _dna_user={_dna_user}')
-        return
+        return None
     else:
         dna_log.info(f'valid input, _dna_user={_dna_user}')
 
     if f'{_dna_ins}' not in SUPPORTED[f'{_dna_tel}']:
         dna_log.error(f'invalid combination, _dna_ins={_dna_ins}, _dna_tel={_dna_tel}')
-        return
+        return None
     else:
         dna_log.info(f'valid combination, _dna_ins={_dna_ins}, _dna_tel={_dna_tel}')
 
     if not isinstance(_gmail, bool):
         _gmail = False
 
+    if not isinstance(_journal, bool):
+        _journal = False
+
     # +
     # set up
     # -
+    dna_metrics = DnaMetrics('dna', {'telescope': _dna_tel, 'instrument': _dna_ins, 'iso': _dna_iso}, dna_log)
+
     _tgzs = {
         # new
-        'bias': os.path.abspath(
+        'bias': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.bias.tgz'))),
-        'calibration': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'calibration': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.calibration.tgz'))),
-        'dark': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'dark': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.dark.tgz'))),
-        'flat': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'flat': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.flat.tgz'))),
-        'focus': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'focus': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.focus.tgz'))),
-        'skyflat': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'skyflat': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.skyflat.tgz'))),
-        'standard': os.path.abspath(
+            DNA_TGZ_CALIBRATION),
+        'standard': dna_tgz_name(os.path.abspath(
             os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'{_dna_tel}.{_dna_ins}.{_dna_iso}.standard.tgz'))),
+            DNA_TGZ_CALIBRATION),
         # legacy
         'darks': os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'darks.{_dna_iso}.tgz'))),
         'skyflats': os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f'skyflats.{_dna_iso}.tgz')))
     }
     dna_log.info(f'_tgzs={_tgzs}')
-    
-    dna_log.info(f'connecting gmail')
-    dna_gs = dna_gmail_open() if _gmail else None
 
-    dna_log.info(f'connecting database')
-    dna_db = dna_connect_database()
+    dna_log.info(f'opening gmail outbox')
+    dna_ob = DnaOutbox(dna_outbox_path()) if _gmail else None
+
+    dna_log.info(f'reading JSON')
+    dna_json = DnaLedger(_dna_json, _journal)
+    with dna_metrics.timer('ledger_load'):
+        dna_json.load()
+
+    dna_log.info(f'loading previous OIDs')
+    _oid_dict = dna_json.oids()
+
+    # return context
+    return {'dir': _dna_dir, 'ins': _dna_ins, 'iso': _dna_iso, 'file': _dna_json, 'obj': _dna_obj, 'tel': _dna_tel,
+            'user': _dna_user, 'gmail': _gmail, 'tgzs': _tgzs, 'drain': _drain is True, 'outbox': dna_ob,
+            'worker': None, 'db': None, 'json': dna_json, 'metrics': dna_metrics,
+            'oids': _oid_dict, 'resolved': set(), 'obsreqs': {}, 'owners': {}, 'archives': {}, 'streams': {}, 'notices': {},
+            'tgz_workers': DNA_TGZ_WORKERS, 'tgz_codec': DNA_TGZ_OBJECT, 'stream': False}
+
+
+# +
+# function: dna_close()
+# -
+# noinspection PyBroadException
+def dna_close(_ctx=None):
+    """ writes the ledger, disconnects database and drains the gmail outbox """
+
+    if _ctx is None:
+        return
+
+    dna_log.info(f'writing JSON')
+    with _ctx['metrics'].timer('ledger_save'):
+        _ctx['json'].save()
+
+    if _ctx.get('cache') is not None:
+        dna_log.info(f"closing header cache, hits={_ctx['cache'].hits}, misses={_ctx['cache'].misses}")
+        _ctx['metrics'].count('header_cache_hits', _ctx['cache'].hits)
+        _ctx['metrics'].count('header_cache_misses', _ctx['cache'].misses)
+        try:
+            _ctx['cache'].close()
+        except Exception as _e:
+            dna_log.error(f'failed to close header cache, error={_e}')
+
+    dna_log.info(f'disconnect database')
+    if _ctx['db']:
+        dna_disconnect_database(_ctx['db'])
+
+    # the outbox is drained last, so a slow or hung SMTP server holds up nothing else
+    if _ctx['gmail'] and _ctx['outbox']:
+        _ctx['outbox'].close()
+        if _ctx['worker'] is not None:
+            dna_log.info(f'stopping gmail outbox worker')
+            _ctx['worker'].stop()
+        elif _ctx['drain']:
+            dna_log.info(f'draining gmail outbox')
+            try:
+                with _ctx['metrics'].timer('gmail'):
+                    _drained = dna_outbox_drain(_ctx['outbox'].path, None, 0, dna_log)
+                for _k, _v in _drained.items():
+                    _ctx['metrics'].count(f'gmails_{_k}', _v)
+            except Exception as _e:
+                dna_log.error(f'failed to drain gmail outbox, error={_e}')
+
+    _ctx['metrics'].export()
 
+
+# +
+# function: dna_process()
+# -
+# noinspection PyBroadException
+def dna_process(_ctx=None, _file='', _size=0, _hdr=None):
+    """ processes one file: ledger, OID grouping, obsreq update, tarball and notification """
+
+    # get context
+    dna_json, _oid_dict, _tgzs = _ctx['json'], _ctx['oids'], _ctx['tgzs']
+    _dna_ins, _dna_iso, _dna_obj, _dna_tel, _dna_user, _gmail = \
+        _ctx['ins'], _ctx['iso'], _ctx['obj'], _ctx['tel'], _ctx['user'], _ctx['gmail']
+
+    # if the file has gone (renamed or removed since it was scanned or seen by inotify), return
     try:
-        dna_log.info(f'reading JSON')
-        with open(f'{_dna_json}', 'r') as _fr:
-            dna_json = list(json.load(_fr))
-    except Exception:
-        dna_json = []
-
-    dna_log.info(f'loading previous GIDs and OIDs')
-    # _gid_dict = {}
-    # for _e in dna_json:
-    #     if 'gid' in _e:
-    #         if _e['gid'] not in _gid_dict:
-    #             _gid_dict[_e['gid']] = [f"{_e['file']}"]
-    #         else:
-    #             _gid_dict[_e['gid']].append(f"{_e['file']}")
-    _oid_dict = {}
-    for _e in dna_json:
-        if 'oid' in _e:
-            if _e['oid'] not in _oid_dict:
-                _oid_dict[_e['oid']] = [f"{_e['file']}"]
+        _mtime = os.path.getmtime(_file)
+    except OSError as _e:
+        dna_log.error(f'failed to stat {_file}, error={_e}')
+        _ctx['metrics'].count('files_missing')
+        return
+
+    # if we have already processed this (unchanged) file, return
+    if dna_json.processed(_file, _mtime, _size):
+        dna_log.warning(f'already processed {_file}')
+        _ctx['metrics'].count('files_unchanged')
+        return
+    elif _file in dna_json:
+        dna_log.info(f're-processing changed {_file}')
+    else:
+        dna_log.info(f'processing {_file}')
+
+    # find observation type from directory structure
+    _obstype = os.path.basename(os.path.dirname(_file)).lower()
+    _user = ''
+    _email = ''
+
+    # if observation_id or _size is invalid, return
+    _oid, _tgt = dna_artn_ids(f'{_file}', _hdr)
+    if _tgt == 2:
+        # _gid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}gid"
+        _oid = dna_file_oid(_file)
+        _tgt = 'flat'
+        _user = 'rts2'
+        _email = 'rts2.operator@gmail.com'
+    elif _obstype == 'object':
+        #if (isinstance(_gid, str) and _gid.strip() == '') or \
+        #   (isinstance(_oid, str) and _oid.strip() == '') or \
+        # _gid, _oid, _tgt = dna_artn_ids(f'{_file}')
+        if (isinstance(_oid, str) and _oid.strip() == '') or _size not in DNA_MONT4K_SIZES:
+            #dna_log.error(f'invalid headers or size, _file={_file}, _gid={_gid}, '
+            #              f'_oid={_oid}, _tgt={_tgt}, _size={_size}')
+            dna_log.error(f'invalid headers or size, _file={_file}, _oid={_oid}, _tgt={_tgt}, _size={_size}')
+            return
+    else:
+        # _gid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}gid"
+        _oid = dna_file_oid(_file)
+        _tgt = _obstype
+        _user = 'rts2'
+        _email = 'rts2.operator@gmail.com'
+
+    # populate dictionary with this file
+    # if f'{_gid}' not in _gid_dict:
+    #     _gid_dict[f'{_gid}'] = [f'{_file}']
+    # else:
+    #     _gid_dict[f'{_gid}'].append(f'{_file}')
+    # dna_log.debug(f'_gid_dict={_gid_dict}')
+    if f'{_oid}' not in _oid_dict:
+        _oid_dict[f'{_oid}'] = [f'{_file}']
+    elif f'{_file}' not in _oid_dict[f'{_oid}']:
+        _oid_dict[f'{_oid}'].append(f'{_file}')
+    dna_log.debug(f'_oid_dict={_oid_dict}')
+
+    # create new entry
+    _element = {
+        'file': f'{_file}',
+        'user': f'{_user}',
+        'email': f'{_email}',
+        # 'gid': f'{_gid}',
+        'oid': f'{_oid}',
+        'tgt': f'{_tgt}',
+        'size': int(_size),
+        'mtime': _mtime,
+        'timestamp': f"{datetime.fromtimestamp(_mtime).isoformat()}"
+    }
+    dna_log.debug(f'_element={_element}')
+
+    # look up obsreq record(s) resolved in bulk (resolve this OID on its own if it was not)
+    try:
+        if f'{_oid}' not in _ctx['resolved']:
+            dna_resolve(_ctx, [f'{_oid}'])
+        _obsreq = _ctx['obsreqs'].get(f'{_oid}', [])
+    except Exception as _e:
+        dna_log.warning(f'failed to query obsreq table, error={_e}')
+    else:
+        # update record(s)
+        for _q in _obsreq:
+
+            dna_log.info(f"query obsreq table, _q.username={_q.username},_q.user_id={_q.user_id}")
+
+            # get user/owner
+            _element['user'] = _q.username
+
+            # tell user (if desired)
+            # if len(_gid_dict[f'{_gid}']) == _q.num_exp:
+            if _q.percent_completed == 100.0:
+
+                # increment counter and save if complete
+                _q.completed = True
+                from src import get_iso, iso_to_mjd
+                _iso = get_iso()
+                _q.completed_iso = _iso
+                _q.completed_mjd = iso_to_mjd(_iso)
+                try:
+                    with _ctx['metrics'].timer('db_commit'):
+                        _ctx['db'].commit()
+                except Exception as _e:
+                    _ctx['db'].rollback()
+                    dna_log.error(f'failed to commit to obsreq table, error=_{_e}')
+                    continue
+
+                # get user/owner
+                _user = [_u for _u in _ctx['owners'].get(f'{_q.username}', []) if f'{_u.id}' == f'{_q.user_id}']
+
+                # gmail user
+                for _u in _user:
+
+                    _element['email'] = _u.email
+
+                    # gzip all files in this dataset (built, concurrently, by dna_deliver()) or link on-demand
+                    _tgz = dna_tgz_name(os.path.abspath(
+                        os.path.expanduser(
+                            os.path.join(DNA_TGZ_DIR,
+                                         f'{_dna_tel}.{_dna_ins}.{_dna_iso}.{_u.username}.{_q.rts2_id}.tgz'))),
+                        _ctx['tgz_codec'])
+                    if _ctx['stream']:
+                        from dna_stream import dna_stream_url
+                        _tgz = dna_stream_url(_dna_tel, _dna_ins, _dna_iso, f'{_q.observation_id}')
+                        _ctx['streams'][_tgz] = list(_oid_dict[f'{_oid}'])
+                    elif _oid_dict[f'{_oid}'] is not []:
+                        dna_log.info(f'queueing archive {_tgz}')
+                        _ctx['archives'][_tgz] = list(_oid_dict[f'{_oid}'])
+
+                    if _gmail:
+                        from src import decode_verboten, ARTN_DECODE_DICT
+                        _object_name = decode_verboten(_q.object_name, ARTN_DECODE_DICT)
+                        _txt = f'{_object_name} observed using the {_q.telescope} telescope with ' \
+                               f'{_q.instrument}\nRA: {_q.ra_hms}  Dec: {_q.dec_dms}  Epoch: J2000\n' \
+                               f'{_q.num_exp} x {_q.exp_time}s exposures, in the {_q.filter_name} filter, ' \
+                               f'at airmass {_q.airmass}\nData archive: ' \
+                               f'{_tgz if _ctx["stream"] else DNA_TGZ_URL + os.path.basename(_tgz)}\n' \
+                               f'NB: Calibration data may not be available until 08:00 ' \
+                               f'the following day (or at all!)\n'
+                        for _k, _v in _tgzs.items():
+                            if _ctx['stream']:
+                                _txt += f'{_k[0].upper()}{_k[1:]} archive: {_v}\n'
+                            elif os.path.exists(f'{_v}'):
+                                _txt += f'{_k[0].upper()}{_k[1:]} archive: {DNA_TGZ_URL}{os.path.basename(_v)}\n'
+                        _txt = _txt[:-1]
+
+                        try:
+                            dna_log.info(f"queueing gmail to {_q.username} ({_u.email}), "
+                                         f"object='{_object_name}', _txt='{_txt}'")
+                            _notice = ([f'{_u.email}', DNA_GMAIL_USER], DNA_GMAIL_USER,
+                                       f'ARTN ORP Completed {_object_name}', _txt)
+                            # notify specific user of all object(s) observed
+                            if _dna_user != '' and _dna_obj == '':
+                                if _dna_user.lower() in _u.email.lower():
+                                    _ctx['notices'][(_tgz, _u.email)] = _notice
+                            # notify all user(s) of specific object(s) observed
+                            elif _dna_user == '' and _dna_obj != '':
+                                if _dna_obj.lower() in _object_name.lower():
+                                    _ctx['notices'][(_tgz, _u.email)] = _notice
+                            # notify specific user of specific object(s) observed
+                            elif _dna_user != '' and _dna_obj != '':
+                                if _dna_user.lower() in _u.email.lower() and \
+                                        _dna_obj.lower() in _object_name.lower():
+                                    _ctx['notices'][(_tgz, _u.email)] = _notice
+                            # notify all user(s) of all object(s) observed
+                            else:
+                                _ctx['notices'][(_tgz, _u.email)] = _notice
+                        except Exception as e:
+                            dna_log.error(f'failed to queue gmail, error={e}')
+    finally:
+        # add it to the json data structure
+        # if all(_k in _element for _k in ('file', 'size', 'gid', 'oid', 'tgt', 'email', 'user', 'timestamp')):
+        if dna_json.add(_element):
+            dna_log.info(f'processed {_element}')
+            _ctx['metrics'].count('files_processed')
+        else:
+            dna_log.warning(f'missing keys in dna json, keys={_element.keys()}')
+
+
+# +
+# function: dna_stream_tgzs()
+# -
+def dna_stream_tgzs(_ctx=None):
+    """ returns the on-demand calibration archive link(s) of the night (instead of pre-built _tgzs) """
+    from dna_stream import dna_stream_url
+    # --data is the night directory (DNA.sh, dna_daemon, dna_all.py) or, by hand, its object sub-directory
+    _night = os.path.abspath(os.path.expanduser(_ctx['dir'])).rstrip(os.sep)
+    if os.path.basename(_night) == 'object':
+        _night = os.path.dirname(_night)
+    _tgzs = {_k: dna_stream_url(_ctx['tel'], _ctx['ins'], _ctx['iso'], _k) for _k in DNA_TGZ_TYPES
+             if os.path.isdir(os.path.join(_night, _k))}
+    dna_log.info(f'_tgzs={_tgzs}')
+    return _tgzs
+
+
+# +
+# function: dna_deliver()
+# -
+# noinspection PyBroadException
+def dna_deliver(_ctx=None):
+    """ builds the archive(s) queued by dna_process() concurrently, then puts the gmail(s) in the outbox """
+
+    with _ctx['metrics'].timer('tgz'):
+        _results = dna_tgz_builds(_ctx['archives'], workers=_ctx['tgz_workers'], log=dna_log,
+                                  codec=_ctx['tgz_codec'])
+    _ctx['metrics'].tgz(_results)
+
+    for (_tgz, _email), (_to, _from, _subject, _txt) in _ctx['notices'].items():
+        if _tgz in _results and _results[_tgz]['error'] != '':
+            dna_log.error(f'not sending gmail to {_email}, archive {_tgz} failed')
+            continue
+        try:
+            # keyed on the archive's content, so a rebuilt archive (late frame(s)) is notified again
+            _version = dna_tgz_version(_tgz, _ctx['streams'].get(_tgz))
+            if _ctx['outbox'].put(f'{_tgz}|{_version}|{_email}', _to, _subject, _txt, _from):
+                dna_log.info(f"queued gmail to {_email}, subject='{_subject}'")
+                _ctx['metrics'].count('gmails_queued')
             else:
-                _oid_dict[_e['oid']].append(f"{_e['file']}")
+                dna_log.info(f"gmail to {_email} for {_tgz} already queued, skipping")
+        except Exception as e:
+            dna_log.error(f'failed to queue gmail, error={e}')
+    if _ctx['worker'] is not None:
+        _ctx['worker'].wake()
+
+    _ctx['archives'], _ctx['streams'], _ctx['notices'] = {}, {}, {}
+
+
+# +
+# function: dna_cache_open()
+# -
+# noinspection PyBroadException
+def dna_cache_open(_cache=''):
+    """ returns the header cache ('' = shared one in $DNA_LOGS, 'none' = no cache) or None """
+    if not isinstance(_cache, str) or _cache.strip().lower() == 'none':
+        return None
+    _cache = _cache.strip() if _cache.strip() != '' else dna_cache_path()
+    try:
+        _c = DnaHeaderCache(_cache)
+        _c.open()
+        dna_log.info(f'using header cache {_c.path}')
+        return _c
+    except Exception as _e:
+        dna_log.error(f'failed to open header cache {_cache}, error={_e}')
+        return None
+
+
+# +
+# function: dna_resolve()
+# -
+# noinspection PyBroadException
+def dna_resolve(_ctx=None, _oids=None, _reset=False):
+    """ resolves OIDs to obsreq record(s) and their owner(s) with one query each """
+
+    if _reset:
+        _ctx['resolved'], _ctx['obsreqs'], _ctx['owners'] = set(), {}, {}
+    _oids = sorted({f'{_o}' for _o in (_oids or []) if f'{_o}'.strip() != ''} - _ctx['resolved'])
+    if not _oids or not dna_database(_ctx):
+        return
+    from src.models.Models import ObsReq2, User
+
+    # obsreq record(s) for all OIDs
+    dna_log.info(f'resolving {len(_oids)} OID(s)')
+    _names = set()
+    with _ctx['metrics'].timer('db_query'):
+        _rows = _ctx['db'].query(ObsReq2).filter(ObsReq2.observation_id.in_(_oids)).all()
+    for _q in _rows:
+        _ctx['obsreqs'].setdefault(f'{_q.observation_id}', []).append(_q)
+        _names.add(f'{_q.username}')
+    _ctx['resolved'].update(_oids)
+
+    # owner(s) not already known
+    _names = sorted(_names - set(_ctx['owners']))
+    if _names:
+        with _ctx['metrics'].timer('db_query'):
+            _rows = _ctx['db'].query(User).filter(User.username.in_(_names)).all()
+        for _u in _rows:
+            _ctx['owners'].setdefault(f'{_u.username}', []).append(_u)
+        for _n in _names:
+            _ctx['owners'].setdefault(_n, [])
+
+
+# +
+# function: dna_prefetch()
+# -
+# noinspection PyBroadException
+def dna_prefetch(_ctx=None, _files=None):
+    """ yields (file, size, header) in order, headers of unprocessed files are read on a bounded pool """
+    _files = _files or {}
+    _todo = [_f for _f, _s in _files.items() if not _ctx['json'].processed(_f, None, _s)]
+    dna_log.info(f"reading {len(_todo)} header(s) with {_ctx['workers']} {_ctx['pool']} worker(s), "
+                 f"depth={_ctx['depth']}")
+    with _ctx['metrics'].timer('headers'):
+        _hdrs = dict(dna_fits_headers(_todo, DNA_ARTN_KEYS, workers=_ctx['workers'], depth=_ctx['depth'],
+                                      pool=_ctx['pool'], cache=_ctx.get('cache', None)))
+    _ctx['metrics'].count('headers_read', len(_todo))
+
+    # resolve every OID in this batch up front (fresh for each batch)
+    _oids = [_h.get('ARTNOID', '') if (isinstance(_h, dict) and
+                                       os.path.basename(os.path.dirname(_f)).lower() == 'object') else dna_file_oid(_f)
+             for _f, _h in _hdrs.items()]
+    try:
+        dna_resolve(_ctx, _oids, _reset=True)
+    except Exception as _e:
+        dna_log.warning(f'failed to resolve OID(s) in bulk, error={_e}')
+        if _ctx['db']:
+            _ctx['db'].rollback()
+
+    for _file, _size in _files.items():
+        yield _file, _size, _hdrs.get(_file, None)
+
+
+# +
+# function: dna()
+# -
+# noinspection PyBroadException
+def dna(_dna_dir=def_dna_dir, _dna_ins=def_dna_ins, _dna_iso=def_dna_iso, _dna_json=def_dna_json, 
+        _dna_obj=def_dna_obj, _dna_tel=def_dna_tel, _dna_user=def_dna_user, _gmail=False, _journal=False,
+        _incremental=False, _workers=DNA_FITS_WORKERS, _depth=DNA_FITS_DEPTH, _pool=DNA_FITS_POOLS[0], _cache='',
+        _tgz_workers=DNA_TGZ_WORKERS, _tgz_codec=DNA_TGZ_OBJECT, _stream=False, _drain=True):
+    """ finds data, tarballs it up and send the user a notification on location (_drain=False leaves the
+        gmail(s) in the outbox for the caller) """
+
+    # entry message
+    dna_logger()
+    dna_log.info(f'dna(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
+                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}) ... entry')
+
+    # +
+    # set up
+    # -
+    try:
+        dna_tgz_codec(_tgz_codec)
+    except ValueError as _e:
+        dna_log.error(f'invalid input, _tgz_codec={_tgz_codec}, error={_e}')
+        return
+
+    if _stream is True and os.getenv('DNA_STREAM_URL', '').strip() == '':
+        dna_log.error(f'invalid input, _stream={_stream} but DNA_STREAM_URL is not set')
+        return
+
+    _ctx = dna_open(_dna_dir, _dna_ins, _dna_iso, _dna_json, _dna_obj, _dna_tel, _dna_user, _gmail, _journal,
+                    _drain)
+    if _ctx is None:
+        return
+
+    if not isinstance(_incremental, bool):
+        _incremental = False
+
+    _ctx = {**_ctx, 'workers': _workers, 'depth': _depth, 'pool': _pool,
+            'cache': dna_cache_open(_cache), 'tgz_workers': _tgz_workers, 'tgz_codec': _tgz_codec,
+            'stream': _stream is True}
+    if _ctx['stream']:
+        _ctx['tgzs'] = dna_stream_tgzs(_ctx)
 
     # +
     # process
     # -
-    _fits_dictionary = dna_seek(_dna_dir, 'fits')
+    dna_scan = None
+    with _ctx['metrics'].timer('scan'):
+        if _incremental:
+            dna_log.info(f'scanning incrementally')
+            dna_scan = DnaScanner(_ctx['dir'], 'fits', os.path.join(os.path.dirname(_ctx['file']), DNA_SCAN_STATE))
+            if len(_ctx['json']) == 0:
+                dna_scan.reset()
+            _fits_dictionary = dna_scan.scan()
+            dna_log.info(f"scanned {_ctx['dir']} with {dna_scan.stats} stat(s), watermark={dna_scan.watermark}")
+        else:
+            _fits_dictionary = dna_seek(_ctx['dir'], 'fits')
+    _ctx['metrics'].count('files_scanned', len(_fits_dictionary or {}))
     if _fits_dictionary is None or _fits_dictionary is {}:
         dna_log.info(f'no files found for processing')
 
@@ -505,204 +917,163 @@ def dna(_dna_dir=def_dna_dir, _dna_ins=def_dna_ins, _dna_iso=def_dna_iso, _dna_j
         dna_log.info(f'found {len(_fits_dictionary)} files for processing')
 
         # process keyword-value pair(s)
-        for _file, _size in _fits_dictionary.items():
+        for _file, _size, _hdr in dna_prefetch(_ctx, _fits_dictionary):
+            dna_process(_ctx, _file, _size, _hdr)
+        dna_deliver(_ctx)
 
-            # if we have already processed this file, continue
-            _already_processed = True if [_f for _f in dna_json if _file in _f['file']] != [] else False
-            if _already_processed:
-                dna_log.warning(f'already processed {_file}')
-                continue
-            else:
-                dna_log.info(f'processing {_file}')
-
-            # find observation type from directory structure
-            _obstype = os.path.basename(os.path.dirname(_file)).lower()
-            _user = ''
-            _email = ''
-
-            # if observation_id or _size is invalid, continue
-            _oid, _tgt = dna_artn_ids(f'{_file}')
-            if _tgt == 2:
-                # _gid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}gid"
-                _oid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}oid"
-                _tgt = 'flat'
-                _user = 'rts2'
-                _email = 'rts2.operator@gmail.com'
-            elif _obstype == 'object':
-                #if (isinstance(_gid, str) and _gid.strip() == '') or \
-                #   (isinstance(_oid, str) and _oid.strip() == '') or \
-                # _gid, _oid, _tgt = dna_artn_ids(f'{_file}')
-                if (isinstance(_oid, str) and _oid.strip() == '') or _size not in DNA_MONT4K_SIZES:
-                    #dna_log.error(f'invalid headers or size, _file={_file}, _gid={_gid}, '
-                    #              f'_oid={_oid}, _tgt={_tgt}, _size={_size}')
-                    dna_log.error(f'invalid headers or size, _file={_file}, _oid={_oid}, _tgt={_tgt}, _size={_size}')
-                    continue
-            else:
-                # _gid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}gid"
-                _oid = f"{os.path.basename(_file).replace('-', '').replace('.', '').lower()}oid"
-                _tgt = _obstype
-                _user = 'rts2'
-                _email = 'rts2.operator@gmail.com'
-
-            # populate dictionary with this file
-            # if f'{_gid}' not in _gid_dict:
-            #     _gid_dict[f'{_gid}'] = [f'{_file}']
-            # else:
-            #     _gid_dict[f'{_gid}'].append(f'{_file}')
-            # dna_log.debug(f'_gid_dict={_gid_dict}')
-            if f'{_oid}' not in _oid_dict:
-                _oid_dict[f'{_oid}'] = [f'{_file}']
-            else:
-                _oid_dict[f'{_oid}'].append(f'{_file}')
-            dna_log.debug(f'_oid_dict={_oid_dict}')
-
-            # create new entry
-            _element = {
-                'file': f'{_file}',
-                'user': f'{_user}',
-                'email': f'{_email}',
-                # 'gid': f'{_gid}',
-                'oid': f'{_oid}',
-                'tgt': f'{_tgt}',
-                'size': int(_size),
-                'timestamp': f"{datetime.fromtimestamp(os.path.getmtime(_file)).isoformat()}"
-            }
-            dna_log.debug(f'_element={_element}')
+    # +
+    # shut down
+    # -
+    dna_close(_ctx)
 
-            # query obsreq database(s)
-            _obsreq = None
-            try:
-                # _obsreq = dna_db.query(ObsReq)
-                _obsreq = dna_db.query(ObsReq2)
-                # _obsreq = obsreq_filters(_obsreq, {'group_id': f'{_gid}', 'observation_id': f'{_oid}'})
-                _obsreq = obsreq2_filters(_obsreq, {'observation_id': f'{_oid}'})
-            except Exception as _e:
-                dna_log.warning(f'failed to query obsreq table, error={_e}')
-            else:
-                # update record(s)
-                for _q in _obsreq.all():
+    if dna_scan is not None:
+        dna_log.info(f'writing scan state')
+        dna_scan.save()
 
-                    dna_log.info(f"query obsreq table, _q.username={_q.username},_q.user_id={_q.user_id}")
+    # exit message
+    dna_log.info(f'dna(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
+                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}) ... exit')
 
-                    # get user/owner
-                    _element['user'] = _q.username
 
-                    # tell user (if desired)
-                    # if len(_gid_dict[f'{_gid}']) == _q.num_exp:
-                    if _q.percent_completed == 100.0:
+# +
+# function: dna_daemon_batch()
+# -
+# noinspection PyBroadException
+def dna_daemon_batch(_ctx=None, _files=None):
+    """ processes a batch of {filename: size} using the warm context """
 
-                        # increment counter and save if complete
-                        _q.completed = True
-                        _iso = get_iso()
-                        _q.completed_iso = _iso
-                        _q.completed_mjd = iso_to_mjd(_iso)
-                        try:
-                            dna_db.commit()
-                        except Exception as _e:
-                            dna_db.rollback()
-                            dna_log.error(f'failed to commit to obsreq table, error=_{_e}')
-                            continue
+    if not _files:
+        return
 
-                        # get user/owner
-                        _user = None
-                        try:
-                            _user = dna_db.query(User)
-                            _user = user_filters(_user, {'user_id': f'{_q.user_id}', 'username': f'{_q.username}'})
-                        except Exception as e:
-                            dna_log.error(f'failed to execute user query, error={e}')
-                            continue
-
-                        # gmail user
-                        for _u in _user.all():
-
-                            _element['email'] = _u.email
-
-                            # gzip all files in this dataset
-                            _tgz = os.path.abspath(
-                                os.path.expanduser(
-                                    os.path.join(DNA_TGZ_DIR,
-                                                 f'{_dna_tel}.{_dna_ins}.{_dna_iso}.{_u.username}.{_q.rts2_id}.tgz')))
-                            if _oid_dict[f'{_oid}'] is not []:
-                                dna_log.info(f'creating archive {_tgz}')
-                                with tarfile.open(f'{_tgz}', mode='w:gz') as _wf:
-                                    for _fz in _oid_dict[f'{_oid}']:
-                                        dna_log.info(f'adding {_fz} to {_tgz}')
-                                        _wf.add(f'{_fz}')
-
-                            # change ownership
-                            if os.path.exists(_tgz):
-                                try:
-                                    os.chown(f'{_tgz}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
-                                except Exception as _f:
-                                    dna_log.error(f'failed to chown {_tgz}')
-
-                            if _gmail:
-                                _object_name = decode_verboten(_q.object_name, ARTN_DECODE_DICT)
-                                _txt = f'{_object_name} observed using the {_q.telescope} telescope with ' \
-                                       f'{_q.instrument}\nRA: {_q.ra_hms}  Dec: {_q.dec_dms}  Epoch: J2000\n' \
-                                       f'{_q.num_exp} x {_q.exp_time}s exposures, in the {_q.filter_name} filter, ' \
-                                       f'at airmass {_q.airmass}\nData archive: ' \
-                                       f'https://scopenet.as.arizona.edu/orp/files/{os.path.basename(_tgz)}\n' \
-                                       f'NB: Calibration data may not be available until 08:00 ' \
-                                       f'the following day (or at all!)\n'
-                                for _k, _v in _tgzs.items():
-                                    if os.path.exists(f'{_v}'):
-                                        _txt += f'{_k[0].upper()}{_k[1:]} archive: ' \
-                                                f'https://scopenet.as.arizona.edu/orp/files/{os.path.basename(_v)}\n'
-                                _txt = _txt[:-1]
-
-                                try:
-                                    dna_log.info(f"sending gmail to {_q.username} ({_u.email}), "
-                                                 f"object='{_object_name}', _txt='{_txt}'")
-                                    # notify specific user of all object(s) observed
-                                    if _dna_user != '' and _dna_obj == '':
-                                        if _dna_user.lower() in _u.email.lower():
-                                            dna_gmail_send(dna_gs, [f'{_u.email}', DNA_GMAIL_USER], DNA_GMAIL_USER,
-                                                           f'ARTN ORP Completed {_object_name}', _txt)
-                                    # notify all user(s) of specific object(s) observed
-                                    elif _dna_user == '' and _dna_obj != '':
-                                        if _dna_obj.lower() in _object_name.lower():
-                                            dna_gmail_send(dna_gs, [f'{_u.email}', DNA_GMAIL_USER], DNA_GMAIL_USER,
-                                                           f'ARTN ORP Completed {_object_name}', _txt)
-                                    # notify specific user of specific object(s) observed
-                                    elif _dna_user != '' and _dna_obj != '':
-                                        if _dna_user.lower() in _u.email.lower() and \
-                                                _dna_obj.lower() in _object_name.lower():
-                                            dna_gmail_send(dna_gs, [f'{_u.email}', DNA_GMAIL_USER], DNA_GMAIL_USER,
-                                                           f'ARTN ORP Completed {_object_name}', _txt)
-                                    # notify all user(s) of all object(s) observed
-                                    else:
-                                        dna_gmail_send(dna_gs, [f'{_u.email}', DNA_GMAIL_USER], DNA_GMAIL_USER,
-                                                       f'ARTN ORP Completed {_object_name}', _txt)
-                                except Exception as e:
-                                    dna_log.error(f'failed to send gmail, error={e}')
-            finally:
-                # add it to the json data structure
-                # if all(_k in _element for _k in ('file', 'size', 'gid', 'oid', 'tgt', 'email', 'user', 'timestamp')):
-                if all(_k in _element for _k in ('file', 'size', 'oid', 'tgt', 'email', 'user', 'timestamp')):
-                    dna_log.info(f'processed {_element}')
-                    dna_json.append(_element)
-                else:
-                    dna_log.warning(f'missing keys in dna json, keys={_element.keys()}')
+    dna_log.info(f'found {len(_files)} files for processing')
+    _ctx['metrics'].count('files_scanned', len(_files))
+    for _file, _size, _hdr in dna_prefetch(_ctx, dict(sorted(_files.items()))):
+        dna_process(_ctx, _file, _size, _hdr)
+    dna_deliver(_ctx)
+
+    dna_log.info(f'writing JSON')
+    _ctx['json'].save()
+    if _ctx['cache'] is not None:
+        _ctx['cache'].flush()
+
+    # release the connection to the pool and forget cached rows so the next batch sees fresh data
+    if _ctx['db']:
+        try:
+            _ctx['db'].close()
+        except Exception as _e:
+            dna_log.error(f'failed to release database session, error={_e}')
+
+
+# +
+# function: dna_daemon()
+# -
+# noinspection PyBroadException
+def dna_daemon(_dna_dir=def_dna_night, _dna_ins=def_dna_ins, _dna_iso=def_dna_iso, _dna_json=def_dna_json,
+               _dna_obj=def_dna_obj, _dna_tel=def_dna_tel, _dna_user=def_dna_user, _gmail=False, _journal=False,
+               _duration=DNA_DAEMON_HOURS, _workers=DNA_FITS_WORKERS, _depth=DNA_FITS_DEPTH, _pool=DNA_FITS_POOLS[0],
+               _cache='', _tgz_workers=DNA_TGZ_WORKERS, _tgz_codec=DNA_TGZ_OBJECT, _stream=False):
+    """ watches the data directory (inotify) and processes files as soon as they are closed for writing """
+
+    # entry message
+    dna_logger()
+    dna_log.info(f'dna_daemon(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
+                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}, '
+                 f'duration={_duration}) ... entry')
 
     # +
-    # shut down
+    # set up
     # -
-    dna_log.info(f'writing JSON')
-    with open(f'{_dna_json}', 'w') as _fw:
-        json.dump(dna_json, _fw)
+    try:
+        dna_tgz_codec(_tgz_codec)
+    except ValueError as _e:
+        dna_log.error(f'invalid input, _tgz_codec={_tgz_codec}, error={_e}')
+        return
 
-    dna_log.info(f'disconnect database')
-    if dna_db:
-        dna_disconnect_database(dna_db)
+    if _stream is True and os.getenv('DNA_STREAM_URL', '').strip() == '':
+        dna_log.error(f'invalid input, _stream={_stream} but DNA_STREAM_URL is not set')
+        return
 
-    dna_log.info(f'disconnect gmail')
-    if _gmail and dna_gs:
-        dna_gmail_close(dna_gs)
+    _ctx = dna_open(_dna_dir, _dna_ins, _dna_iso, _dna_json, _dna_obj, _dna_tel, _dna_user, _gmail, _journal)
+    if _ctx is None:
+        return
+
+    if not isinstance(_duration, (int, float)) or _duration <= 0.0:
+        _duration = DNA_DAEMON_HOURS
+
+    _ctx = {**_ctx, 'workers': _workers, 'depth': _depth, 'pool': _pool,
+            'cache': dna_cache_open(_cache), 'tgz_workers': _tgz_workers, 'tgz_codec': _tgz_codec,
+            'stream': _stream is True}
+    if _ctx['stream']:
+        _ctx['tgzs'] = dna_stream_tgzs(_ctx)
+    if _ctx['gmail']:
+        _ctx['worker'] = DnaOutboxWorker(_ctx['outbox'].path, None, log=dna_log)
+        _ctx['worker'].start()
+
+    # stop cleanly on SIGINT or SIGTERM
+    _stop = []
+
+    def _handler(_signum=0, _frame=None):
+        dna_log.info(f'received signal {_signum}, stopping')
+        _stop.append(_signum)
+
+    signal.signal(signal.SIGINT, _handler)
+    signal.signal(signal.SIGTERM, _handler)
+
+    # +
+    # process
+    # -
+    from dna_inotify import DnaInotify, IN_CLOSE_WRITE, IN_CREATE, IN_DELETE_SELF, IN_ISDIR, IN_MOVE_SELF, IN_MOVED_TO
+    _end = time.monotonic() + float(_duration) * 3600.0
+    try:
+        with DnaInotify() as _w:
+            for _d in _w.watch(_ctx['dir'], recursive=True):
+                dna_log.info(f'watching {_d}')
+
+            # catch up on anything written before the watch(es) were added
+            dna_daemon_batch(_ctx, dna_seek(_ctx['dir'], 'fits'))
+
+            while not _stop and time.monotonic() < _end:
+                _files = {}
+                _events = _w.read(timeout=max(0.0, min(DNA_DAEMON_TIMEOUT, _end - time.monotonic())))
+                if _w.overflow:
+                    dna_log.warning(f'inotify queue overflow, re-scanning {_ctx["dir"]}')
+                    _files = dna_seek(_ctx['dir'], 'fits')
+                for _path, _mask in _events:
+                    if _mask & IN_ISDIR and _mask & (IN_CREATE | IN_MOVED_TO):
+                        for _d in _w.watch(_path, recursive=True):
+                            dna_log.info(f'watching {_d}')
+                        _files = {**_files, **dna_seek(_path, 'fits')}
+                    elif _mask & (IN_CLOSE_WRITE | IN_MOVED_TO) and _path.endswith('fits') and \
+                            'stitched' not in _path and not os.path.islink(_path):
+                        try:
+                            _files[_path] = os.stat(_path).st_size
+                        except Exception as _e:
+                            dna_log.warning(f'failed to stat {_path}, error={_e}')
+                    elif _mask & (IN_DELETE_SELF | IN_MOVE_SELF) and _path == _ctx['dir']:
+                        dna_log.error(f'data directory {_path} went away, stopping')
+                        _stop.append(0)
+                dna_daemon_batch(_ctx, _files)
+    except Exception as _e:
+        dna_log.error(f'daemon failed, error={_e}')
+    finally:
+        dna_log.info(f'shutting down')
+        dna_close(_ctx)
 
     # exit message
-    dna_log.info(f'dna(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
-                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}) ... exit')
+    dna_log.info(f'dna_daemon(data={_dna_dir}, json={_dna_json}, instrument={_dna_ins}, iso={_dna_iso}, '
+                 f'object={_dna_obj}, telescope={_dna_tel}, user={_dna_user}, gmail={_gmail}, '
+                 f'duration={_duration}) ... exit')
+
+
+# +
+# function: dna_profiler()
+# -
+def dna_profiler(_profile=False, _memory=False, _name='dna'):
+    """ returns a profiler of the run, written to <_name>.prof beside the logs (see dna_profile.py), or a no-op """
+    if _profile is not True:
+        return contextlib.nullcontext()
+    from dna_profile import dna_profile_path, DnaProfile
+    return DnaProfile(dna_profile_path(_name), _memory is True, log=dna_logger())
 
 
 # +
@@ -714,8 +1085,8 @@ if __name__ == '__main__':
     # noinspection PyTypeChecker
     _p = argparse.ArgumentParser(description=f'ARTN Data Notification Agent',
                                  formatter_class=argparse.RawTextHelpFormatter)
-    _p.add_argument(f'--data', default=f'{def_dna_dir}',
-                    help=f"""Data directory <str>, defaults to %(default)s""")
+    _p.add_argument(f'--data', default='',
+                    help=f"""Data directory <str>, defaults to {def_dna_dir} ({def_dna_night} with --daemon)""")
     _p.add_argument(f'--instrument', default=f'{def_dna_ins}',
                     help=f"""Instrument <str>, defaults to '%(default)s', choices: {INSTRUMENTS}""")
     _p.add_argument(f'--iso', default=f'{def_dna_iso}',
@@ -729,7 +1100,44 @@ if __name__ == '__main__':
     _p.add_argument(f'--user', default=f'{def_dna_user}',
                     help=f"""User <str>, defaults to '%(default)s'""")
     _p.add_argument(f'--gmail', default=False, action='store_true', help=f'if present, gmail owner')
+    _p.add_argument(f'--journal', default=False, action='store_true',
+                    help=f'if present, append to the json file as a JSON-Lines journal')
+    _p.add_argument(f'--incremental', default=False, action='store_true',
+                    help=f'if present, only scan for new or changed files (state in {DNA_SCAN_STATE})')
+    _p.add_argument(f'--daemon', default=False, action='store_true',
+                    help=f'if present, watch the data directory and process files as they are written')
+    _p.add_argument(f'--duration', default=DNA_DAEMON_HOURS,
+                    help=f"""Daemon duration in hours <float>, defaults to %(default)s""")
+    _p.add_argument(f'--workers', default=DNA_FITS_WORKERS,
+                    help=f"""Header reader workers <int>, defaults to %(default)s""")
+    _p.add_argument(f'--depth', default=DNA_FITS_DEPTH,
+                    help=f"""Header reader queue depth <int>, defaults to %(default)s""")
+    _p.add_argument(f'--pool', default=DNA_FITS_POOLS[0],
+                    help=f"""Header reader pool <str>, defaults to '%(default)s', choices: {DNA_FITS_POOLS}""")
+    _p.add_argument(f'--cache', default='',
+                    help=f"""Header cache <str>, defaults to '{dna_cache_path()}', 'none' disables""")
+    _p.add_argument(f'--tgz-workers', default=DNA_TGZ_WORKERS,
+                    help=f"""Concurrent archive(s) <int>, defaults to %(default)s""")
+    _p.add_argument(f'--codec', default=DNA_TGZ_OBJECT,
+                    help=f"""Archive codec <str>[:<level>], defaults to '%(default)s', choices: tar, gz, xz, zstd""")
+    _p.add_argument(f'--stream', default=False, action='store_true',
+                    help=f'if present, link to on-demand archives at $DNA_STREAM_URL (dna_stream.py), build none')
+    _p.add_argument(f'--profile', default=False, action='store_true',
+                    help=f'if present, profile the run (cProfile) into dna.<telescope>.<instrument>.<iso>.prof in '
+                         f'$DNA_LOGS and log the top functions')
+    _p.add_argument(f'--profile-memory', default=False, action='store_true',
+                    help=f'if present (with --profile), also trace memory (tracemalloc) and log the peak')
     args = _p.parse_args()
 
-    # execute
-    dna(args.data, args.instrument, args.iso, args.json, args.object, args.telescope, args.user, bool(args.gmail))
+    # execute (the daemon watches the whole night, calibration sub-directories included)
+    args.data = args.data if args.data.strip() != '' else (def_dna_night if bool(args.daemon) else def_dna_dir)
+    with dna_profiler(bool(args.profile), bool(args.profile_memory),
+                      f'dna.{args.telescope}.{args.instrument}.{args.iso}'):
+        if bool(args.daemon):
+            dna_daemon(args.data, args.instrument, args.iso, args.json, args.object, args.telescope, args.user,
+                       bool(args.gmail), bool(args.journal), float(args.duration), int(args.workers),
+                       int(args.depth), args.pool, args.cache, int(args.tgz_workers), args.codec, bool(args.stream))
+        else:
+            dna(args.data, args.instrument, args.iso, args.json, args.object, args.telescope, args.user,
+                bool(args.gmail), bool(args.journal), bool(args.incremental), int(args.workers), int(args.depth),
+                args.pool, args.cache, int(args.tgz_workers), args.codec, bool(args.stream))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from datetime import datetime
+
+import argparse
+import fcntl
+import logging
+import os
+import threading
+import time
+
+from dna import dna, dna_log, dna_logger, def_dna_iso, DNA_TIMEZONE, SUPPORTED
+from dna_cache import dna_cache_path
+from dna_fits import DNA_FITS_DEPTH, DNA_FITS_POOLS, DNA_FITS_WORKERS
+from dna_metrics import DnaMetrics
+from dna_outbox import dna_outbox_drain, dna_outbox_path
+from dna_tgz import DNA_TGZ_OBJECT, DNA_TGZ_WORKERS
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    % python3 dna_all.py --gmail
+
+    Runs dna.py for every telescope/instrument in SUPPORTED (or --telescopes) in one process instead of one cron
+    chain each: imports, the database engine (connection pool) and the gmail session are set up once. Each
+    instrument runs in its own thread, with its own database session, and is isolated from the others: it is
+    skipped if its night does not exist or a previous run still holds its lock, an exception is logged and
+    does not stop the rest, and one still running after --timeout seconds is abandoned (the process exits).
+    Gmail(s) queued by all instruments are sent over one session once they have finished.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_ALL_DATA = '/rts2data'
+DNA_ALL_JSON = '.dna.json'
+DNA_ALL_TIMEOUT = 270.0
+
+
+# +
+# logging
+# -
+class DnaAllFilter(logging.Filter):
+    """ prefixes messages logged from an instrument thread with <telescope>.<instrument> """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if threading.current_thread() is not threading.main_thread() and \
+                not f'{record.msg}'.startswith(f'[{record.threadName}]'):
+            record.msg = f'[{record.threadName}] {record.msg}'
+        return True
+
+
+# +
+# function: dna_all_one()
+# -
+# noinspection PyBroadException
+def dna_all_one(_tel: str = '', _ins: str = '', _iso: str = '', _data: str = DNA_ALL_DATA, _json: str = DNA_ALL_JSON,
+                _kwargs: dict = None, _results: dict = None) -> None:
+    """ runs dna() for one telescope/instrument night under its lock and records the outcome in _results """
+
+    _key, _t0 = f'{_tel}.{_ins}', time.monotonic()
+    _night = os.path.join(_data, _tel, _ins, _iso)
+    if not os.path.isdir(_night):
+        dna_log.info(f'no data for {_key} in {_night}, skipping')
+        _results[_key] = 'skipped'
+        return
+
+    _ledger = os.path.join(_night, _json)
+    _lock = os.path.join(os.path.dirname(dna_outbox_path()), f'.dna.{_key}.lock')
+    try:
+        with open(_lock, 'w') as _fl:
+            try:
+                fcntl.flock(_fl, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                dna_log.warning(f'{_key} is still running, skipping')
+                _results[_key] = 'busy'
+                return
+            if not os.path.exists(_ledger):
+                open(_ledger, 'a').close()
+            dna(_night, _ins, _iso, _ledger, _dna_tel=_tel, **(_kwargs or {}))
+            _midnight = DNA_TIMEZONE.localize(datetime.strptime(_iso, '%Y%m%d')).timestamp()
+            os.utime(_ledger, (_midnight, _midnight))
+        _results[_key] = 'done'
+    except Exception as _e:
+        dna_log.error(f'{_key} failed, error={_e}')
+        _results[_key] = 'failed'
+    finally:
+        dna_log.info(f'{_key} {_results.get(_key, "failed")} in {time.monotonic() - _t0:.2f}s')
+
+
+# +
+# function: dna_all()
+# -
+# noinspection PyBroadException
+def dna_all(_iso: str = def_dna_iso, _data: str = DNA_ALL_DATA, _json: str = DNA_ALL_JSON, _telescopes: str = '',
+            _gmail: bool = False, _journal: bool = False, _incremental: bool = False, _workers: int = DNA_FITS_WORKERS,
+            _depth: int = DNA_FITS_DEPTH, _pool: str = DNA_FITS_POOLS[0], _cache: str = '',
+            _tgz_workers: int = DNA_TGZ_WORKERS, _tgz_codec: str = DNA_TGZ_OBJECT, _stream: bool = False,
+            _timeout: float = DNA_ALL_TIMEOUT) -> dict:
+    """ runs every supported telescope/instrument concurrently and returns {<tel>.<ins>: outcome} """
+
+    # entry message
+    dna_logger()
+    dna_log.info(f'dna_all(iso={_iso}, data={_data}, telescopes={_telescopes}, gmail={_gmail}, '
+                 f'timeout={_timeout}) ... entry')
+
+    _wanted = [_t.strip() for _t in f'{_telescopes}'.split(',') if _t.strip() != '']
+    _pairs = [(_t, _i) for _t, _v in SUPPORTED.items() for _i in _v if not _wanted or _t in _wanted]
+    _kwargs = {'_gmail': _gmail, '_journal': _journal, '_incremental': _incremental, '_workers': _workers,
+               '_depth': _depth, '_pool': _pool, '_cache': _cache, '_tgz_workers': _tgz_workers,
+               '_tgz_codec': _tgz_codec, '_stream': _stream, '_drain': False}
+
+    # one thread per instrument, abandoned (daemon) if still running at the deadline
+    _metrics = DnaMetrics('dna_all', {'iso': _iso}, dna_log)
+    _filter = DnaAllFilter()
+    dna_log.addFilter(_filter)
+    _results, _threads = {}, []
+    try:
+        for _t, _i in _pairs:
+            _th = threading.Thread(target=dna_all_one, name=f'{_t}.{_i}', daemon=True,
+                                   args=(_t, _i, f'{_iso}', _data, _json, _kwargs, _results))
+            _th.start()
+            _threads.append(_th)
+        _end = time.monotonic() + float(_timeout)
+        for _th in _threads:
+            _th.join(max(0.0, _end - time.monotonic()))
+            if _th.is_alive():
+                dna_log.error(f'{_th.name} still running after {_timeout}s, abandoning it')
+                _results[_th.name] = 'timeout'
+    finally:
+        dna_log.removeFilter(_filter)
+
+    # one gmail session for everything queued
+    if _gmail:
+        try:
+            with _metrics.timer('gmail'):
+                _drained = dna_outbox_drain(dna_outbox_path(), None, 0, dna_log)
+            for _k, _v in _drained.items():
+                _metrics.count(f'gmails_{_k}', _v)
+        except Exception as _e:
+            dna_log.error(f'failed to drain gmail outbox, error={_e}')
+
+    # one metric per outcome (every instrument also exports its own run)
+    for _v in list(_results.values()):
+        _metrics.count(f'instruments_{_v}')
+    _metrics.export()
+
+    # exit message
+    dna_log.info(f'dna_all(iso={_iso}, data={_data}, telescopes={_telescopes}, gmail={_gmail}, '
+                 f'timeout={_timeout}) ... exit, {_results}')
+    return _results
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    # noinspection PyTypeChecker
+    _p = argparse.ArgumentParser(description=f'ARTN Data Notification Agent (all telescopes)',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--iso', default=f'{def_dna_iso}', help=f"""ISO date <yyyymmdd>, defaults to %(default)s""")
+    _p.add_argument(f'--data', default=DNA_ALL_DATA, help=f"""Data root <str>, defaults to %(default)s""")
+    _p.add_argument(f'--json', default=DNA_ALL_JSON,
+                    help=f"""DNA json file name in each night <str>, defaults to %(default)s""")
+    _p.add_argument(f'--telescopes', default='',
+                    help=f"""Comma separated telescope(s) <str>, defaults to all of {list(SUPPORTED)}""")
+    _p.add_argument(f'--gmail', default=False, action='store_true', help=f'if present, gmail owner')
+    _p.add_argument(f'--journal', default=False, action='store_true',
+                    help=f'if present, append to the json file as a JSON-Lines journal')
+    _p.add_argument(f'--incremental', default=False, action='store_true',
+                    help=f'if present, only scan for new or changed files')
+    _p.add_argument(f'--workers', default=DNA_FITS_WORKERS,
+                    help=f"""Header reader workers <int> per instrument, defaults to %(default)s""")
+    _p.add_argument(f'--depth', default=DNA_FITS_DEPTH,
+                    help=f"""Header reader queue depth <int>, defaults to %(default)s""")
+    _p.add_argument(f'--pool', default=DNA_FITS_POOLS[0],
+                    help=f"""Header reader pool <str>, defaults to '%(default)s', choices: {DNA_FITS_POOLS}""")
+    _p.add_argument(f'--cache', default='',
+                    help=f"""Header cache <str>, defaults to '{dna_cache_path()}', 'none' disables""")
+    _p.add_argument(f'--tgz-workers', default=DNA_TGZ_WORKERS,
+                    help=f"""Concurrent archive(s) <int> per instrument, defaults to %(default)s""")
+    _p.add_argument(f'--codec', default=DNA_TGZ_OBJECT,
+                    help=f"""Archive codec <str>[:<level>], defaults to '%(default)s', choices: tar, gz, xz, zstd""")
+    _p.add_argument(f'--stream', default=False, action='store_true',
+                    help=f'if present, link to on-demand archives at $DNA_STREAM_URL (dna_stream.py), build none')
+    _p.add_argument(f'--timeout', default=DNA_ALL_TIMEOUT,
+                    help=f"""Seconds before a still running instrument is abandoned <float>, defaults to %(default)s""")
+    _a = _p.parse_args()
+
+    # execute
+    dna_all(_iso=_a.iso, _data=_a.data, _json=_a.json, _telescopes=_a.telescopes, _gmail=bool(_a.gmail),
+            _journal=bool(_a.journal), _incremental=bool(_a.incremental), _workers=int(_a.workers),
+            _depth=int(_a.depth), _pool=_a.pool, _cache=_a.cache, _tgz_workers=int(_a.tgz_workers),
+            _tgz_codec=_a.codec, _stream=bool(_a.stream), _timeout=float(_a.timeout))
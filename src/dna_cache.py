@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from typing import Optional
+
+import json
+import os
+import sqlite3
+import time
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_cache import dna_cache_path, DnaHeaderCache
+    with DnaHeaderCache(dna_cache_path()) as _c:
+        _hdr = _c.get(_file, _st.st_size, _st.st_mtime_ns, ('ARTNOID', 'TARGET'))
+        if _hdr is None:
+            _hdr = dna_fits_header(_file, ('ARTNOID', 'TARGET'))
+            _c.put(_file, _st.st_size, _st.st_mtime_ns, ('ARTNOID', 'TARGET'), _hdr)
+
+    Invalidation: an entry is only used if the file's size and mtime (ns) are exactly those recorded and the
+    requested keywords were all asked for when it was stored; otherwise it is a miss and is overwritten.
+    Eviction (on close): entries not used for max_age days are removed, then the least recently used entries
+    beyond max_rows, so one cache file can be shared across nights. By default it is: dna_cache_path() is
+    .dna.cache.sqlite in $DNA_LOGS (beside the gmail outbox), shared by every night, telescope and instrument.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_CACHE_DIR = os.getenv('DNA_LOGS', '/var/www/ARTN-DNA/logs')
+DNA_CACHE_FILE = '.dna.cache.sqlite'
+DNA_CACHE_MAX_AGE = 30.0
+DNA_CACHE_MAX_ROWS = 200000
+DNA_CACHE_TIMEOUT = 30.0
+
+
+# +
+# function: dna_cache_path()
+# -
+def dna_cache_path(_dir: str = DNA_CACHE_DIR) -> str:
+    """ returns the shared cache in the logs directory (or the current directory if that is not writable) """
+    _dir = os.path.abspath(os.path.expanduser(f'{_dir}'))
+    if not os.path.isdir(_dir) or not os.access(_dir, os.W_OK):
+        _dir = os.getcwd()
+    return os.path.join(_dir, DNA_CACHE_FILE)
+
+
+# +
+# class: DnaHeaderCache() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaHeaderCache(object):
+    """ on-disk FITS header cache keyed by (path, size, mtime) """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', max_age: float = DNA_CACHE_MAX_AGE, max_rows: int = DNA_CACHE_MAX_ROWS):
+
+        # get argument(s)
+        self.path = path
+        self.max_age = max_age
+        self.max_rows = max_rows
+
+        # private variable(s)
+        self.__db = None
+        self.__hits = 0
+        self.__misses = 0
+        self.__accessed = {}
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}')) if \
+            (isinstance(path, str) and path.strip() != '') else ''
+
+    @property
+    def max_age(self):
+        return self.__max_age
+
+    @max_age.setter
+    def max_age(self, max_age: float = DNA_CACHE_MAX_AGE):
+        self.__max_age = float(max_age) if (isinstance(max_age, (int, float)) and max_age > 0) else DNA_CACHE_MAX_AGE
+
+    @property
+    def max_rows(self):
+        return self.__max_rows
+
+    @max_rows.setter
+    def max_rows(self, max_rows: int = DNA_CACHE_MAX_ROWS):
+        self.__max_rows = int(max_rows) if (isinstance(max_rows, int) and max_rows > 0) else DNA_CACHE_MAX_ROWS
+
+    @property
+    def hits(self):
+        return self.__hits
+
+    @property
+    def misses(self):
+        return self.__misses
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: open()
+    # -
+    def open(self) -> None:
+        """ opens (and if necessary creates) the cache """
+        if self.__db is not None:
+            return
+        self.__db = sqlite3.connect(self.__path, timeout=DNA_CACHE_TIMEOUT)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS headers (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, '
+                          'keys TEXT, header TEXT, created REAL, accessed REAL)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS headers_accessed ON headers (accessed)')
+        self.__db.commit()
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ records access times, evicts old entries and closes the cache """
+        if self.__db is None:
+            return
+        try:
+            self.flush()
+            self.evict()
+        finally:
+            self.__db.close()
+            self.__db = None
+
+    # +
+    # method: flush()
+    # -
+    def flush(self) -> None:
+        """ writes pending access times """
+        if self.__db is None:
+            return
+        if self.__accessed:
+            self.__db.executemany('UPDATE headers SET accessed=? WHERE path=?',
+                                  [(_t, _p) for _p, _t in self.__accessed.items()])
+            self.__accessed = {}
+        self.__db.commit()
+
+    # +
+    # method: evict()
+    # -
+    def evict(self) -> int:
+        """ removes entries older than max_age days and least recently used entries beyond max_rows """
+        if self.__db is None:
+            return 0
+        _n = self.__db.execute('DELETE FROM headers WHERE accessed < ?',
+                               (time.time() - self.__max_age * 86400.0,)).rowcount
+        _n += self.__db.execute('DELETE FROM headers WHERE path IN (SELECT path FROM headers ORDER BY accessed DESC '
+                                'LIMIT -1 OFFSET ?)', (self.__max_rows,)).rowcount
+        self.__db.commit()
+        return _n
+
+    # +
+    # method: get()
+    # -
+    def get(self, _file: str = '', _size: int = -1, _mtime: int = -1, _keys: tuple = None) -> Optional[dict]:
+        """ returns the cached header of _file or None if absent or stale """
+        self.open()
+        _row = self.__db.execute('SELECT size, mtime, keys, header FROM headers WHERE path=?', (f'{_file}',)).fetchone()
+        if _row is None or _row[0] != int(_size) or _row[1] != int(_mtime):
+            self.__misses += 1
+            return None
+        _cached = json.loads(_row[2])
+        if _cached is not None and (_keys is None or not {f'{_k}'.upper() for _k in _keys}.issubset(_cached)):
+            self.__misses += 1
+            return None
+        self.__hits += 1
+        self.__accessed[f'{_file}'] = time.time()
+        return json.loads(_row[3])
+
+    # +
+    # method: put()
+    # -
+    def put(self, _file: str = '', _size: int = -1, _mtime: int = -1, _keys: tuple = None, _hdr: dict = None) -> None:
+        """ stores the header of _file (replacing any stale entry) """
+        self.open()
+        _now = time.time()
+        _cached = None if _keys is None else sorted({f'{_k}'.upper() for _k in _keys})
+        self.__db.execute('INSERT OR REPLACE INTO headers (path, size, mtime, keys, header, created, accessed) '
+                          'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                          (f'{_file}', int(_size), int(_mtime), json.dumps(_cached), json.dumps(_hdr), _now, _now))
+        self.__accessed.pop(f'{_file}', None)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
+import collections
+import multiprocessing
+import os
+import re
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_fits import dna_fits_header
+    _hdr = dna_fits_header('/rts2data/Kuiper/Mont4k/20200414/object/frame.fits', ('ARTNOID', 'TARGET'))
+
+    Reads the primary header one 2880-byte block at a time, stopping at the END card (or as soon as every
+    requested keyword has been seen), and parses only the requested cards. Values are converted the way
+    astropy.io.fits does it: str (trailing blanks removed, '' unescaped, CONTINUE cards joined), bool, int,
+    float or complex. Undefined values are returned as None.
+
+    for _file, _hdr in dna_fits_headers(_files, ('ARTNOID', 'TARGET'), workers=8, depth=32):
+        ...
+
+    Reads headers on a bounded thread (or process) pool and yields (file, header) in the order of _files; a
+    failed read yields the exception instead of the header. At most depth reads are outstanding at any time.
+    If cache is a dna_cache.DnaHeaderCache, it is consulted (and updated) in the calling thread, so unchanged
+    files are not opened at all.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_FITS_BLOCK = 2880
+DNA_FITS_CARD = 80
+DNA_FITS_CARDS = DNA_FITS_BLOCK // DNA_FITS_CARD
+DNA_FITS_CONTEXT = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+DNA_FITS_DEPTH = 16
+DNA_FITS_POOLS = ['thread', 'process']
+DNA_FITS_WORKERS = 4
+DNA_FITS_INT = re.compile(r'^[+-]?\d+$')
+DNA_FITS_FLOAT = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([EeDd][+-]?\d+)?$')
+DNA_FITS_COMPLEX = re.compile(r'^\(\s*([^,]+?)\s*,\s*([^)]+?)\s*\)$')
+
+
+# +
+# function: dna_fits_value()
+# -
+def dna_fits_value(_field: str = '') -> Any:
+    """ returns the value of a card value field (the 70 characters after '= ') """
+    _f = _field.lstrip()
+    if _f.startswith("'"):
+        _i, _s = 1, ''
+        while _i < len(_f):
+            if _f[_i] == "'":
+                if _i + 1 < len(_f) and _f[_i + 1] == "'":
+                    _s, _i = _s + "'", _i + 2
+                    continue
+                break
+            _s, _i = _s + _f[_i], _i + 1
+        return _s.rstrip()
+    _f = _f.split('/', 1)[0].strip()
+    if _f == '':
+        return None
+    if _f in ('T', 'F'):
+        return _f == 'T'
+    if DNA_FITS_INT.match(_f):
+        return int(_f)
+    if DNA_FITS_FLOAT.match(_f):
+        return float(_f.upper().replace('D', 'E'))
+    _m = DNA_FITS_COMPLEX.match(_f)
+    if _m:
+        return complex(float(_m.group(1).upper().replace('D', 'E')), float(_m.group(2).upper().replace('D', 'E')))
+    raise ValueError(f'unparsable value {_f!r}')
+
+
+# +
+# function: dna_fits_header()
+# -
+def dna_fits_header(_file: str = '', _keys: tuple = None) -> dict:
+    """ returns {keyword: value} for the requested keywords (or all) in the primary header of _file """
+
+    _want = None if _keys is None else {f'{_k}'.upper() for _k in _keys}
+    _cards, _done = {}, False
+    with open(os.path.abspath(os.path.expanduser(f'{_file}')), 'rb', buffering=0) as _fr:
+        _block = _fr.read(DNA_FITS_BLOCK)
+        if len(_block) < DNA_FITS_BLOCK or not _block.startswith(b'SIMPLE  ='):
+            raise ValueError(f'not a FITS file, {_file}')
+        _last = None
+        while not _done:
+            _text = _block.decode('ascii', errors='replace')
+            for _i in range(DNA_FITS_CARDS):
+                _card = _text[_i * DNA_FITS_CARD:(_i + 1) * DNA_FITS_CARD]
+                _key = _card[:8].strip().upper()
+                if _key == 'END':
+                    _done = True
+                    break
+
+                # long string continuation of the previous (wanted) card
+                if _key == 'CONTINUE' and _last is not None:
+                    _v = dna_fits_value(_card[8:])
+                    _cards[_last] = _cards[_last][:-1] + (_v if isinstance(_v, str) else '')
+                    _last = _last if _cards[_last].endswith('&') else None
+                    continue
+                _last = None
+
+                # keep the first occurrence only (like astropy)
+                if _card[8:10] != '= ' or _key in _cards or (_want is not None and _key not in _want):
+                    continue
+                _cards[_key] = dna_fits_value(_card[10:])
+                if isinstance(_cards[_key], str) and _cards[_key].endswith('&'):
+                    _last = _key
+                elif _want is not None and len(_cards) == len(_want):
+                    _done = True
+                    break
+            if not _done:
+                _block = _fr.read(DNA_FITS_BLOCK)
+                if len(_block) < DNA_FITS_BLOCK:
+                    raise ValueError(f'header has no END card, {_file}')
+    return _cards
+
+
+# +
+# function: dna_fits_headers()
+# -
+# noinspection PyBroadException
+def dna_fits_headers(_files: list = None, _keys: tuple = None, workers: int = DNA_FITS_WORKERS,
+                     depth: int = DNA_FITS_DEPTH, pool: str = DNA_FITS_POOLS[0], cache: Any = None):
+    """ yields (file, header or exception) for _files, in order, reading headers concurrently """
+
+    _files = list(_files or [])
+    workers = workers if (isinstance(workers, int) and workers > 0) else DNA_FITS_WORKERS
+    depth = max(depth, workers) if (isinstance(depth, int) and depth > 0) else max(DNA_FITS_DEPTH, workers)
+
+    # serial (or pool) read of one file, consulting the cache first (in this thread only)
+    def _read(_file: str = '', _x: Any = None) -> tuple:
+        _st = None
+        if cache is not None:
+            try:
+                _st = os.stat(_file)
+                _hdr = cache.get(_file, _st.st_size, _st.st_mtime_ns, _keys)
+                if _hdr is not None:
+                    return _file, None, _hdr
+            except Exception:
+                _st = None
+        if _x is None:
+            try:
+                return _file, _st, dna_fits_header(_file, _keys)
+            except Exception as _e:
+                return _file, _st, _e
+        return _file, _st, _x.submit(dna_fits_header, _file, _keys)
+
+    def _result(_file: str = '', _st: Any = None, _r: Any = None) -> tuple:
+        if not isinstance(_r, (dict, Exception)):
+            try:
+                _r = _r.result()
+            except Exception as _e:
+                _r = _e
+        if _st is not None and isinstance(_r, dict):
+            try:
+                cache.put(_file, _st.st_size, _st.st_mtime_ns, _keys, _r)
+            except Exception:
+                pass
+        return _file, _r
+
+    # serial
+    if workers == 1 or len(_files) <= 1:
+        for _file in _files:
+            yield _result(*_read(_file))
+        return
+
+    # bounded window of outstanding reads, drained from the head so results stay in order
+    # (a process pool never fork()s, the caller may be one of several dna_all.py threads)
+    with (ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(DNA_FITS_CONTEXT))
+          if pool == 'process' else ThreadPoolExecutor(max_workers=workers)) as _x:
+        _window, _it = collections.deque(), iter(_files)
+        for _file in _it:
+            _window.append(_read(_file, _x))
+            if len(_window) >= depth:
+                break
+        while _window:
+            _entry = _window.popleft()
+            _next = next(_it, None)
+            if _next is not None:
+                _window.append(_read(_next, _x))
+            yield _result(*_entry)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_inotify import DnaInotify, IN_CLOSE_WRITE
+    with DnaInotify() as _w:
+        _w.watch('/rts2data/Kuiper/Mont4k/20200414', recursive=True)
+        for _path, _mask in _w.read(timeout=5.0):
+            if _mask & IN_CLOSE_WRITE:
+                ...
+
+    Linux inotify(7) via ctypes so the daemon has no extra dependency.
+"""
+
+
+# +
+# constant(s) from <sys/inotify.h>
+# -
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_CLOSE_NOWRITE = 0x00000010
+IN_OPEN = 0x00000020
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o00004000
+IN_CLOEXEC = 0o02000000
+
+DNA_INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+DNA_INOTIFY_EVENT = struct.Struct('iIII')
+DNA_INOTIFY_READ = 65536
+
+
+# +
+# class: DnaInotify() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaInotify(object):
+    """ minimal recursive inotify watcher """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, mask: int = DNA_INOTIFY_MASK, exclude: tuple = ('stitched',)):
+
+        # get argument(s)
+        self.mask = mask
+        self.exclude = exclude
+
+        # private variable(s)
+        self.__libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.__fd = self.__libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.__fd < 0:
+            _errno = ctypes.get_errno()
+            raise OSError(_errno, f'inotify_init1() failed, {os.strerror(_errno)}')
+        self.__wds = {}
+        self.__overflow = False
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def mask(self):
+        return self.__mask
+
+    @mask.setter
+    def mask(self, mask: int = DNA_INOTIFY_MASK):
+        self.__mask = mask if (isinstance(mask, int) and mask > 0) else DNA_INOTIFY_MASK
+
+    @property
+    def exclude(self):
+        return self.__exclude
+
+    @exclude.setter
+    def exclude(self, exclude: tuple = ('stitched',)):
+        self.__exclude = tuple(exclude) if isinstance(exclude, (list, tuple)) else ()
+
+    @property
+    def overflow(self):
+        return self.__overflow
+
+    @property
+    def watched(self):
+        return sorted(self.__wds.values())
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ closes the inotify file descriptor """
+        if self.__fd is not None and self.__fd >= 0:
+            os.close(self.__fd)
+        self.__fd, self.__wds = None, {}
+
+    # +
+    # method: watch()
+    # -
+    def watch(self, _path: str = '', recursive: bool = True) -> list:
+        """ adds a watch on _path (and, optionally, every sub-directory) and returns the directories added """
+        _added = []
+        _path = os.path.abspath(os.path.expanduser(f'{_path}'))
+        if any(_x in _path for _x in self.__exclude) or not os.path.isdir(_path):
+            return _added
+        _wd = self.__libc.inotify_add_watch(self.__fd, _path.encode(), self.__mask | IN_ONLYDIR)
+        if _wd < 0:
+            _errno = ctypes.get_errno()
+            raise OSError(_errno, f'inotify_add_watch({_path}) failed, {os.strerror(_errno)}')
+        if _wd not in self.__wds:
+            _added.append(_path)
+        self.__wds[_wd] = _path
+        if recursive:
+            try:
+                with os.scandir(_path) as _it:
+                    for _entry in _it:
+                        if _entry.is_dir(follow_symlinks=False):
+                            _added += self.watch(_entry.path, recursive)
+            except Exception:
+                pass
+        return _added
+
+    # +
+    # method: read()
+    # -
+    def read(self, timeout: float = None) -> list:
+        """ returns a list of (path, mask) events, waiting up to timeout seconds (None = forever) """
+        _events = []
+        self.__overflow = False
+        try:
+            _r, _, _ = select.select([self.__fd], [], [], timeout)
+        except InterruptedError:
+            return _events
+        if not _r:
+            return _events
+        try:
+            _buf = os.read(self.__fd, DNA_INOTIFY_READ)
+        except BlockingIOError:
+            return _events
+        except OSError as _e:
+            if _e.errno == errno.EINTR:
+                return _events
+            raise
+        _i = 0
+        while _i + DNA_INOTIFY_EVENT.size <= len(_buf):
+            _wd, _mask, _cookie, _len = DNA_INOTIFY_EVENT.unpack_from(_buf, _i)
+            _name = _buf[_i + DNA_INOTIFY_EVENT.size:_i + DNA_INOTIFY_EVENT.size + _len].rstrip(b'\0').decode(
+                errors='surrogateescape')
+            _i += DNA_INOTIFY_EVENT.size + _len
+            if _mask & IN_Q_OVERFLOW:
+                self.__overflow = True
+                continue
+            _dir = self.__wds.get(_wd, None)
+            if _mask & IN_IGNORED:
+                self.__wds.pop(_wd, None)
+                continue
+            if _dir is None:
+                continue
+            _events.append((os.path.join(_dir, _name) if _name else _dir, _mask))
+        return _events
@@ -4,12 +4,17 @@
 # +
 # import(s)
 # -
-from astropy.io import fits
 from datetime import datetime
 from datetime import timedelta
+from dna_cache import dna_cache_path, DnaHeaderCache
+from dna_fits import dna_fits_headers, DNA_FITS_DEPTH, DNA_FITS_POOLS, DNA_FITS_WORKERS
+from dna_mail import DnaMailer
+from dna_metrics import DnaMetrics
+from dna_profile import dna_profile_path, DnaProfile
+from dna_outbox import dna_outbox_drain, dna_outbox_path, DnaOutbox
+from dna_tgz import dna_tgz_builds, dna_tgz_name, dna_tgz_version
+from dna_tgz import DNA_TGZ_CALIBRATION, DNA_TGZ_OBJECT, DNA_TGZ_WORKERS
 from PsqlConnection import *
-from typing import Any
-from typing import Optional
 
 import argparse
 import logging
@@ -17,8 +22,7 @@ import logging.config
 import os
 import pytz
 import re
-import smtplib
-import tarfile
+import time
 
 
 # +
@@ -153,50 +157,6 @@ DEF_DNA_ISO = int(datetime.now(tz=DNA_TIMEZONE).isoformat().split('T')[0].replac
 DEF_DNA_PATH = f'/rts2data/Kuiper/Mont4k/{DEF_DNA_ISO}'
 DEF_AUTHORIZATION = "artn:********"
 
-# +
-# function: dna_gmail_close()
-# -
-# noinspection PyBroadException
-def dna_gmail_close(_s: smtplib.SMTP = None) -> None:
-    try:
-        _s.quit()
-    except Exception as _:
-        dna_log.error(f"failed to disconnect from gmail, error='{_}'")
-
-
-# +
-# function: dna_gmail_open()
-# -
-# noinspection PyBroadException
-def dna_gmail_open() -> Optional[smtplib.SMTP]:
-    try:
-        _s = smtplib.SMTP(DNA_GMAIL_HOST, DNA_GMAIL_PORT)
-        _s.ehlo()
-        _s.starttls()
-        _s.login(DNA_GMAIL_USER, DNA_GMAIL_PASS)
-        return _s
-    except Exception as _:
-        dna_log.error(f"failed to open gmail, error='{_}'")
-
-
-# +
-# function: dna_gmail_send()
-# -
-# noinspection PyBroadException
-def dna_gmail_send(_s: smtplib.SMTP = None, _to: list = None, _from: str = '', _subject: str = '', _text: str = '') -> bool:
-    if _s is None or _to is None or _to is [] or _from.strip() == '' or _subject.strip() == '' or _text.strip() == '':
-        dna_log.error(f"invalid input(s), _s={_s}, _to={_to}, _from='{_from}', _subject='{_subject}', _text='{_text}'")
-        return
-    try:
-        _tos = ', '.join([_n for _n in _to])
-        _body = '\r\n'.join([f'To: {_tos}', f'From: {DNA_GMAIL_USER}', f'Subject: {_subject}', '',  f'{_text}'])
-        _s.sendmail(DNA_GMAIL_USER, _to, _body)
-        return True
-    except Exception as _:
-        dna_log.error(f"failed to send gmail, error='{_}'")
-        return False
-
-
 # +
 # function: dna_seek()
 # -
@@ -226,10 +186,15 @@ def dna_seek(_path: str = '', _type: str = '') -> dict:
 # function: dna_kuiper()
 # -
 # noinspection PyBroadException
-def dna_kuiper(_path: str = DEF_DNA_PATH, _iso: int = DEF_DNA_ISO, _authorization: str = DEF_AUTHORIZATION, _gmail: bool = False) -> None:
+def dna_kuiper(_path: str = DEF_DNA_PATH, _iso: int = DEF_DNA_ISO, _authorization: str = DEF_AUTHORIZATION, _gmail: bool = False,
+               _workers: int = DNA_FITS_WORKERS, _depth: int = DNA_FITS_DEPTH, _pool: str = DNA_FITS_POOLS[0],
+               _cache: str = '', _tgz_workers: int = DNA_TGZ_WORKERS, _calibration: str = DNA_TGZ_CALIBRATION,
+               _object: str = DNA_TGZ_OBJECT) -> None:
 
     # entry message
-    dna_log.info(f"dna(_path='{_path}', _iso={_iso}, _authorization='{_authorization}', _gmail={_gmail})")
+    dna_log.info(f"dna(_path='{_path}', _iso={_iso}, _authorization='{_authorization}', _gmail={_gmail}, "
+                 f"_workers={_workers}, _depth={_depth}, _pool='{_pool}', _cache='{_cache}', _tgz_workers={_tgz_workers}, "
+                 f"_calibration='{_calibration}', _object='{_object}')")
 
     # check input(s)
     _path = os.path.abspath(os.path.expanduser(f'{_path}'))
@@ -238,56 +203,44 @@ def dna_kuiper(_path: str = DEF_DNA_PATH, _iso: int = DEF_DNA_ISO, _authorizatio
         return
 
     # search path
-    _data = dna_seek(_path, 'fits')
+    dna_metrics = DnaMetrics('dna_kuiper', {'telescope': 'Kuiper', 'instrument': 'Mont4k', 'iso': _iso}, dna_log)
+    with dna_metrics.timer('scan'):
+        _data = dna_seek(_path, 'fits')
+    dna_metrics.count('files_scanned', len(_data or {}))
     if _data is None or _data is {}:
         dna_log.info(f'no files found for processing')
+        dna_metrics.export()
         return
 
-    # create calibration tarball(s)
+    # create calibration tarball(s) concurrently
     darks = [_ for _ in _data if 'dark' in _]
-    darks_tgz = os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.darks.tgz")))
-    if not os.path.isfile(darks_tgz):
-        dna_log.info(f'creating {darks_tgz}')
-        with tarfile.open(f'{darks_tgz}', mode='w:gz') as _wf:
-            for _e in darks:
-                dna_log.info(f'adding {_e} to {darks_tgz}')
-                _wf.add(f'{_e}')
-    os.chown(f'{darks_tgz}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
-
+    darks_tgz = dna_tgz_name(os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.darks.tgz"))), _calibration)
     flats = [_ for _ in _data if 'flat' in _]
-    flats_tgz = os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.flats.tgz")))
-    if not os.path.isfile(flats_tgz):
-        dna_log.info(f'creating {flats_tgz}')
-        with tarfile.open(f'{flats_tgz}', mode='w:gz') as _wf:
-            for _e in flats:
-                dna_log.info(f'adding {_e} to {flats_tgz}')
-                _wf.add(f'{_e}')
-    os.chown(f'{flats_tgz}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
-
+    flats_tgz = dna_tgz_name(os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.flats.tgz"))), _calibration)
     foci = [_ for _ in _data if 'focus' in _]
-    foci_tgz = os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.foci.tgz")))
-    if not os.path.isfile(foci_tgz):
-        dna_log.info(f'creating {foci_tgz}')
-        with tarfile.open(f'{foci_tgz}', mode='w:gz') as _wf:
-            for _e in foci:
-                dna_log.info(f'adding {_e} to {foci_tgz}')
-                _wf.add(f'{_e}')
-    os.chown(f'{foci_tgz}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
+    foci_tgz = dna_tgz_name(os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.foci.tgz"))), _calibration)
+    with dna_metrics.timer('tgz'):
+        dna_metrics.tgz(dna_tgz_builds({_k: _v for _k, _v in ((darks_tgz, darks), (flats_tgz, flats), (foci_tgz, foci))},
+                                       workers=_tgz_workers, log=dna_log, codec=_calibration))
 
     # get ARTNOID and OBJECT from fits files
     emails, oids, names, usernames = {}, {}, {}, {}
     objects = [_ for _ in _data if 'object' in _]
-    for _i, _e in enumerate(objects):
+    _cache = None if _cache.strip().lower() == 'none' else \
+        DnaHeaderCache(_cache.strip() if _cache.strip() != '' else dna_cache_path())
+    _t0 = time.monotonic()
+    _hdrs = dna_fits_headers(objects, ('ARTNOID', 'OBJECT'), workers=_workers, depth=_depth, pool=_pool, cache=_cache)
+    for _i, (_e, _hdr) in enumerate(_hdrs):
         dna_log.info(f"processing '{_e}', _i={_i}")
         try:
-            _hdulist = fits.open(f'{_e}')
-            _oid = f"{_hdulist[0].header['ARTNOID']}"
-            _nam = f"{_hdulist[0].header['OBJECT']}"
+            if isinstance(_hdr, Exception):
+                raise _hdr
+            _oid = f"{_hdr['ARTNOID']}"
+            _nam = f"{_hdr['OBJECT']}"
         except Exception as _e1:
             dna_log.error(f"failed to get fits header, error='{_e1}'")
             continue
         else:
-            _hdulist.close()
             dna_log.info(f"processing '{_e}', _i={_i}, _oid='{_oid[:8]}', _nam='{_nam}'")
             if _oid not in oids:
                 oids[_oid] = [_e]
@@ -295,71 +248,98 @@ def dna_kuiper(_path: str = DEF_DNA_PATH, _iso: int = DEF_DNA_ISO, _authorizatio
                 oids[_oid].append(_e)
             if _oid not in names:
                 names[_oid] = _nam
+    dna_metrics.observe('headers', time.monotonic() - _t0)
+    dna_metrics.count('headers_read', len(objects))
+    if _cache is not None:
+        dna_metrics.count('header_cache_hits', _cache.hits)
+        dna_metrics.count('header_cache_misses', _cache.misses)
+        try:
+            dna_log.info(f"closing header cache '{_cache.path}', hits={_cache.hits}, misses={_cache.misses}")
+            _cache.close()
+        except Exception as _e3:
+            dna_log.error(f"failed to close header cache, error='{_e3}'")
 
-    # connect to database
-    _db = None
+    # check out a (pooled) database connection
     try:
-        _db = PsqlConnection(database='artn', authorization=_authorization, server='localhost', port=5432)
-        _db.connect()
+        with psql_pool(database=DB_NAME, authorization=_authorization, server=DB_HOST, port=DB_PORT).connection() as _db:
+            dna_log.debug(f"connected to database OK")
+
+            # from oids, get username of owners (indexed exact match, then prefix match for any not found)
+            for _prefix in (False, True):
+                with dna_metrics.timer('db_query'):
+                    _rows = list(_db.obsreqs([_ for _ in oids if _ not in usernames], prefix=_prefix))
+                for _observation_id, _username in _rows:
+                    for _k in oids:
+                        if f'{_observation_id}'.startswith(_k) and _k not in usernames and f'{_username}'.strip() != '':
+                            usernames[_k] = f'{_username}'.strip()
+
+            # from usernames get email addresses (indexed exact match)
+            with dna_metrics.timer('db_query'):
+                _addresses = {f'{_u}': f'{_m}'.strip() for _u, _m in _db.users(set(usernames.values()))
+                              if f'{_m}'.strip() != ''}
+            for _k, _v in usernames.items():
+                if _v in _addresses:
+                    emails[_k] = _addresses[_v]
     except Exception as _e2:
         dna_log.error(f"failed to connect to database, error-'{_e2}'")
+        dna_metrics.export()
         return
-    else:
-        dna_log.debug(f"connected to database OK")
 
-    # from oid, get username of owner
+    # OIDs with no owner (or no email address) cannot be delivered
+    for _k in [_ for _ in oids if _ not in usernames or _ not in emails]:
+        dna_log.warning(f"no owner found for _oid='{_k}', skipping {len(oids[_k])} file(s)")
+        oids.pop(_k)
+
+    # create observation tarball(s) concurrently
+    gmails, oid_tgzs = {}, {}
     for _k, _v in oids.items():
-        _ans = _db.fetchone(f"SELECT * FROM ObsReq2 WHERE observation_id LIKE '%{_k}%';")
-        _username = _ans[0][1]
-        if _k not in usernames and _username.strip() != '':
-            usernames[_k] = _username.strip()
-
-    # from username get email address
-    for _k, _v in usernames.items():
-        _ans = _db.fetchone(f"SELECT * FROM Users WHERE username LIKE '%{_v}%';")
-        _email = _ans[0][6]
-        if _k not in emails and _email.strip() != '':
-            emails[_k] = _email.strip()
-    _db.disconnect()
-
-    # create observation tarball(s)
-    gmails = {}
+        oid_tgzs[_k] = dna_tgz_name(os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.{usernames[_k]}.{_k[:8]}.tgz"))), _object)
+    with dna_metrics.timer('tgz'):
+        _results = dna_tgz_builds({oid_tgzs[_k]: _v for _k, _v in oids.items()},
+                                  workers=_tgz_workers, log=dna_log, codec=_object)
+    dna_metrics.tgz(_results)
     for _k, _v in oids.items():
-        oid_tgz = os.path.abspath(os.path.expanduser(os.path.join(DNA_TGZ_DIR, f"Kuiper.Mont4k.{_iso}.{usernames[_k]}.{_k[:8]}.tgz")))
-        if not os.path.isfile(oid_tgz):
-            dna_log.info(f'creating {oid_tgz}')
-            with tarfile.open(f'{oid_tgz}', mode='w:gz') as _wf:
-                for _e in _v:
-                    dna_log.info(f'adding {_e} to {oid_tgz}')
-                    _wf.add(f'{_e}')
+        oid_tgz = oid_tgzs[_k]
+        if _results[oid_tgz]['error'] != '':
+            dna_log.error(f"not notifying {usernames[_k]}, archive {oid_tgz} failed")
+            continue
         gmails = {**gmails, **{_k: {'user': usernames[_k], 'gmail': emails[_k], 'tgz': oid_tgz, 'object': names[_k]}}}
-        try:
-            os.chown(f'{oid_tgz}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
-        except Exception as _e3:
-            dna_log.error(f"failed to chown {oid_tgz}, error='{_e3}'")
 
-    # send out gmail(s)
+    # queue gmail(s) in the outbox, then send them over one session
     if _gmail:
-        for _k, _v in gmails.items():
-            _user = f"{_v['user']}"
-            _mail = f"{_v['gmail']}"
-            _name = f"{_v['object']}"
-            _subj = f"{_v['object']}"
-            _tgzf = f"{_v['tgz']}"
-            _body = f"{_name} observed using the Kuiper telescope on {_iso}.\n" \
-                    f"Data link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(_tgzf)}\n" \
-                    f"Dark link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(darks_tgz)}\n" \
-                    f"Flat link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(flats_tgz)}\n" \
-                    f"Foci link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(foci_tgz)}"
-            _text = _body.replace('\n', '')
-            try:
-                dna_gs = dna_gmail_open()
-                dna_log.info(f"sending gmail to {_user} via {_mail} for '{_subj}', text={_text}")
-                dna_gmail_send(dna_gs, [_mail, DNA_GMAIL_USER], DNA_GMAIL_USER, f"ARTN ORP Completed {_subj}", _body)
-                dna_gmail_close(dna_gs)
-            except Exception as _e4:
-                dna_log.error(f"failed to send gmail _k={_k}, _v={_v}, error='{_e4}'")
-                continue
+        with DnaOutbox(dna_outbox_path()) as dna_ob:
+            for _k, _v in gmails.items():
+                _user = f"{_v['user']}"
+                _mail = f"{_v['gmail']}"
+                _name = f"{_v['object']}"
+                _subj = f"{_v['object']}"
+                _tgzf = f"{_v['tgz']}"
+                _body = f"{_name} observed using the Kuiper telescope on {_iso}.\n" \
+                        f"Data link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(_tgzf)}\n" \
+                        f"Dark link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(darks_tgz)}\n" \
+                        f"Flat link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(flats_tgz)}\n" \
+                        f"Foci link: https://scopenet.as.arizona.edu/orp/files/{os.path.basename(foci_tgz)}"
+                _text = _body.replace('\n', '')
+                try:
+                    if dna_ob.put(f'{_tgzf}|{dna_tgz_version(_tgzf)}|{_mail}', [_mail, DNA_GMAIL_USER],
+                                  f"ARTN ORP Completed {_subj}", _body, DNA_GMAIL_USER):
+                        dna_log.info(f"queued gmail to {_user} via {_mail} for '{_subj}', text={_text}")
+                        dna_metrics.count('gmails_queued')
+                    else:
+                        dna_log.info(f"gmail to {_user} via {_mail} for '{_subj}' already queued, skipping")
+                except Exception as _e4:
+                    dna_log.error(f"failed to queue gmail _k={_k}, _v={_v}, error='{_e4}'")
+                    continue
+        dna_gs = DnaMailer(log=dna_log)
+        try:
+            with dna_metrics.timer('gmail'):
+                _drained = dna_outbox_drain(dna_outbox_path(), dna_gs, 0, dna_log)
+            for _k, _v in _drained.items():
+                dna_metrics.count(f'gmails_{_k}', _v)
+        finally:
+            dna_gs.disconnect()
+
+    dna_metrics.export()
 
 # +
 # main()
@@ -372,10 +352,28 @@ if __name__ == '__main__':
     _p.add_argument(f'--path', default=DEF_DNA_PATH, help=f"""Data path, defaults to '%(default)s'""")
     _p.add_argument(f'--iso', default=DEF_DNA_ISO, help=f"""ISO date, defaults to %(default)s""")
     _p.add_argument(f'--gmail', default=False, action='store_true', help=f'if present, gmail owner')
+    _p.add_argument(f'--workers', default=DNA_FITS_WORKERS, help=f"""Header reader workers, defaults to %(default)s""")
+    _p.add_argument(f'--depth', default=DNA_FITS_DEPTH, help=f"""Header reader queue depth, defaults to %(default)s""")
+    _p.add_argument(f'--pool', default=DNA_FITS_POOLS[0], help=f"""Header reader pool, defaults to '%(default)s', choices: {DNA_FITS_POOLS}""")
+    _p.add_argument(f'--cache', default='', help=f"""Header cache, defaults to '{dna_cache_path()}', 'none' to disable""")
+    _p.add_argument(f'--tgz-workers', default=DNA_TGZ_WORKERS, help=f"""Concurrent archive(s), defaults to %(default)s""")
+    _p.add_argument(f'--calibration-codec', default=DNA_TGZ_CALIBRATION, help=f"""Calibration archive codec <str>[:<level>], defaults to '%(default)s'""")
+    _p.add_argument(f'--object-codec', default=DNA_TGZ_OBJECT, help=f"""Object archive codec <str>[:<level>], defaults to '%(default)s'""")
+    _p.add_argument(f'--profile', default=False, action='store_true', help=f'if present, profile the run (cProfile) into dna_kuiper.Kuiper.Mont4k.<iso>.prof in $DNA_LOGS')
+    _p.add_argument(f'--profile-memory', default=False, action='store_true', help=f'if present (with --profile), also trace memory (tracemalloc) and log the peak')
     _a = _p.parse_args()
 
     # execute
+    _profile = DnaProfile(dna_profile_path(f'dna_kuiper.Kuiper.Mont4k.{_a.iso}'), bool(_a.profile_memory), log=dna_log) \
+        if bool(_a.profile) else None
+    if _profile is not None:
+        _profile.start()
     try:
-        dna_kuiper(_path=_a.path, _iso=_a.iso, _authorization=_a.authorization, _gmail=bool(_a.gmail))
+        dna_kuiper(_path=_a.path, _iso=_a.iso, _authorization=_a.authorization, _gmail=bool(_a.gmail),
+                   _workers=int(_a.workers), _depth=int(_a.depth), _pool=_a.pool, _cache=_a.cache,
+                   _tgz_workers=int(_a.tgz_workers), _calibration=_a.calibration_codec, _object=_a.object_codec)
     except Exception as _:
         print(f"{_}\n{__doc__}")
+    finally:
+        if _profile is not None:
+            _profile.stop()
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from datetime import datetime
+from typing import Optional
+
+import json
+import os
+import tempfile
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_ledger import DnaLedger
+    _l = DnaLedger('/rts2data/Kuiper/Mont4k/20200414/.dna.json', journal=True)
+    _l.load()
+    if not _l.processed(_file, _mtime, _size):
+        _l.add({'file': _file, ...})
+    _l.save()
+
+    The ledger reads both the legacy single JSON array format and the JSON-Lines journal format. In journal
+    mode, each add() is appended and fsync'd immediately and the file is compacted (atomically) when it
+    holds too many superseded or damaged records.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_LEDGER_KEYS = ('file', 'size', 'oid', 'tgt', 'email', 'user', 'timestamp')
+DNA_LEDGER_COMPACT_RATIO = 2.0
+DNA_LEDGER_COMPACT_SLACK = 256
+DNA_LEDGER_MTIME_TOLERANCE = 1.0e-3
+
+
+# +
+# class: DnaLedger() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaLedger(object):
+    """ processed-file ledger behind .dna.json indexed by file path """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', journal: bool = False):
+
+        # get argument(s)
+        self.path = path
+        self.journal = journal
+
+        # private variable(s), the dict preserves insertion order so save() keeps the legacy list order
+        self.__elements = {}
+        self.__fa = None
+        self.__legacy = False
+        self.__records = 0
+        self.__damaged = 0
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}')) if \
+            (isinstance(path, str) and path.strip() != '') else ''
+
+    @property
+    def journal(self):
+        return self.__journal
+
+    @journal.setter
+    def journal(self, journal: bool = False):
+        self.__journal = journal if isinstance(journal, bool) else False
+
+    # +
+    # method: __contains__, __len__, __iter__
+    # -
+    def __contains__(self, _file: str = '') -> bool:
+        return f'{_file}' in self.__elements
+
+    def __len__(self) -> int:
+        return len(self.__elements)
+
+    def __iter__(self):
+        return iter(self.__elements.values())
+
+    # +
+    # method: load()
+    # -
+    def load(self) -> int:
+        """ (re)loads the ledger from disk (legacy or journal format) and returns the number of elements """
+        self.close()
+        self.__elements, self.__legacy, self.__records, self.__damaged = {}, False, 0, 0
+        _elements = []
+        try:
+            with open(f'{self.__path}', 'r') as _fr:
+                _text = _fr.read()
+        except Exception:
+            _text = ''
+        if _text.lstrip().startswith('['):
+            self.__legacy = True
+            try:
+                _elements = list(json.loads(_text))
+            except Exception:
+                self.__damaged += 1
+        else:
+            for _line in _text.splitlines():
+                if _line.strip() == '':
+                    continue
+                try:
+                    _elements.append(json.loads(_line))
+                except Exception:
+                    self.__damaged += 1
+            if _text != '' and not _text.endswith('\n'):
+                self.__damaged += 1
+        for _e in _elements:
+            if isinstance(_e, dict) and 'file' in _e:
+                self.__elements[f"{_e['file']}"] = _e
+                self.__records += 1
+        return len(self.__elements)
+
+    # +
+    # method: save()
+    # -
+    def save(self) -> None:
+        """ writes the ledger to disk, in journal mode this only compacts if required """
+        if self.__journal:
+            self.close()
+            if self.needs_compaction():
+                self.compact()
+        else:
+            dna_ledger_write(self.__path, [json.dumps(list(self.__elements.values()))])
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ closes the journal file handle (if open) """
+        if self.__fa is not None:
+            try:
+                self.__fa.close()
+            finally:
+                self.__fa = None
+
+    # +
+    # method: needs_compaction()
+    # -
+    def needs_compaction(self) -> bool:
+        """ returns True if the journal is in legacy format, damaged or has too many superseded records """
+        return self.__legacy or self.__damaged > 0 or \
+            self.__records > DNA_LEDGER_COMPACT_RATIO * len(self.__elements) + DNA_LEDGER_COMPACT_SLACK
+
+    # +
+    # method: compact()
+    # -
+    def compact(self) -> None:
+        """ atomically rewrites the journal with one record per file """
+        self.close()
+        dna_ledger_write(self.__path, [json.dumps(_e) for _e in self.__elements.values()], _journal=True)
+        self.__legacy, self.__records, self.__damaged = False, len(self.__elements), 0
+
+    # +
+    # method: __append()
+    # -
+    def __append(self, _element: dict = None) -> None:
+        """ appends (and fsyncs) one record to the journal """
+        if self.__fa is None:
+            self.__fa = open(f'{self.__path}', 'a')
+        self.__fa.write(f'{json.dumps(_element)}\n')
+        self.__fa.flush()
+        os.fsync(self.__fa.fileno())
+        self.__records += 1
+
+    # +
+    # method: get()
+    # -
+    def get(self, _file: str = '') -> Optional[dict]:
+        """ returns the element for _file or None """
+        return self.__elements.get(f'{_file}', None)
+
+    # +
+    # method: add()
+    # -
+    def add(self, _element: dict = None) -> bool:
+        """ adds (or replaces) an element, returns False if it is missing keys """
+        if not isinstance(_element, dict) or not all(_k in _element for _k in DNA_LEDGER_KEYS):
+            return False
+        if self.__journal and self.needs_compaction():
+            self.compact()
+        self.__elements[f"{_element['file']}"] = _element
+        if self.__journal:
+            self.__append(_element)
+        return True
+
+    # +
+    # method: processed()
+    # -
+    def processed(self, _file: str = '', _mtime: float = None, _size: int = None) -> bool:
+        """ returns True if _file is in the ledger and is unchanged (where _mtime and/or _size are given) """
+        _e = self.__elements.get(f'{_file}', None)
+        if _e is None:
+            return False
+        if _size is not None and int(_e.get('size', -1)) != int(_size):
+            return False
+        if _mtime is not None:
+            _m = dna_ledger_mtime(_e)
+            if _m is not None and abs(_m - float(_mtime)) > DNA_LEDGER_MTIME_TOLERANCE:
+                return False
+        return True
+
+    # +
+    # method: oids()
+    # -
+    def oids(self) -> dict:
+        """ returns dictionary of {oid: [file, ...]} in ledger order """
+        _oid_dict = {}
+        for _e in self.__elements.values():
+            if 'oid' in _e:
+                _oid_dict.setdefault(f"{_e['oid']}", []).append(f"{_e['file']}")
+        return _oid_dict
+
+
+# +
+# function: dna_ledger_mtime()
+# -
+# noinspection PyBroadException
+def dna_ledger_mtime(_element: dict = None) -> Optional[float]:
+    """ returns the modification time of an element, legacy elements only carry an isoformat timestamp """
+    if not isinstance(_element, dict):
+        return None
+    try:
+        if 'mtime' in _element:
+            return float(_element['mtime'])
+        return datetime.fromisoformat(f"{_element['timestamp']}").timestamp()
+    except Exception:
+        return None
+
+
+# +
+# function: dna_ledger_write()
+# -
+# noinspection PyBroadException
+def dna_ledger_write(_path: str = '', _lines: list = None, _journal: bool = False) -> None:
+    """ atomically replaces _path with _lines, keeping the mode and ownership of any existing file """
+    _dir = os.path.dirname(_path)
+    _fd, _tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(_path)}.', suffix='.tmp', dir=_dir)
+    try:
+        with os.fdopen(_fd, 'w') as _fw:
+            for _line in (_lines or []):
+                _fw.write(f'{_line}\n' if _journal else f'{_line}')
+            _fw.flush()
+            os.fsync(_fw.fileno())
+        try:
+            _st = os.stat(_path)
+            os.chmod(_tmp, _st.st_mode & 0o7777)
+            os.chown(_tmp, _st.st_uid, _st.st_gid)
+        except Exception:
+            pass
+        os.replace(_tmp, _path)
+    except Exception:
+        if os.path.exists(_tmp):
+            os.remove(_tmp)
+        raise
+    try:
+        _dfd = os.open(_dir, os.O_RDONLY)
+        try:
+            os.fsync(_dfd)
+        finally:
+            os.close(_dfd)
+    except Exception:
+        pass
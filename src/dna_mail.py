@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from typing import Any
+
+import argparse
+import logging
+import os
+import smtplib
+import time
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_mail import DnaMailer
+    with DnaMailer(log=dna_log) as _m:
+        for _to, _subject, _text in _notices:
+            _m.send(_to, _subject, _text)
+
+    Keeps one authenticated SMTP session (connect, EHLO, STARTTLS, login) for any number of messages, reconnects
+    if the server drops it, queues messages and sends them in batches of --batch, and throttles to --rate
+    messages per second. Test against a local stand-in with:
+
+    % python3 -m aiosmtpd -n -l localhost:8025
+    % python3 dna_mail.py --host=localhost --port=8025 --no-tls --to=someone@example.com --count=10
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_MAIL_BATCH = int(os.getenv('DNA_MAIL_BATCH', 20))
+DNA_MAIL_RATE = float(os.getenv('DNA_MAIL_RATE', 1.0))
+DNA_MAIL_RETRIES = 2
+DNA_MAIL_TIMEOUT = 30.0
+
+DNA_MAIL_HOST = os.getenv("MAIL_SERVER", None)
+DNA_MAIL_PASS = os.getenv("MAIL_PASSWORD", None)
+DNA_MAIL_PORT = os.getenv("MAIL_PORT", None)
+DNA_MAIL_TLS = os.getenv("MAIL_USE_TLS", 'True').strip().lower() not in ('0', 'false', 'no')
+DNA_MAIL_USER = os.getenv("MAIL_USERNAME", None)
+
+
+# +
+# logging
+# -
+dna_mail_log = logging.getLogger('dna_mail')
+
+
+# +
+# class: DnaMailer() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaMailer(object):
+    """ one SMTP session with reconnect, batched sends and a rate limit """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, host: str = DNA_MAIL_HOST, port: Any = DNA_MAIL_PORT, user: str = DNA_MAIL_USER,
+                 password: str = DNA_MAIL_PASS, tls: bool = DNA_MAIL_TLS, batch: int = DNA_MAIL_BATCH,
+                 rate: float = DNA_MAIL_RATE, retries: int = DNA_MAIL_RETRIES, log: Any = None):
+
+        # get argument(s)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.tls = tls
+        self.batch = batch
+        self.rate = rate
+        self.retries = retries
+        self.log = log
+
+        # private variable(s)
+        self.__s = None
+        self.__queue = []
+        self.__last = 0.0
+        self.__sessions = 0
+        self.__sent = 0
+        self.__failed = 0
+        self.__rejected = 0
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def host(self):
+        return self.__host
+
+    @host.setter
+    def host(self, host: str = ''):
+        self.__host = host if (isinstance(host, str) and host.strip() != '') else 'localhost'
+
+    @property
+    def port(self):
+        return self.__port
+
+    @port.setter
+    def port(self, port: Any = 0):
+        try:
+            self.__port = int(port)
+        except Exception:
+            self.__port = 0
+
+    @property
+    def user(self):
+        return self.__user
+
+    @user.setter
+    def user(self, user: str = ''):
+        self.__user = user if (isinstance(user, str) and user.strip() != '') else ''
+
+    @property
+    def password(self):
+        return self.__password
+
+    @password.setter
+    def password(self, password: str = ''):
+        self.__password = password if isinstance(password, str) else ''
+
+    @property
+    def tls(self):
+        return self.__tls
+
+    @tls.setter
+    def tls(self, tls: bool = True):
+        self.__tls = tls if isinstance(tls, bool) else True
+
+    @property
+    def batch(self):
+        return self.__batch
+
+    @batch.setter
+    def batch(self, batch: int = DNA_MAIL_BATCH):
+        self.__batch = batch if (isinstance(batch, int) and batch > 0) else DNA_MAIL_BATCH
+
+    @property
+    def rate(self):
+        return self.__rate
+
+    @rate.setter
+    def rate(self, rate: float = DNA_MAIL_RATE):
+        self.__rate = float(rate) if (isinstance(rate, (int, float)) and rate >= 0.0) else DNA_MAIL_RATE
+
+    @property
+    def retries(self):
+        return self.__retries
+
+    @retries.setter
+    def retries(self, retries: int = DNA_MAIL_RETRIES):
+        self.__retries = retries if (isinstance(retries, int) and retries >= 0) else DNA_MAIL_RETRIES
+
+    @property
+    def log(self):
+        return self.__log
+
+    @log.setter
+    def log(self, log: Any = None):
+        self.__log = log if log is not None else dna_mail_log
+
+    @property
+    def connected(self):
+        return self.__s is not None
+
+    @property
+    def pending(self):
+        return len(self.__queue)
+
+    @property
+    def sessions(self):
+        return self.__sessions
+
+    @property
+    def sent(self):
+        return self.__sent
+
+    @property
+    def failed(self):
+        return self.__failed
+
+    @property
+    def rejected(self):
+        return self.__rejected
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: alive()
+    # -
+    def alive(self) -> bool:
+        """ returns True if the session is still connected """
+        try:
+            return self.__s is not None and self.__s.noop()[0] == 250
+        except Exception:
+            return False
+
+    # +
+    # method: open()
+    # -
+    def open(self) -> bool:
+        """ opens (or re-opens) the session and returns True on success """
+        self.disconnect()
+        try:
+            self.__s = smtplib.SMTP(self.__host, self.__port, timeout=DNA_MAIL_TIMEOUT)
+            self.__s.ehlo()
+            if self.__tls:
+                self.__s.starttls()
+                self.__s.ehlo()
+            if self.__user != '':
+                self.__s.login(self.__user, self.__password)
+            self.__sessions += 1
+            return True
+        except Exception as _e:
+            self.__log.error(f'failed to open gmail, host={self.__host}, port={self.__port}, error={_e}')
+            self.disconnect()
+            return False
+
+    # +
+    # method: disconnect()
+    # -
+    def disconnect(self) -> None:
+        """ closes the session, if any, without sending what is queued """
+        if self.__s is None:
+            return
+        try:
+            self.__s.quit()
+        except Exception:
+            try:
+                self.__s.close()
+            except Exception:
+                pass
+        self.__s = None
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ sends what is queued and closes the session """
+        try:
+            self.flush()
+        finally:
+            self.disconnect()
+
+    # +
+    # method: deliver()
+    # -
+    def deliver(self, _to: list = None, _subject: str = '', _text: str = '', _from: str = '') -> bool:
+        """ sends one message now, reconnecting if necessary, and returns True on success (else rejected is the
+            SMTP code if the server refused this message, or 0 if it could not be reached) """
+        self.__rejected = 0
+        _to = [f'{_t}' for _t in (_to or []) if _t is not None and f'{_t}'.strip() != '']
+        if not _to or not isinstance(_subject, str) or _subject.strip() == '' or \
+                not isinstance(_text, str) or _text.strip() == '':
+            self.__log.error(f"invalid input(s), _to={_to}, _subject='{_subject}', _text='{_text}'")
+            return False
+        # the authenticated user is the sender, as the provider rewrites anything else
+        _from = self.__user or (_from if (isinstance(_from, str) and _from.strip() != '') else 'dna@localhost')
+        _body = '\r\n'.join([f"To: {', '.join(_to)}", f'From: {_from}', f'Subject: {_subject}', '', f'{_text}'])
+        for _attempt in range(self.__retries + 1):
+            if self.__s is None and not self.open():
+                continue
+            self.throttle()
+            try:
+                self.__s.sendmail(_from, _to, _body)
+                self.__sent += 1
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError) as _e:
+                self.__log.warning(f'gmail session dropped, reconnecting, error={_e}')
+                self.disconnect()
+                continue
+            except smtplib.SMTPRecipientsRefused as _e:
+                _code, _error = max([_v[0] for _v in _e.recipients.values()] or [550]), f'{_e}'
+            except smtplib.SMTPResponseException as _e:
+                _code, _error = _e.smtp_code, f'{_e}'
+            except smtplib.SMTPException as _e:
+                self.__log.error(f"failed to send gmail to {_to}, subject='{_subject}', error={_e}")
+                self.__failed += 1
+                return False
+            except OSError as _e:
+                self.__log.warning(f'gmail session dropped, reconnecting, error={_e}')
+                self.disconnect()
+                continue
+            except Exception as _e:
+                self.__log.error(f"failed to send gmail to {_to}, subject='{_subject}', error={_e}")
+                self.__failed += 1
+                return False
+            # 421 means the server is closing the session, anything else rejects this message only
+            if _code == 421:
+                self.__log.warning(f'gmail session closed by server, reconnecting, code={_code}')
+                self.disconnect()
+                continue
+            self.__log.error(f"gmail to {_to}, subject='{_subject}' rejected, code={_code}, error={_error}")
+            self.__rejected = _code
+            self.__failed += 1
+            return False
+        self.__log.error(f"failed to send gmail to {_to}, subject='{_subject}' after {self.__retries + 1} attempt(s)")
+        self.__failed += 1
+        return False
+
+    # +
+    # method: send()
+    # -
+    def send(self, _to: list = None, _subject: str = '', _text: str = '', _from: str = '') -> bool:
+        """ queues a message (sent with the batch) and returns True if it is valid """
+        if not [_t for _t in (_to or []) if _t is not None and f'{_t}'.strip() != ''] or \
+                not isinstance(_subject, str) or _subject.strip() == '' or \
+                not isinstance(_text, str) or _text.strip() == '':
+            self.__log.error(f"invalid input(s), _to={_to}, _subject='{_subject}', _text='{_text}'")
+            return False
+        self.__queue.append((_to, _subject, _text, _from))
+        if len(self.__queue) >= self.__batch:
+            self.flush()
+        return True
+
+    # +
+    # method: flush()
+    # -
+    def flush(self) -> int:
+        """ sends the queued message(s) over the session and returns the number sent """
+        _queue, self.__queue, _sent = self.__queue, [], 0
+        for _i, _message in enumerate(_queue):
+            if self.deliver(*_message):
+                _sent += 1
+            elif self.__s is None:
+                self.__log.error(f'server unavailable, dropping {len(_queue) - _i - 1} more gmail(s)')
+                self.__failed += len(_queue) - _i - 1
+                break
+        if _queue:
+            self.__log.info(f'sent {_sent}/{len(_queue)} gmail(s) over {self.__sessions} session(s)')
+        return _sent
+
+    # +
+    # method: throttle()
+    # -
+    def throttle(self) -> None:
+        """ sleeps, if necessary, so messages go out no faster than rate per second """
+        if self.__rate > 0.0:
+            _wait = self.__last + 1.0 / self.__rate - time.monotonic()
+            if _wait > 0.0:
+                time.sleep(_wait)
+        self.__last = time.monotonic()
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN gmail sender', formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--host', default=DNA_MAIL_HOST, help=f"""SMTP host <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--port', default=DNA_MAIL_PORT, help=f"""SMTP port <int>, defaults to %(default)s""")
+    _p.add_argument(f'--user', default=DNA_MAIL_USER, help=f"""SMTP user <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--no-tls', default=False, action='store_true', help=f'if present, do not use STARTTLS')
+    _p.add_argument(f'--batch', default=DNA_MAIL_BATCH, help=f"""Messages per batch <int>, defaults to %(default)s""")
+    _p.add_argument(f'--rate', default=DNA_MAIL_RATE,
+                    help=f"""Messages per second <float> (0 for no limit), defaults to %(default)s""")
+    _p.add_argument(f'--to', default='', help=f"""Recipient <str>""")
+    _p.add_argument(f'--count', default=1, help=f"""Test messages <int>, defaults to %(default)s""")
+    _a = _p.parse_args()
+
+    # execute
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-20s %(levelname)-9s %(filename)-15s %(message)s')
+    _t0 = time.monotonic()
+    with DnaMailer(host=_a.host, port=_a.port, user=_a.user, password=DNA_MAIL_PASS, tls=not bool(_a.no_tls),
+                   batch=int(_a.batch), rate=float(_a.rate)) as _m:
+        for _i in range(int(_a.count)):
+            _m.send([_a.to], f'ARTN DNA test {_i + 1}/{_a.count}', f'Test message {_i + 1} of {_a.count}.')
+    dna_mail_log.info(f'sent {_m.sent}, failed {_m.failed} in {_m.sessions} session(s), '
+                      f'{time.monotonic() - _t0:.2f}s')
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any
+
+import argparse
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_metrics import DnaMetrics
+    _m = DnaMetrics('dna', {'telescope': 'Kuiper', 'instrument': 'Mont4k', 'iso': '20200414'})
+    _m.count('files_scanned', len(_files))
+    with _m.timer('headers'):
+        ...
+    _m.tgz(dna_tgz_builds(...))
+    _m.export()
+
+    % python3 dna_metrics.py --last=10
+
+    Per-stage counters and timers of one run. export() appends the run (as one JSON line) to the history file
+    $DNA_METRICS_JSONL (defaults to dna.metrics.jsonl in $DNA_LOGS, 'none' disables) and, if
+    $DNA_METRICS_TEXTFILE names a node-exporter textfile collector directory, (atomically) replaces
+    <job>.<telescope>.<instrument>.prom there with the same numbers as dna_last_run_* gauges (labelled with the
+    job, telescope, instrument and night), so the latest run of every job and instrument can be scraped and
+    graphed. Timers export their total seconds and the number of times they ran; every run also exports its
+    wall time and the (unix) time it finished.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_METRICS_DIR = os.getenv('DNA_LOGS', '/var/www/ARTN-DNA/logs')
+DNA_METRICS_FILE = 'dna.metrics.jsonl'
+DNA_METRICS_JSONL = os.getenv('DNA_METRICS_JSONL', os.path.join(DNA_METRICS_DIR, DNA_METRICS_FILE))
+DNA_METRICS_NAME = re.compile(r'[^a-zA-Z0-9_]')
+DNA_METRICS_PREFIX = 'dna'
+DNA_METRICS_TEXTFILE = os.getenv('DNA_METRICS_TEXTFILE', '')
+
+
+# +
+# logging
+# -
+dna_metrics_log = logging.getLogger('dna_metrics')
+
+
+# +
+# function: dna_metrics_name()
+# -
+def dna_metrics_name(_name: str = '') -> str:
+    """ returns _name as a valid Prometheus metric (or label) name """
+    return DNA_METRICS_NAME.sub('_', f'{_name}').strip('_').lower()
+
+
+# +
+# function: dna_metrics_label()
+# -
+def dna_metrics_label(_value: str = '') -> str:
+    """ returns _value escaped as a Prometheus label value """
+    return f'{_value}'.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# +
+# class: DnaMetrics() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaMetrics(object):
+    """ per-stage counters and timers of one run, exported as a Prometheus textfile and JSON-Lines history """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, job: str = DNA_METRICS_PREFIX, labels: dict = None, log: Any = None):
+
+        # get argument(s)
+        self.job = job
+        self.labels = labels
+        self.log = log
+
+        # private variable(s)
+        self.__counters = {}
+        self.__timers = {}
+        self.__lock = threading.Lock()
+        self.__t0 = time.monotonic()
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def job(self):
+        return self.__job
+
+    @job.setter
+    def job(self, job: str = DNA_METRICS_PREFIX):
+        self.__job = dna_metrics_name(job) if (isinstance(job, str) and job.strip() != '') else DNA_METRICS_PREFIX
+
+    @property
+    def labels(self):
+        return self.__labels
+
+    @labels.setter
+    def labels(self, labels: dict = None):
+        self.__labels = {dna_metrics_name(_k): f'{_v}' for _k, _v in labels.items()} \
+            if isinstance(labels, dict) else {}
+
+    @property
+    def log(self):
+        return self.__log
+
+    @log.setter
+    def log(self, log: Any = None):
+        self.__log = log if log is not None else dna_metrics_log
+
+    @property
+    def counters(self):
+        with self.__lock:
+            return dict(self.__counters)
+
+    @property
+    def timers(self):
+        with self.__lock:
+            return {_k: list(_v) for _k, _v in self.__timers.items()}
+
+    @property
+    def wall(self):
+        return time.monotonic() - self.__t0
+
+    # +
+    # method: count()
+    # -
+    def count(self, _name: str = '', _value: Any = 1) -> None:
+        """ adds _value to counter _name """
+        _name = dna_metrics_name(_name)
+        with self.__lock:
+            self.__counters[_name] = self.__counters.get(_name, 0) + _value
+
+    # +
+    # method: observe()
+    # -
+    def observe(self, _name: str = '', _seconds: float = 0.0) -> None:
+        """ adds one run of _seconds to timer _name """
+        _name = dna_metrics_name(_name)
+        with self.__lock:
+            _t = self.__timers.setdefault(_name, [0.0, 0])
+            _t[0], _t[1] = _t[0] + float(_seconds), _t[1] + 1
+
+    # +
+    # method: timer()
+    # -
+    @contextmanager
+    def timer(self, _name: str = ''):
+        """ times the body of a with statement into timer _name """
+        _t0 = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.observe(_name, time.monotonic() - _t0)
+
+    # +
+    # method: tgz()
+    # -
+    def tgz(self, _results: dict = None) -> 'DnaMetrics':
+        """ adds the statistics of dna_tgz_builds() results: archives by action, bytes in and out, seconds """
+        for _r in (_results or {}).values():
+            if _r.get('error', '') != '':
+                self.count('archives_failed')
+                continue
+            self.count(f"archives_{_r.get('action', '') or 'built'}")
+            if _r.get('action', '') == 'skipped':
+                continue
+            self.count('archive_files', _r.get('files', 0))
+            self.count('archive_files_encoded', _r.get('encoded', 0))
+            self.count('archive_files_copied', _r.get('copied', 0))
+            self.count('archive_bytes_in', _r.get('bytes', 0))
+            self.count('archive_bytes_out', _r.get('size', 0))
+            self.observe('archive', _r.get('seconds', 0.0))
+        return self
+
+    # +
+    # method: snapshot()
+    # -
+    def snapshot(self) -> dict:
+        """ returns the run as a dictionary """
+        return {'job': self.__job, 'labels': dict(self.__labels), 'timestamp': datetime.now().isoformat(),
+                'time': time.time(), 'wall': round(self.wall, 6), 'counters': self.counters,
+                'timers': {_k: {'seconds': round(_v[0], 6), 'count': _v[1]} for _k, _v in self.timers.items()}}
+
+    # +
+    # method: prometheus()
+    # -
+    def prometheus(self, _snapshot: dict = None) -> str:
+        """ returns the run in the Prometheus text exposition format """
+        _s = _snapshot if _snapshot is not None else self.snapshot()
+        _l = ','.join(f'{_k}="{dna_metrics_label(_v)}"' for _k, _v in
+                      [('job', _s['job'])] + sorted(_s['labels'].items()))
+        _p, _lines = DNA_METRICS_PREFIX, []
+
+        def _gauge(_name: str = '', _value: Any = 0, _help: str = '') -> None:
+            _lines.extend([f'# HELP {_p}_{_name} {_help}', f'# TYPE {_p}_{_name} gauge',
+                           f'{_p}_{_name}{{{_l}}} {_value}'])
+
+        _gauge('last_run_timestamp_seconds', f"{_s['time']:.3f}", 'unix time the last run finished')
+        _gauge('last_run_wall_seconds', f"{_s['wall']:.6f}", 'wall time of the last run')
+        for _k, _v in sorted(_s['counters'].items()):
+            _gauge(f'last_run_{_k}', _v, f'{_k} in the last run')
+        for _k, _v in sorted(_s['timers'].items()):
+            _gauge(f'last_run_{_k}_seconds', f"{_v['seconds']:.6f}", f'seconds spent in {_k} in the last run')
+            _gauge(f'last_run_{_k}_count', _v['count'], f'times {_k} ran in the last run')
+        return '\n'.join(_lines) + '\n'
+
+    # +
+    # method: export()
+    # -
+    def export(self, _jsonl: str = DNA_METRICS_JSONL, _textfile: str = DNA_METRICS_TEXTFILE) -> dict:
+        """ appends the run to the _jsonl history and replaces its .prom file in the _textfile directory """
+        _s = self.snapshot()
+        if isinstance(_jsonl, str) and _jsonl.strip() not in ('', 'none'):
+            try:
+                with open(_jsonl, 'a') as _fa:
+                    _fa.write(json.dumps(_s) + '\n')
+            except Exception as _e:
+                self.__log.error(f'failed to append metrics to {_jsonl}, error={_e}')
+        if isinstance(_textfile, str) and _textfile.strip() not in ('', 'none'):
+            _name = '.'.join([self.__job] + [dna_metrics_name(self.__labels[_k]) for _k in ('telescope', 'instrument')
+                                             if self.__labels.get(_k, '') != ''])
+            _prom = os.path.join(_textfile, f'{_name}.prom')
+            try:
+                with open(f'{_prom}.{os.getpid()}', 'w') as _fw:
+                    _fw.write(self.prometheus(_s))
+                os.replace(f'{_prom}.{os.getpid()}', _prom)
+            except Exception as _e:
+                self.__log.error(f'failed to write metrics to {_prom}, error={_e}')
+        self.__log.info(f"metrics: wall={_s['wall']:.2f}s, counters={_s['counters']}, "
+                        f"timers={ {_k: round(_v['seconds'], 3) for _k, _v in _s['timers'].items()} }")
+        return _s
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN DNA run metrics', formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--file', default=DNA_METRICS_JSONL, help=f"""History file <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--last', default=10, help=f"""Run(s) to show <int>, defaults to %(default)s""")
+    _p.add_argument(f'--prometheus', default=False, action='store_true',
+                    help=f'if present, show the last run in the Prometheus textfile format')
+    _a = _p.parse_args()
+
+    # execute
+    with open(_a.file, 'r') as _fr:
+        _runs = [json.loads(_line) for _line in _fr if _line.strip() != '']
+    if bool(_a.prometheus):
+        for _r in _runs[-1:]:
+            print(DnaMetrics(_r['job'], _r['labels']).prometheus(_r), end='')
+    else:
+        for _r in _runs[-int(_a.last):]:
+            _timers = ', '.join(f"{_k}={_v['seconds']:.2f}s/{_v['count']}" for _k, _v in _r['timers'].items())
+            print(f"{_r['timestamp']} {_r['job']} {' '.join(_r['labels'].values())} wall={_r['wall']:.2f}s "
+                  f"{_r['counters']} {_timers}")
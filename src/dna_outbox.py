@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from typing import Any
+from typing import Optional
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_outbox import DnaOutbox, dna_outbox_drain, dna_outbox_path
+    with DnaOutbox(dna_outbox_path()) as _o:
+        _o.put(f'{_tgz}|{dna_tgz_version(_tgz)}|{_email}', [_email], _subject, _text)   # False if already queued
+    dna_outbox_drain(dna_outbox_path(), DnaMailer())   # or None: one is opened if anything is due
+
+    % python3 dna_outbox.py --drain
+    % python3 dna_outbox.py --stats
+
+    Persistent outbox of gmail(s), so archive building and ledger updates never wait on the SMTP server. Messages
+    are keyed (a key is only ever queued once; dna.py and dna_kuiper.py include the archive's content identity,
+    dna_tgz_version(), so an archive rebuilt with late frame(s) is notified again) and move pending -> sending ->
+    sent. A failed delivery is retried with exponential backoff (--backoff seconds, doubled per attempt, at most
+    an hour) and marked failed after --retries attempts; one the server rejects outright (5xx) is marked failed
+    at once and the drain moves on, while one the server cannot be reached for leaves the rest for later. A
+    message found 'sending' after a crash is marked failed rather than re-sent, so nothing is sent twice;
+    --requeue puts failed message(s) back. Sent and failed messages are removed after 30 days.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_OUTBOX_BACKOFF = float(os.getenv('DNA_OUTBOX_BACKOFF', 60.0))
+DNA_OUTBOX_BACKOFF_MAX = 3600.0
+DNA_OUTBOX_DIR = os.getenv("DNA_LOGS", '/var/www/ARTN-DNA/logs')
+DNA_OUTBOX_FILE = 'dna.outbox.sqlite'
+DNA_OUTBOX_INTERVAL = 30.0
+DNA_OUTBOX_LEASE = 600.0
+DNA_OUTBOX_MAX_AGE = 30.0
+DNA_OUTBOX_RETRIES = int(os.getenv('DNA_OUTBOX_RETRIES', 8))
+DNA_OUTBOX_STATES = ('pending', 'sending', 'sent', 'failed')
+DNA_OUTBOX_TIMEOUT = 30.0
+
+
+# +
+# logging
+# -
+dna_outbox_log = logging.getLogger('dna_outbox')
+
+
+# +
+# function: dna_outbox_path()
+# -
+def dna_outbox_path(_dir: str = DNA_OUTBOX_DIR) -> str:
+    """ returns the outbox in the logs directory (or the current directory if that is not writable) """
+    _dir = os.path.abspath(os.path.expanduser(f'{_dir}'))
+    if not os.path.isdir(_dir) or not os.access(_dir, os.W_OK):
+        _dir = os.getcwd()
+    return os.path.join(_dir, DNA_OUTBOX_FILE)
+
+
+# +
+# class: DnaOutbox() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaOutbox(object):
+    """ on-disk queue of gmail(s) keyed by a caller supplied key """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', retries: int = DNA_OUTBOX_RETRIES, backoff: float = DNA_OUTBOX_BACKOFF):
+
+        # get argument(s)
+        self.path = path
+        self.retries = retries
+        self.backoff = backoff
+
+        # private variable(s)
+        self.__db = None
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}')) if \
+            (isinstance(path, str) and path.strip() != '') else dna_outbox_path()
+
+    @property
+    def retries(self):
+        return self.__retries
+
+    @retries.setter
+    def retries(self, retries: int = DNA_OUTBOX_RETRIES):
+        self.__retries = retries if (isinstance(retries, int) and retries > 0) else DNA_OUTBOX_RETRIES
+
+    @property
+    def backoff(self):
+        return self.__backoff
+
+    @backoff.setter
+    def backoff(self, backoff: float = DNA_OUTBOX_BACKOFF):
+        self.__backoff = float(backoff) if (isinstance(backoff, (int, float)) and backoff >= 0.0) \
+            else DNA_OUTBOX_BACKOFF
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: open()
+    # -
+    def open(self) -> None:
+        """ opens (and if necessary creates) the outbox """
+        if self.__db is not None:
+            return
+        self.__db = sqlite3.connect(self.__path, timeout=DNA_OUTBOX_TIMEOUT, isolation_level=None)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS messages (key TEXT PRIMARY KEY, recipients TEXT, subject TEXT, '
+                          'text TEXT, sender TEXT, state TEXT, attempts INTEGER, due REAL, created REAL, '
+                          'updated REAL, error TEXT)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS messages_state_due ON messages (state, due)')
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ removes old sent and failed message(s) and closes the outbox """
+        if self.__db is None:
+            return
+        try:
+            self.__db.execute("DELETE FROM messages WHERE state IN ('sent', 'failed') AND updated < ?",
+                              (time.time() - DNA_OUTBOX_MAX_AGE * 86400.0,))
+        finally:
+            self.__db.close()
+            self.__db = None
+
+    # +
+    # method: put()
+    # -
+    def put(self, _key: str = '', _to: list = None, _subject: str = '', _text: str = '', _from: str = '') -> bool:
+        """ queues a message and returns True, or False if _key was already queued """
+        self.open()
+        _now = time.time()
+        _cursor = self.__db.execute(
+            'INSERT OR IGNORE INTO messages (key, recipients, subject, text, sender, state, attempts, due, created, '
+            "updated, error) VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?, ?, '')",
+            (f'{_key}', json.dumps([_t for _t in (_to or []) if _t is not None]), f'{_subject}', f'{_text}',
+             f'{_from or ""}', _now, _now, _now))
+        return _cursor.rowcount == 1
+
+    # +
+    # method: claim()
+    # -
+    def claim(self) -> Optional[dict]:
+        """ marks the next due message as sending and returns it, or None """
+        self.open()
+        _now = time.time()
+        self.__db.execute('BEGIN IMMEDIATE')
+        try:
+            # a message left 'sending' by a crashed drain may or may not have gone out: never send it again
+            self.__db.execute("UPDATE messages SET state='failed', updated=?, error='interrupted while sending' "
+                              "WHERE state='sending' AND updated < ?", (_now, _now - DNA_OUTBOX_LEASE))
+            _row = self.__db.execute("SELECT key, recipients, subject, text, sender, attempts FROM messages "
+                                     "WHERE state='pending' AND due <= ? ORDER BY due LIMIT 1", (_now,)).fetchone()
+            if _row is not None:
+                self.__db.execute("UPDATE messages SET state='sending', updated=? WHERE key=?", (_now, _row[0]))
+            self.__db.execute('COMMIT')
+        except Exception:
+            self.__db.execute('ROLLBACK')
+            raise
+        if _row is None:
+            return None
+        return {'key': _row[0], 'to': json.loads(_row[1]), 'subject': _row[2], 'text': _row[3], 'from': _row[4],
+                'attempts': _row[5]}
+
+    # +
+    # method: sent()
+    # -
+    def sent(self, _key: str = '') -> None:
+        """ records a delivered message """
+        self.open()
+        self.__db.execute("UPDATE messages SET state='sent', attempts=attempts+1, updated=?, error='' WHERE key=?",
+                          (time.time(), f'{_key}'))
+
+    # +
+    # method: retry()
+    # -
+    def retry(self, _key: str = '', _error: str = '') -> str:
+        """ reschedules a message with backoff (or fails it after retries) and returns its new state """
+        self.open()
+        _now = time.time()
+        _row = self.__db.execute('SELECT attempts FROM messages WHERE key=?', (f'{_key}',)).fetchone()
+        _attempts = (_row[0] if _row is not None else 0) + 1
+        _state = 'failed' if _attempts >= self.__retries else 'pending'
+        _due = _now + min(self.__backoff * 2 ** (_attempts - 1), DNA_OUTBOX_BACKOFF_MAX)
+        self.__db.execute('UPDATE messages SET state=?, attempts=?, due=?, updated=?, error=? WHERE key=?',
+                          (_state, _attempts, _due, _now, f'{_error}', f'{_key}'))
+        return _state
+
+    # +
+    # method: fail()
+    # -
+    def fail(self, _key: str = '', _error: str = '') -> str:
+        """ marks a message failed without further retries and returns its new state """
+        self.open()
+        self.__db.execute("UPDATE messages SET state='failed', attempts=attempts+1, updated=?, error=? WHERE key=?",
+                          (time.time(), f'{_error}', f'{_key}'))
+        return 'failed'
+
+    # +
+    # method: requeue()
+    # -
+    def requeue(self) -> int:
+        """ puts failed message(s) back as pending and returns how many """
+        self.open()
+        return self.__db.execute("UPDATE messages SET state='pending', attempts=0, due=?, error='' "
+                                 "WHERE state='failed'", (time.time(),)).rowcount
+
+    # +
+    # method: stats()
+    # -
+    def stats(self) -> dict:
+        """ returns {state: count} """
+        self.open()
+        _counts = dict(self.__db.execute('SELECT state, COUNT(*) FROM messages GROUP BY state').fetchall())
+        return {_k: _counts.get(_k, 0) for _k in DNA_OUTBOX_STATES}
+
+
+# +
+# function: dna_outbox_drain()
+# -
+# noinspection PyBroadException
+def dna_outbox_drain(_path: str = '', _mailer: Any = None, _limit: int = 0, _log: Any = None,
+                     _retries: int = DNA_OUTBOX_RETRIES, _backoff: float = DNA_OUTBOX_BACKOFF) -> dict:
+    """ delivers due message(s) over one session and returns {'sent': n, 'retried': n, 'failed': n} """
+
+    _log = _log if _log is not None else dna_outbox_log
+    _owned, _result = _mailer is None, {'sent': 0, 'retried': 0, 'failed': 0}
+    with DnaOutbox(_path, _retries, _backoff) as _o:
+        while _limit <= 0 or sum(_result.values()) < _limit:
+            _m = _o.claim()
+            if _m is None:
+                break
+            if _mailer is None:
+                from dna_mail import DnaMailer
+                _mailer = DnaMailer(log=_log)
+            if _mailer.deliver(_m['to'], _m['subject'], _m['text'], _m['from']):
+                _o.sent(_m['key'])
+                _result['sent'] += 1
+                continue
+            # a permanent (5xx) rejection fails this message only, a transient (4xx) one backs it off
+            _code = getattr(_mailer, 'rejected', 0)
+            if _code >= 500:
+                _state = _o.fail(_m['key'], f'rejected by server, code={_code}')
+            else:
+                _state = _o.retry(_m['key'], f'rejected by server, code={_code}' if _code > 0 else
+                                  f'delivery failed after {_m["attempts"] + 1} attempt(s)')
+            _result['retried' if _state == 'pending' else 'failed'] += 1
+            _log.warning(f"gmail {_m['key']} to {_m['to']} not delivered, now {_state}")
+            if _code == 0 and not _mailer.connected:
+                _log.warning(f'server unavailable, leaving the rest of the outbox for later')
+                break
+    if _owned and _mailer is not None:
+        _mailer.disconnect()
+    if any(_result.values()):
+        _log.info(f"outbox drained, sent={_result['sent']}, retried={_result['retried']}, "
+                  f"failed={_result['failed']}")
+    return _result
+
+
+# +
+# class: DnaOutboxWorker() inherits from the threading.Thread class
+# -
+# noinspection PyBroadException
+class DnaOutboxWorker(threading.Thread):
+    """ daemon thread draining the outbox when woken and every interval seconds """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', mailer: Any = None, interval: float = DNA_OUTBOX_INTERVAL,
+                 log: Any = None):
+        super().__init__(name='dna_outbox', daemon=True)
+        self.__path = path
+        self.__mailer = mailer
+        self.__interval = interval if (isinstance(interval, (int, float)) and interval > 0.0) \
+            else DNA_OUTBOX_INTERVAL
+        self.__log = log if log is not None else dna_outbox_log
+        self.__wake = threading.Event()
+        self.__stop = threading.Event()
+
+    # +
+    # method: run()
+    # -
+    def run(self) -> None:
+        if self.__mailer is None:
+            from dna_mail import DnaMailer
+            self.__mailer = DnaMailer(log=self.__log)
+        while True:
+            self.__wake.wait(self.__interval)
+            self.__wake.clear()
+            try:
+                dna_outbox_drain(self.__path, self.__mailer, 0, self.__log)
+            except Exception as _e:
+                self.__log.error(f'failed to drain outbox, error={_e}')
+            if self.__stop.is_set():
+                break
+        self.__mailer.disconnect()
+
+    # +
+    # method: wake()
+    # -
+    def wake(self) -> None:
+        """ drains the outbox now """
+        self.__wake.set()
+
+    # +
+    # method: stop()
+    # -
+    def stop(self, timeout: float = DNA_OUTBOX_TIMEOUT) -> None:
+        """ drains the outbox one last time and waits up to timeout seconds (what is left stays queued) """
+        self.__stop.set()
+        self.__wake.set()
+        self.join(timeout)
+        if self.is_alive():
+            self.__log.warning(f'outbox still draining after {timeout}s, leaving it')
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN gmail outbox', formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--file', default='', help=f"""Outbox <str>, defaults to '{dna_outbox_path()}'""")
+    _p.add_argument(f'--drain', default=False, action='store_true', help=f'if present, deliver due message(s)')
+    _p.add_argument(f'--limit', default=0, help=f"""Message(s) per drain <int> (0 for all), defaults to %(default)s""")
+    _p.add_argument(f'--retries', default=DNA_OUTBOX_RETRIES,
+                    help=f"""Attempts before a message fails <int>, defaults to %(default)s""")
+    _p.add_argument(f'--backoff', default=DNA_OUTBOX_BACKOFF,
+                    help=f"""First retry delay in seconds <float>, defaults to %(default)s""")
+    _p.add_argument(f'--requeue', default=False, action='store_true',
+                    help=f'if present, put failed message(s) back in the queue')
+    _p.add_argument(f'--stats', default=False, action='store_true', help=f'if present, show message(s) per state')
+    _a = _p.parse_args()
+
+    # execute
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-20s %(levelname)-9s %(filename)-15s %(message)s')
+    if bool(_a.requeue):
+        with DnaOutbox(_a.file) as _ob:
+            dna_outbox_log.info(f'requeued {_ob.requeue()} message(s)')
+    if bool(_a.drain):
+        dna_outbox_drain(_a.file, None, int(_a.limit), None, int(_a.retries), float(_a.backoff))
+    if bool(_a.stats) or not (bool(_a.drain) or bool(_a.requeue)):
+        with DnaOutbox(_a.file) as _ob:
+            dna_outbox_log.info(f'{_ob.path}: {_ob.stats()}')
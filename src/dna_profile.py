@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from typing import Any
+
+import argparse
+import cProfile
+import io
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_profile import dna_profile_path, DnaProfile
+    with DnaProfile(dna_profile_path('dna.Kuiper.Mont4k.20200414'), memory=True, log=dna_log):
+        dna(...)
+
+    % python3 dna_profile.py --file=/var/www/ARTN-DNA/logs/dna.Kuiper.Mont4k.20200414.prof --top=40
+
+    Profiles a run with cProfile (and, with memory=True, tracemalloc) and writes the profile to <name>.prof in
+    $DNA_LOGS, next to the night's log, where pstats, snakeviz or this script can read it later. The top (by
+    cumulative time) functions, the wall and CPU time and, with memory=True, the peak traced memory and its top
+    allocation sites are logged at the end of the run. cProfile only sees the thread that runs the body: header
+    reader and archive builder workers show up as the time spent waiting on them.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_PROFILE_DIR = os.getenv('DNA_LOGS', '/var/www/ARTN-DNA/logs')
+DNA_PROFILE_FRAMES = 1
+DNA_PROFILE_SORT = 'cumulative'
+DNA_PROFILE_TOP = 25
+
+
+# +
+# logging
+# -
+dna_profile_log = logging.getLogger('dna_profile')
+
+
+# +
+# function: dna_profile_path()
+# -
+def dna_profile_path(_name: str = '', _dir: str = DNA_PROFILE_DIR) -> str:
+    """ returns <_dir>/<_name>.prof (in the current directory if _dir is not writable) """
+    _dir = _dir if (os.path.isdir(_dir) and os.access(_dir, os.W_OK)) else os.getcwd()
+    return os.path.join(_dir, f'{_name}.prof')
+
+
+# +
+# function: dna_profile_top()
+# -
+def dna_profile_top(_stats: Any = None, _top: int = DNA_PROFILE_TOP, _sort: str = DNA_PROFILE_SORT) -> str:
+    """ returns the top _top function(s) of a profile (cProfile.Profile or .prof file) as text """
+    _s = io.StringIO()
+    pstats.Stats(_stats, stream=_s).strip_dirs().sort_stats(_sort).print_stats(_top)
+    return _s.getvalue()
+
+
+# +
+# class: DnaProfile() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaProfile(object):
+    """ cProfile (and optionally tracemalloc) profile of a with statement, saved and summarized in the log """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', memory: bool = False, top: int = DNA_PROFILE_TOP, log: Any = None):
+
+        # get argument(s)
+        self.path = path
+        self.memory = memory
+        self.top = top
+        self.log = log
+
+        # private variable(s)
+        self.__profile = None
+        self.__t0 = 0.0
+        self.__c0 = 0.0
+        self.__traced = False
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}')) if \
+            (isinstance(path, str) and path.strip() != '') else dna_profile_path('dna')
+
+    @property
+    def memory(self):
+        return self.__memory
+
+    @memory.setter
+    def memory(self, memory: bool = False):
+        self.__memory = memory if isinstance(memory, bool) else False
+
+    @property
+    def top(self):
+        return self.__top
+
+    @top.setter
+    def top(self, top: int = DNA_PROFILE_TOP):
+        self.__top = top if (isinstance(top, int) and top > 0) else DNA_PROFILE_TOP
+
+    @property
+    def log(self):
+        return self.__log
+
+    @log.setter
+    def log(self, log: Any = None):
+        self.__log = log if log is not None else dna_profile_log
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+    # +
+    # method: start()
+    # -
+    def start(self) -> None:
+        """ starts profiling (and tracing memory allocations if memory is True) """
+        if self.__memory and not tracemalloc.is_tracing():
+            tracemalloc.start(DNA_PROFILE_FRAMES)
+            self.__traced = True
+        self.__profile = cProfile.Profile()
+        self.__t0, self.__c0 = time.monotonic(), time.process_time()
+        self.__profile.enable()
+
+    # +
+    # method: stop()
+    # -
+    def stop(self) -> None:
+        """ stops profiling, writes the profile and logs its summary """
+        if self.__profile is None:
+            return
+        self.__profile.disable()
+        _wall, _cpu = time.monotonic() - self.__t0, time.process_time() - self.__c0
+
+        # memory first, so the summaries below are not traced
+        _memory = ''
+        if self.__traced:
+            try:
+                _current, _peak = tracemalloc.get_traced_memory()
+                _sites = tracemalloc.take_snapshot().statistics('lineno')[:self.__top]
+                _memory = f'traced memory, current={_current / 1048576.0:.1f} MB, peak={_peak / 1048576.0:.1f} MB, ' \
+                          f'top {len(_sites)} allocation site(s):\n' + '\n'.join(f'{_s}' for _s in _sites)
+            except Exception as _e:
+                self.__log.error(f'failed to summarize memory, error={_e}')
+            finally:
+                tracemalloc.stop()
+                self.__traced = False
+
+        try:
+            self.__profile.dump_stats(self.__path)
+            self.__log.info(f'profile written to {self.__path}, wall={_wall:.2f}s, cpu={_cpu:.2f}s')
+        except Exception as _e:
+            self.__log.error(f'failed to write profile to {self.__path}, error={_e}')
+        try:
+            self.__log.info(f'top {self.__top} function(s) by {DNA_PROFILE_SORT} time:\n'
+                            f'{dna_profile_top(self.__profile, self.__top)}')
+        except Exception as _e:
+            self.__log.error(f'failed to summarize profile, error={_e}')
+        if _memory != '':
+            self.__log.info(_memory)
+        self.__profile = None
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN DNA profile summary', formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--file', default=dna_profile_path('dna'), help=f"""Profile <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--top', default=DNA_PROFILE_TOP, help=f"""Function(s) to show <int>, defaults to %(default)s""")
+    _p.add_argument(f'--sort', default=DNA_PROFILE_SORT,
+                    help=f"""Sort key <str>, defaults to '%(default)s', choices: cumulative, tottime, ncalls""")
+    _a = _p.parse_args()
+
+    # execute
+    print(dna_profile_top(_a.file, int(_a.top), _a.sort), end='')
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from dna_ledger import dna_ledger_write
+
+import json
+import os
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_scan import DnaScanner
+    _s = DnaScanner('/rts2data/Kuiper/Mont4k/20200414', 'fits', '/rts2data/Kuiper/Mont4k/20200414/.dna.scan.json')
+    _new = _s.scan()
+    ... process _new ({filename: size} of new or changed files) ...
+    _s.save()
+
+    The scanner persists, per directory, the directory mtime and the {name: [size, mtime]} of every file seen
+    plus a watermark (the newest file mtime seen). An unchanged directory is not listed again and a listed
+    directory only stats names it has not seen before. Files whose mtime is within DNA_SCAN_SETTLE seconds of
+    the watermark are still being written (or were just closed) so they are always re-stat'd.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_SCAN_SETTLE = 600.0
+DNA_SCAN_VERSION = 1
+
+
+# +
+# class: DnaScanner() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaScanner(object):
+    """ incremental directory scanner with a persisted watermark """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = '', suffix: str = 'fits', state: str = '', settle: float = DNA_SCAN_SETTLE):
+
+        # get argument(s)
+        self.path = path
+        self.suffix = suffix
+        self.state = state
+        self.settle = settle
+
+        # private variable(s)
+        self.__dirs = {}
+        self.__watermark = 0.0
+        self.__stats = 0
+        self.load()
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}'))
+
+    @property
+    def suffix(self):
+        return self.__suffix
+
+    @suffix.setter
+    def suffix(self, suffix: str = 'fits'):
+        self.__suffix = suffix if (isinstance(suffix, str) and suffix.strip() != '') else 'fits'
+
+    @property
+    def state(self):
+        return self.__state
+
+    @state.setter
+    def state(self, state: str = ''):
+        self.__state = os.path.abspath(os.path.expanduser(f'{state}')) if \
+            (isinstance(state, str) and state.strip() != '') else ''
+
+    @property
+    def settle(self):
+        return self.__settle
+
+    @settle.setter
+    def settle(self, settle: float = DNA_SCAN_SETTLE):
+        self.__settle = float(settle) if (isinstance(settle, (int, float)) and settle >= 0.0) else DNA_SCAN_SETTLE
+
+    @property
+    def watermark(self):
+        return self.__watermark
+
+    @property
+    def stats(self):
+        return self.__stats
+
+    # +
+    # method: load()
+    # -
+    def load(self) -> None:
+        """ loads persisted state (if any and if it matches this path and type) """
+        self.reset()
+        if self.__state == '':
+            return
+        try:
+            with open(f'{self.__state}', 'r') as _fr:
+                _state = json.load(_fr)
+            if _state.get('version') == DNA_SCAN_VERSION and _state.get('path') == self.__path and \
+                    _state.get('type') == self.__suffix:
+                self.__dirs = dict(_state.get('dirs', {}))
+                self.__watermark = float(_state.get('watermark', 0.0))
+        except Exception:
+            self.reset()
+
+    # +
+    # method: reset()
+    # -
+    def reset(self) -> None:
+        """ forgets all state so the next scan() is a full scan """
+        self.__dirs, self.__watermark = {}, 0.0
+
+    # +
+    # method: save()
+    # -
+    def save(self) -> None:
+        """ persists the state of the last scan() """
+        if self.__state == '':
+            return
+        dna_ledger_write(self.__state, [json.dumps({
+            'version': DNA_SCAN_VERSION, 'path': self.__path, 'type': self.__suffix,
+            'watermark': self.__watermark, 'dirs': self.__dirs})])
+
+    # +
+    # method: scan()
+    # -
+    def scan(self) -> dict:
+        """ returns dictionary of {filename: size} for new or changed files of given type in path """
+        _new, _scanned, self.__stats = {}, {}, 0
+        _threshold = self.__watermark - self.__settle
+        _watermark = self.__watermark
+        try:
+            _stack = [(self.__path, os.stat(self.__path).st_mtime)]
+            self.__stats += 1
+        except Exception:
+            return {}
+
+        while _stack:
+            _dir, _mtime = _stack.pop()
+            _old = self.__dirs.get(_dir, None)
+            _files, _subdirs = {}, []
+
+            # unchanged directory: no listing, only re-stat files that may still be settling
+            if _old is not None and _old.get('mtime') == _mtime:
+                for _name, (_size, _fmtime) in _old.get('files', {}).items():
+                    if _fmtime >= _threshold:
+                        try:
+                            _st = os.stat(os.path.join(_dir, _name), follow_symlinks=False)
+                            self.__stats += 1
+                        except Exception:
+                            continue
+                        _size, _fmtime = self.__seen(_new, os.path.join(_dir, _name), _size, _fmtime, _st)
+                    _files[_name] = [_size, _fmtime]
+                    _watermark = max(_watermark, _fmtime)
+                _subdirs = list(_old.get('dirs', []))
+
+            # changed (or new) directory: list it, but only stat names not seen before (or settling)
+            else:
+                _old_files = _old.get('files', {}) if _old is not None else {}
+                try:
+                    with os.scandir(_dir) as _it:
+                        for _entry in _it:
+                            if _entry.is_dir(follow_symlinks=False):
+                                if 'stitched' not in _entry.name:
+                                    _subdirs.append(_entry.name)
+                            elif _entry.is_file(follow_symlinks=False) and _entry.name.endswith(self.__suffix) and \
+                                    'stitched' not in _entry.path:
+                                _size, _fmtime = _old_files.get(_entry.name, (None, None))
+                                if _fmtime is None or _fmtime >= _threshold:
+                                    try:
+                                        _st = _entry.stat(follow_symlinks=False)
+                                        self.__stats += 1
+                                    except Exception:
+                                        continue
+                                    _size, _fmtime = self.__seen(_new, _entry.path, _size, _fmtime, _st)
+                                _files[_entry.name] = [_size, _fmtime]
+                                _watermark = max(_watermark, _fmtime)
+                except Exception:
+                    continue
+
+            # descend
+            for _name in _subdirs:
+                try:
+                    _stack.append((os.path.join(_dir, _name), os.stat(os.path.join(_dir, _name)).st_mtime))
+                    self.__stats += 1
+                except Exception:
+                    continue
+            _scanned[_dir] = {'mtime': _mtime, 'dirs': sorted(_subdirs), 'files': _files}
+
+        self.__dirs, self.__watermark = _scanned, _watermark
+        return dict(sorted(_new.items()))
+
+    # +
+    # method: files()
+    # -
+    def files(self) -> dict:
+        """ returns dictionary of {filename: size} for all files known to the scanner """
+        return {os.path.join(_d, _n): _v[0] for _d, _r in self.__dirs.items() for _n, _v in _r['files'].items()}
+
+    # +
+    # method: __seen()
+    # -
+    @staticmethod
+    def __seen(_new: dict = None, _file: str = '', _size: int = None, _mtime: float = None, _st=None) -> tuple:
+        """ records _file in _new if its stat differs from what was seen before """
+        if _st.st_size != _size or _st.st_mtime != _mtime:
+            _new[_file] = _st.st_size
+        return _st.st_size, _st.st_mtime
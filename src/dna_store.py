@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from typing import Optional
+
+import hashlib
+import json
+import os
+import sqlite3
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_store import DnaStore
+    with DnaStore('/var/www/ARTN-ORP/instance/files/.dna.store.sqlite') as _s:
+        _address = _s.address(_file, _st.st_size, _st.st_mtime_ns)
+        _found = _s.locate(_address, 'gz:9')  # (archive, manifest entry) or None
+        ...
+        _s.record('/var/www/ARTN-ORP/instance/files/Kuiper.Mont4k.20200414.dark.tgz', _manifest)
+
+    Content-addressed index of the compressed members of published archives. A member's address is the sha256
+    of its tar header and the sha256 of its FITS payload (as computed while it was compressed or, in a tar
+    archive, while the archive was verified for publication), so a frame that has been compressed (with a given
+    codec) into any archive can be copied, still compressed, into any other: each frame is compressed once per
+    night whatever the number of archives it appears in. An archive
+    whose members (in order) and codec are those of an existing archive is its twin, and is published as a
+    hard link. Entries are only used while the archive holding them has the size and mtime recorded for it;
+    stale entries are removed as they are found.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_STORE_FILE = '.dna.store.sqlite'
+DNA_STORE_TIMEOUT = 60.0
+
+
+# +
+# function: dna_store_digest()
+# -
+def dna_store_digest(_addresses: list = None, _codec: str = '') -> Optional[str]:
+    """ returns the digest of an archive's member addresses and codec (None if any address is unknown) """
+    if not _addresses or any(_a is None for _a in _addresses):
+        return None
+    return hashlib.sha256('\n'.join([f'{_codec}'] + list(_addresses)).encode()).hexdigest()
+
+
+# +
+# class: DnaStore() inherits from the object class
+# -
+# noinspection PyBroadException
+class DnaStore(object):
+    """ content-addressed index of compressed archive members keyed by sha256 """
+
+    # +
+    # method: __init__
+    # -
+    def __init__(self, path: str = ''):
+
+        # get argument(s)
+        self.path = path
+
+        # private variable(s)
+        self.__db = None
+        self.__shared = 0
+
+    # +
+    # Decorator(s)
+    # -
+    @property
+    def path(self):
+        return self.__path
+
+    @path.setter
+    def path(self, path: str = ''):
+        self.__path = os.path.abspath(os.path.expanduser(f'{path}')) if \
+            (isinstance(path, str) and path.strip() != '') else ''
+
+    @property
+    def shared(self):
+        return self.__shared
+
+    # +
+    # method: __enter__, __exit__
+    # -
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    # +
+    # method: open()
+    # -
+    def open(self) -> None:
+        """ opens (and if necessary creates) the store """
+        if self.__db is not None:
+            return
+        self.__db = sqlite3.connect(self.__path, timeout=DNA_STORE_TIMEOUT)
+        self.__db.execute('PRAGMA journal_mode=WAL')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS files (path TEXT, size INTEGER, mtime INTEGER, address TEXT, '
+                          'PRIMARY KEY (path, size, mtime))')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS members (address TEXT, codec TEXT, archive TEXT, '
+                          'entry TEXT, PRIMARY KEY (address, codec, archive))')
+        self.__db.execute('CREATE TABLE IF NOT EXISTS archives (archive TEXT PRIMARY KEY, codec TEXT, digest TEXT, '
+                          'size INTEGER, mtime INTEGER)')
+        self.__db.execute('CREATE INDEX IF NOT EXISTS archives_digest ON archives (digest, codec)')
+        self.__db.commit()
+
+    # +
+    # method: close()
+    # -
+    def close(self) -> None:
+        """ closes the store """
+        if self.__db is None:
+            return
+        try:
+            self.__db.commit()
+        finally:
+            self.__db.close()
+            self.__db = None
+
+    # +
+    # method: valid()
+    # -
+    def valid(self, _archive: str = '') -> bool:
+        """ returns True if _archive is as recorded, otherwise forgets it """
+        self.open()
+        _row = self.__db.execute('SELECT size, mtime FROM archives WHERE archive=?', (f'{_archive}',)).fetchone()
+        try:
+            _st = os.stat(_archive)
+            if _row is not None and _row[0] == _st.st_size and _row[1] == _st.st_mtime_ns:
+                return True
+        except Exception:
+            pass
+        self.forget(_archive)
+        return False
+
+    # +
+    # method: forget()
+    # -
+    def forget(self, _archive: str = '') -> None:
+        """ removes _archive and its members from the store """
+        self.open()
+        self.__db.execute('DELETE FROM members WHERE archive=?', (f'{_archive}',))
+        self.__db.execute('DELETE FROM archives WHERE archive=?', (f'{_archive}',))
+        self.__db.execute('DELETE FROM files WHERE address NOT IN (SELECT address FROM members)')
+        self.__db.commit()
+
+    # +
+    # method: address()
+    # -
+    def address(self, _file: str = '', _size: int = -1, _mtime: int = -1) -> Optional[str]:
+        """ returns the address of the member last built from _file (as it is now) or None """
+        self.open()
+        _row = self.__db.execute('SELECT address FROM files WHERE path=? AND size=? AND mtime=?',
+                                 (f'{_file}', int(_size), int(_mtime))).fetchone()
+        return _row[0] if _row is not None else None
+
+    # +
+    # method: locate()
+    # -
+    def locate(self, _address: str = None, _codec: str = '') -> Optional[tuple]:
+        """ returns (archive, manifest entry) of a valid archive holding _address compressed with _codec or None """
+        if _address is None:
+            return None
+        self.open()
+        for _archive, _entry in self.__db.execute('SELECT archive, entry FROM members WHERE address=? AND codec=?',
+                                                  (f'{_address}', f'{_codec}')).fetchall():
+            if self.valid(_archive):
+                self.__shared += 1
+                return _archive, json.loads(_entry)
+        return None
+
+    # +
+    # method: twin()
+    # -
+    def twin(self, _digest: str = None, _codec: str = '', _exclude: str = '') -> Optional[str]:
+        """ returns a valid archive other than _exclude with the given member digest and codec or None """
+        if _digest is None:
+            return None
+        self.open()
+        for (_archive,) in self.__db.execute('SELECT archive FROM archives WHERE digest=? AND codec=?',
+                                             (f'{_digest}', f'{_codec}')).fetchall():
+            if _archive != f'{_exclude}' and self.valid(_archive):
+                return _archive
+        return None
+
+    # +
+    # method: record()
+    # -
+    def record(self, _archive: str = '', _manifest: dict = None) -> None:
+        """ records the members of a (just published) archive described by _manifest """
+        self.open()
+        _codec, _members = _manifest['codec'], _manifest['members']
+        self.__db.execute('DELETE FROM members WHERE archive=?', (f'{_archive}',))
+        _digest = dna_store_digest([_m.get('address') for _m in _members], _codec)
+        self.__db.execute('INSERT OR REPLACE INTO archives (archive, codec, digest, size, mtime) '
+                          'VALUES (?, ?, ?, ?, ?)',
+                          (f'{_archive}', _codec, _digest, _manifest['size'], _manifest['mtime']))
+        _rows = [_m for _m in _members if _m.get('address') is not None]
+        self.__db.executemany('INSERT OR REPLACE INTO files (path, size, mtime, address) VALUES (?, ?, ?, ?)',
+                              [(_m['file'], _m['size'], _m['mtime'], _m['address']) for _m in _rows])
+        self.__db.executemany('INSERT OR REPLACE INTO members (address, codec, archive, entry) VALUES (?, ?, ?, ?)',
+                              [(_m['address'], _codec, f'{_archive}', json.dumps(_m)) for _m in _rows])
+        self.__db.commit()
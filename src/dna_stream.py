@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import argparse
+import glob
+import io
+import logging
+import os
+import re
+import tarfile
+
+from dna_ledger import DnaLedger
+from dna_tgz import dna_tgz_stream, DNA_TGZ_TYPES
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    % python3 dna_stream.py --host=localhost --port=8090 --data=/rts2data
+
+    Serves archives on demand, streamed straight from the data directory with bounded memory, instead of
+    pre-building them into DNA_TGZ_DIR:
+
+        GET /<tel>/<ins>/<iso>/<type>.tgz      calibration frames, <type> one of DNA_TGZ_TYPES
+        GET /<tel>/<ins>/<iso>/<oid>.tgz       frames of an OID (or a unique prefix of at least 8 characters)
+                                               as recorded in /<data>/<tel>/<ins>/<iso>/.dna.json
+
+    '.tar' instead of '.tgz' gives an uncompressed archive (with a Content-Length). Put it behind the web server
+    (proxy) and set $DNA_STREAM_URL to its public URL, then 'dna.py --stream' links to it and builds nothing.
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_STREAM_CODECS = {'.tgz': 'gz:1', '.tar': 'tar'}
+DNA_STREAM_DATA = '/rts2data'
+DNA_STREAM_HOST = 'localhost'
+DNA_STREAM_JSON = '.dna.json'
+DNA_STREAM_PATH = re.compile(r'^/([A-Za-z0-9_-]+)/([A-Za-z0-9_-]+)/([0-9]{8})/([A-Za-z0-9]+)(\.tgz|\.tar)$')
+DNA_STREAM_OID = re.compile(r'^[0-9a-f]{8,32}$')
+DNA_STREAM_PORT = 8090
+DNA_STREAM_URL = os.getenv('DNA_STREAM_URL', '').rstrip('/')
+
+
+# +
+# logging
+# -
+dna_stream_log = logging.getLogger('dna_stream')
+
+
+# +
+# function: dna_stream_url()
+# -
+def dna_stream_url(_tel: str = 'Kuiper', _ins: str = 'Mont4k', _iso: str = '', _what: str = '',
+                   _suffix: str = '.tgz') -> str:
+    """ returns the on-demand archive link for a calibration type or OID ('' if $DNA_STREAM_URL is not set) """
+    return f'{DNA_STREAM_URL}/{_tel}/{_ins}/{_iso}/{_what}{_suffix}' if DNA_STREAM_URL != '' else ''
+
+
+# +
+# function: dna_stream_files()
+# -
+def dna_stream_files(_tel: str = 'Kuiper', _ins: str = 'Mont4k', _iso: str = '', _what: str = '',
+                     _data: str = DNA_STREAM_DATA) -> list:
+    """ returns the frame(s) of a calibration type or OID for one night """
+    _night = os.path.join(_data, _tel, _ins, _iso)
+    if _what in DNA_TGZ_TYPES:
+        return sorted(glob.glob(os.path.join(_night, _what, '*.fits')))
+    if DNA_STREAM_OID.match(_what) is None or not os.path.isfile(os.path.join(_night, DNA_STREAM_JSON)):
+        return []
+    _ledger = DnaLedger(os.path.join(_night, DNA_STREAM_JSON))
+    _ledger.load()
+    _oids = _ledger.oids()
+    if _what in _oids:
+        return _oids[_what]
+    _matches = [_k for _k in _oids if _k.startswith(_what)]
+    return _oids[_matches[0]] if len(_matches) == 1 else []
+
+
+# +
+# function: dna_stream_length()
+# -
+def dna_stream_length(_files: list = None) -> int:
+    """ returns the size of the uncompressed archive of _files """
+    _tar, _blocks = tarfile.open(fileobj=io.BytesIO(), mode='w'), 0
+    for _f in list(dict.fromkeys(_files or [])):
+        _info = _tar.gettarinfo(f'{_f}')
+        _blocks += len(_info.tobuf(_tar.format, _tar.encoding, _tar.errors)) // tarfile.BLOCKSIZE
+        _blocks += -(-_info.size // tarfile.BLOCKSIZE)
+    _blocks += 2
+    return (_blocks * tarfile.BLOCKSIZE + tarfile.RECORDSIZE - 1) // tarfile.RECORDSIZE * tarfile.RECORDSIZE
+
+
+# +
+# class: DnaStreamHandler() inherits from the BaseHTTPRequestHandler class
+# -
+# noinspection PyBroadException
+class DnaStreamHandler(BaseHTTPRequestHandler):
+    """ GET handler streaming archives of /<tel>/<ins>/<iso>/<type or oid>.<tgz|tar> """
+
+    server_version = 'DNA'
+
+    def log_message(self, _format: str = '', *_args) -> None:
+        dna_stream_log.info(f'{self.address_string()} {_format % _args}')
+
+    def do_GET(self) -> None:
+        _match = DNA_STREAM_PATH.match(unquote(self.path.split('?')[0]))
+        if _match is None:
+            self.send_error(404)
+            return
+        _tel, _ins, _iso, _what, _suffix = _match.groups()
+        _data = os.path.realpath(self.server.data)
+        _files = [_f for _f in dna_stream_files(_tel, _ins, _iso, _what, _data)
+                  if os.path.realpath(_f).startswith(f'{_data}{os.sep}') and os.path.isfile(_f)]
+        if not _files:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/gzip' if _suffix == '.tgz' else 'application/x-tar')
+        self.send_header('Content-Disposition', f'attachment; filename="{_tel}.{_ins}.{_iso}.{_what}{_suffix}"')
+        if _suffix == '.tar':
+            self.send_header('Content-Length', f'{dna_stream_length(_files)}')
+        self.end_headers()
+        try:
+            for _chunk in dna_tgz_stream(_files, DNA_STREAM_CODECS[_suffix]):
+                if _chunk:
+                    self.wfile.write(_chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            dna_stream_log.warning(f'{self.address_string()} disconnected during {self.path}')
+        except Exception as _e:
+            dna_stream_log.error(f'failed to stream {self.path}, error={_e}')
+        self.close_connection = True
+
+
+# +
+# function: dna_stream_serve()
+# -
+def dna_stream_serve(_host: str = DNA_STREAM_HOST, _port: int = DNA_STREAM_PORT, _data: str = DNA_STREAM_DATA) -> None:
+    """ serves on-demand archives until interrupted """
+    _server = ThreadingHTTPServer((_host, _port), DnaStreamHandler)
+    _server.daemon_threads = True
+    _server.data = os.path.abspath(os.path.expanduser(_data))
+    dna_stream_log.info(f'serving {_server.data} on http://{_host}:{_port}/')
+    try:
+        _server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        _server.server_close()
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN on-demand archive server',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--host', default=DNA_STREAM_HOST, help=f"""Host <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--port', default=DNA_STREAM_PORT, help=f"""Port <int>, defaults to %(default)s""")
+    _p.add_argument(f'--data', default=DNA_STREAM_DATA, help=f"""Data root <str>, defaults to '%(default)s'""")
+    _a = _p.parse_args()
+
+    # execute
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-20s %(levelname)-9s %(filename)-15s %(message)s')
+    dna_stream_serve(_host=_a.host, _port=int(_a.port), _data=_a.data)
@@ -0,0 +1,722 @@
+#!/usr/bin/env python3
+
+
+# +
+# import(s)
+# -
+from concurrent.futures import as_completed, ProcessPoolExecutor
+from typing import Any, Iterator
+
+import argparse
+import glob
+import hashlib
+import io
+import json
+import logging
+import lzma
+import multiprocessing
+import os
+import tarfile
+import tempfile
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from dna_metrics import DnaMetrics
+from dna_store import dna_store_digest, DnaStore, DNA_STORE_FILE
+
+
+# +
+# doc string
+# -
+__doc__ = """
+    from dna_tgz import dna_tgz_builds
+    _results = dna_tgz_builds({'/var/www/ARTN-ORP/instance/files/Kuiper.Mont4k.20200414.dark.tgz': [...],
+                               '/var/www/ARTN-ORP/instance/files/Kuiper.Mont4k.20200414.flat.tgz': [...]},
+                              workers=4, log=dna_log)
+
+    Builds independent archives concurrently, one archive per worker process (largest first), with at most
+    workers archives in progress at any time. Each archive's file count, input and output size, elapsed time
+    and throughput is logged as it completes.
+
+    Codecs are given as '<codec>[:<level>]', one of 'tar' (uncompressed), 'gz' (level 0-9), 'xz' (preset 0-9)
+    or 'zstd' (level 1-22, needs the zstandard module); codec may be one spec or {archive: spec}. The archive
+    name's '.tgz' suffix is replaced to match the codec by dna_tgz_name(). Calibration and object archives
+    default to $DNA_TGZ_CALIBRATION and $DNA_TGZ_OBJECT (else 'gz', i.e. level 9 as before).
+
+    Each tar member is compressed as its own gzip member (xz stream, zstd frame), followed by one for the end of
+    archive blocks, so the archive is still a plain .tgz (gzip, tar and tarfile read concatenated members) and
+    a manifest (<archive>.manifest: member names, sizes, mtimes, sha256 checksums and compressed byte ranges) is
+    written beside it. On the next build an unchanged dataset is skipped without reading any frame; otherwise
+    the archive is rebuilt into a new file by copying unchanged members' compressed byte ranges from the old
+    archive (kernel-side) and encoding only new or changed frames. Nothing is appended in place: the I/O is
+    still that of writing the whole archive, only the compression work is saved.
+
+    Archives are never written in place: each is written to a hidden temporary file in the same directory,
+    fsync'd, verified (its size, and the member and trailer magic at the manifest offsets), chown'd/chmod'd and
+    then os.replace()'d over the old one, so the web portal only ever serves complete archives. The sha256
+    streamed while writing is trusted; the archive is only re-read to hash it when that is not known (members
+    copied kernel-side) or $DNA_TGZ_VERIFY is set. The manifest is the completion
+    marker: it is written (atomically) last and records the archive's size, mtime and sha256, so "already
+    built" is a stat() of the archive compared with its manifest rather than trusting whatever file is there.
+
+    Uncompressed ('tar') archives never copy frame data through Python: tar headers are written by
+    TarInfo.tobuf() and payloads (like compressed byte ranges copied from an old archive) are moved kernel-side
+    by os.copy_file_range() (a reflink on filesystems that support it), else os.sendfile(), else read()/write().
+    Their per-member sha256 checksums and dna_store addresses are computed from the manifest offsets in the one
+    pass that dna_tgz_publish() makes over the archive anyway, so each payload is read through Python once.
+
+    dna_tgz_stream(_files, _codec) yields the same archive as a byte stream (one chunk at a time, so memory is
+    bounded whatever the archive size) without writing anything, see dna_stream.py.
+
+    % python3 dna_tgz.py --help
+"""
+
+
+# +
+# constant(s)
+# -
+DNA_TGZ_DATA = '/rts2data'
+DNA_TGZ_DIR = '/var/www/ARTN-ORP/instance/files'
+DNA_TGZ_CHMOD = 0o775
+DNA_TGZ_CHUNK = 1048576
+DNA_TGZ_CONTEXT = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+DNA_TGZ_CODECS = {'tar': (None, '.tar', None, None), 'gz': ((0, 9), '.tgz', 9, b'\x1f\x8b'),
+                  'xz': ((0, 9), '.tar.xz', 6, b'\xfd7zXZ\x00'), 'zstd': ((1, 22), '.tar.zst', 3, b'\x28\xb5\x2f\xfd')}
+DNA_TGZ_MANIFEST = '.manifest'
+DNA_TGZ_CALIBRATION = os.getenv('DNA_TGZ_CALIBRATION', 'gz')
+DNA_TGZ_OBJECT = os.getenv('DNA_TGZ_OBJECT', 'gz')
+DNA_TGZ_STALE = 86400.0
+DNA_TGZ_GROUP = {'www-data': 33}
+DNA_TGZ_OWNER = {'www-data': 33}
+DNA_TGZ_VERIFY = os.getenv('DNA_TGZ_VERIFY', 'False').strip().lower() in ('1', 'true', 'yes')
+DNA_TGZ_TYPES = ['bias', 'calibration', 'dark', 'flat', 'focus', 'skyflat', 'standard']
+DNA_TGZ_WORKERS = 4
+
+
+# +
+# logging
+# -
+dna_tgz_log = logging.getLogger('dna_tgz')
+
+
+# +
+# function: dna_tgz_codec()
+# -
+def dna_tgz_codec(_codec: str = 'gz') -> tuple:
+    """ returns (codec, level) for '<codec>[:<level>]' (level None for tar) or raises ValueError """
+    _name, _, _level = f'{_codec}'.strip().lower().partition(':')
+    if _name not in DNA_TGZ_CODECS:
+        raise ValueError(f'unknown codec {_codec}, choices: {list(DNA_TGZ_CODECS)}')
+    if _name == 'zstd' and zstandard is None:
+        raise ValueError(f'codec {_codec} needs the zstandard module')
+    if _level == '':
+        return _name, DNA_TGZ_CODECS[_name][2]
+    _range = DNA_TGZ_CODECS[_name][0]
+    if _range is None or not _level.lstrip('-').isdigit() or not _range[0] <= int(_level) <= _range[1]:
+        raise ValueError(f'invalid level for codec {_codec}, range: {_range}')
+    return _name, int(_level)
+
+
+# +
+# function: dna_tgz_name()
+# -
+def dna_tgz_name(_tgz: str = '', _codec: str = 'gz') -> str:
+    """ returns the archive name with the suffix of _codec (so 'x.tgz' stays 'x.tgz' for gz) """
+    _base = _tgz[:-4] if _tgz.endswith('.tgz') else _tgz
+    return f'{_base}{DNA_TGZ_CODECS[dna_tgz_codec(_codec)[0]][1]}'
+
+
+# +
+# class: DnaTgzRaw() inherits from the object class
+# -
+class DnaTgzRaw(object):
+    """ 'compressor' for uncompressed tar members """
+
+    def compress(self, _data: bytes = b'') -> bytes:
+        return _data
+
+    def flush(self) -> bytes:
+        return b''
+
+
+# +
+# class: DnaTgzWriter() inherits from the object class
+# -
+class DnaTgzWriter(object):
+    """ binary file writer that keeps the length and (until copy() is used) sha256 of everything written """
+
+    def __init__(self, fw: Any = None):
+        self.__fw = fw
+        self.__sha256 = hashlib.sha256()
+        self.__size = 0
+
+    @property
+    def sha256(self):
+        return self.__sha256.hexdigest() if self.__sha256 is not None else None
+
+    def tell(self) -> int:
+        return self.__size
+
+    def write(self, _data: bytes = b'') -> int:
+        if self.__sha256 is not None:
+            self.__sha256.update(_data)
+        self.__size += len(_data)
+        return self.__fw.write(_data)
+
+    def copy(self, _fr: Any = None, _offset: int = 0, _length: int = 0) -> None:
+        """ appends _length bytes at _offset of _fr kernel-side (so they are no longer hashed) """
+        self.__fw.flush()
+        self.__sha256 = None
+        _in, _out, _done = _fr.fileno(), self.__fw.fileno(), 0
+        for _kernel in ('copy_file_range', 'sendfile'):
+            try:
+                while _done < _length:
+                    _n = os.copy_file_range(_in, _out, _length - _done, _offset + _done) \
+                        if _kernel == 'copy_file_range' else os.sendfile(_out, _in, _offset + _done, _length - _done)
+                    if _n == 0:
+                        break
+                    _done += _n
+                break
+            except (AttributeError, OSError):
+                continue
+        self.__fw.seek(0, os.SEEK_END)
+        _fr.seek(_offset + _done)
+        while _done < _length:
+            _data = _fr.read(min(_length - _done, DNA_TGZ_CHUNK))
+            if not _data:
+                raise OSError(f'{_fr.name} truncated while copying')
+            self.__fw.write(_data)
+            _done += len(_data)
+        self.__size += _length
+
+
+# +
+# function: dna_tgz_compressor()
+# -
+def dna_tgz_compressor(_codec: str = 'gz') -> Any:
+    """ returns a new compressor (with compress() and flush()) producing one self-contained member of _codec """
+    _name, _level = dna_tgz_codec(_codec)
+    if _name == 'gz':
+        return zlib.compressobj(_level, zlib.DEFLATED, 31)
+    if _name == 'xz':
+        return lzma.LZMACompressor(format=lzma.FORMAT_XZ, preset=_level)
+    if _name == 'zstd':
+        return zstandard.ZstdCompressor(level=_level).compressobj()
+    return DnaTgzRaw()
+
+
+# +
+# function: dna_tgz_manifest()
+# -
+# noinspection PyBroadException
+def dna_tgz_manifest(_tgz: str = '', _codec: str = None) -> Any:
+    """ returns the manifest of _tgz if it describes the archive as it is on disk (and was built with _codec) """
+    try:
+        with open(f'{_tgz}{DNA_TGZ_MANIFEST}', 'r') as _fr:
+            _manifest = json.load(_fr)
+        _st = os.stat(_tgz)
+        if (_codec is None or dna_tgz_codec(_manifest['codec']) == dna_tgz_codec(_codec)) and \
+                _st.st_size == _manifest['size'] and _st.st_mtime_ns == _manifest['mtime'] and \
+                _manifest['trailer'] == sum(_m['length'] for _m in _manifest['members']):
+            return _manifest
+    except Exception:
+        pass
+    return None
+
+
+# +
+# function: dna_tgz_version()
+# -
+def dna_tgz_version(_tgz: str = '', _files: list = None) -> str:
+    """ returns the content identity of an archive: the sha256 in its manifest if it is built, else the sha256 of
+        its file list (on-demand archives), so a notice keyed on it is sent once per version of the archive """
+    _manifest = dna_tgz_manifest(_tgz)
+    if _manifest is not None and _manifest.get('sha256'):
+        return _manifest['sha256']
+    return hashlib.sha256('\n'.join(sorted(f'{_f}' for _f in (_files or []))).encode()).hexdigest()
+
+
+# +
+# function: dna_tgz_member()
+# -
+def dna_tgz_member(_fw: Any = None, _file: str = '', _codec: str = 'gz', _tar: Any = None) -> dict:
+    """ writes _file as one compressed tar member at the current offset of _fw and returns its manifest entry """
+    _z, _h, _offset = dna_tgz_compressor(_codec), hashlib.sha256(), _fw.tell()
+    with open(f'{_file}', 'rb') as _fr:
+        _st = os.fstat(_fr.fileno())
+        _info = _tar.gettarinfo(f'{_file}', fileobj=_fr)
+        _buf = _info.tobuf(_tar.format, _tar.encoding, _tar.errors)
+        _fw.write(_z.compress(_buf))
+        if isinstance(_z, DnaTgzRaw):
+            # payload copied kernel-side, its sha256 (and address) are filled in by dna_tgz_publish()
+            _fw.copy(_fr, 0, _info.size)
+            _h = None
+        else:
+            _left = _info.size
+            while _left > 0:
+                _data = _fr.read(min(_left, DNA_TGZ_CHUNK))
+                if not _data:
+                    raise OSError(f'{_file} truncated while archiving')
+                _h.update(_data)
+                _fw.write(_z.compress(_data))
+                _left -= len(_data)
+    _fw.write(_z.compress(b'\0' * (-_info.size % tarfile.BLOCKSIZE)))
+    _fw.write(_z.flush())
+    return {'file': f'{_file}', 'name': _info.name, 'size': _info.size, 'mtime': _st.st_mtime_ns,
+            'sha256': _h.hexdigest() if _h is not None else None,
+            'address': hashlib.sha256(_buf + _h.digest()).hexdigest() if _h is not None else None,
+            'blocks': len(_buf) // tarfile.BLOCKSIZE + -(-_info.size // tarfile.BLOCKSIZE), 'offset': _offset,
+            'length': _fw.tell() - _offset}
+
+
+# +
+# function: dna_tgz_trailer()
+# -
+def dna_tgz_trailer(_fw: Any = None, _members: list = None, _codec: str = 'gz') -> None:
+    """ writes the end of archive blocks (padded to a whole tar record) as the last compressed member """
+    _z = dna_tgz_compressor(_codec)
+    _size = (sum(_m['blocks'] for _m in (_members or [])) + 2) * tarfile.BLOCKSIZE
+    _fw.write(_z.compress(b'\0' * (2 * tarfile.BLOCKSIZE + -_size % tarfile.RECORDSIZE)))
+    _fw.write(_z.flush())
+
+
+# +
+# function: dna_tgz_stream()
+# -
+def dna_tgz_stream(_files: list = None, _codec: str = 'gz') -> Iterator[bytes]:
+    """ yields the archive of _files with _codec chunk by chunk """
+    _tar = tarfile.open(fileobj=io.BytesIO(), mode='w')
+    _blocks = 0
+    for _file in list(dict.fromkeys(f'{_f}' for _f in (_files or []))):
+        _z = dna_tgz_compressor(_codec)
+        with open(f'{_file}', 'rb') as _fr:
+            _info = _tar.gettarinfo(f'{_file}', fileobj=_fr)
+            _buf = _info.tobuf(_tar.format, _tar.encoding, _tar.errors)
+            yield _z.compress(_buf)
+            _left = _info.size
+            while _left > 0:
+                _data = _fr.read(min(_left, DNA_TGZ_CHUNK))
+                if not _data:
+                    raise OSError(f'{_file} truncated while streaming')
+                yield _z.compress(_data)
+                _left -= len(_data)
+        yield _z.compress(b'\0' * (-_info.size % tarfile.BLOCKSIZE)) + _z.flush()
+        _blocks += len(_buf) // tarfile.BLOCKSIZE + -(-_info.size // tarfile.BLOCKSIZE)
+    _z = dna_tgz_compressor(_codec)
+    yield _z.compress(b'\0' * (2 * tarfile.BLOCKSIZE + -(_blocks + 2) * tarfile.BLOCKSIZE % tarfile.RECORDSIZE))
+    yield _z.flush()
+
+
+# +
+# function: dna_tgz_size()
+# -
+# noinspection PyBroadException
+def dna_tgz_size(_files: list = None) -> int:
+    """ returns the total size of _files (ignoring any that cannot be stat'd) """
+    _size = 0
+    for _f in (_files or []):
+        try:
+            _size += os.path.getsize(_f)
+        except Exception:
+            pass
+    return _size
+
+
+# +
+# function: dna_tgz_dump()
+# -
+# noinspection PyBroadException
+def dna_tgz_dump(_file: str = '', _data: dict = None) -> None:
+    """ writes _data as JSON to _file atomically (unique temporary file, fsync, rename) """
+    _dir = os.path.dirname(os.path.abspath(f'{_file}'))
+    _fd, _tmp = tempfile.mkstemp(prefix=f'.{os.path.basename(_file)}.', suffix='.tmp', dir=_dir)
+    try:
+        with os.fdopen(_fd, 'w') as _fw:
+            json.dump(_data, _fw, indent=1)
+            _fw.flush()
+            os.fsync(_fw.fileno())
+        try:
+            _st = os.stat(_file)
+            os.chmod(_tmp, _st.st_mode & 0o7777)
+            os.chown(_tmp, _st.st_uid, _st.st_gid)
+        except FileNotFoundError:
+            os.chmod(_tmp, DNA_TGZ_CHMOD & 0o666)
+        except Exception:
+            pass
+        os.replace(_tmp, f'{_file}')
+    except Exception:
+        if os.path.exists(_tmp):
+            os.remove(_tmp)
+        raise
+    dna_tgz_sync(_dir)
+
+
+# +
+# function: dna_tgz_sync()
+# -
+def dna_tgz_sync(_path: str = '') -> None:
+    """ fsync()s a directory so a rename within it is durable """
+    _fd = os.open(f'{_path}', os.O_RDONLY)
+    try:
+        os.fsync(_fd)
+    finally:
+        os.close(_fd)
+
+
+# +
+# function: dna_tgz_digest()
+# -
+def dna_tgz_digest(_fr: Any = None, _members: list = None) -> str:
+    """ returns the sha256 of _fr, read once from the start, filling in the sha256 and address of the (tar)
+        member(s) of _members copied kernel-side on the way """
+    _h, _pos = hashlib.sha256(), 0
+    _fr.seek(0)
+
+    def _through(_end: int = -1, _hm: Any = None) -> None:
+        nonlocal _pos
+        while _end < 0 or _pos < _end:
+            _data = _fr.read(DNA_TGZ_CHUNK if _end < 0 else min(_end - _pos, DNA_TGZ_CHUNK))
+            if not _data:
+                if _end < 0:
+                    return
+                raise OSError(f'{_fr.name} short while hashing')
+            _h.update(_data)
+            if _hm is not None:
+                _hm.update(_data)
+            _pos += len(_data)
+
+    for _m in sorted((_m for _m in (_members or []) if _m.get('sha256') is None), key=lambda _m: _m['offset']):
+        _through(_m['offset'])
+        _buf = _fr.read((_m['blocks'] + _m['size'] // -tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE)
+        _h.update(_buf)
+        _pos += len(_buf)
+        _hm = hashlib.sha256()
+        _through(_pos + _m['size'], _hm)
+        _m['sha256'], _m['address'] = _hm.hexdigest(), hashlib.sha256(_buf + _hm.digest()).hexdigest()
+    _through()
+    return _h.hexdigest()
+
+
+# +
+# function: dna_tgz_publish()
+# -
+# noinspection PyBroadException
+def dna_tgz_publish(_tmp: str = '', _tgz: str = '', _size: int = 0, _sha256: str = None, _members: list = None,
+                    _trailer: int = 0, _codec: str = 'gz', _verify: bool = DNA_TGZ_VERIFY) -> tuple:
+    """ verifies the (fsync'd) temporary file _tmp, sets ownership and mode, renames it over _tgz and returns
+        (warning, sha256): the file is only re-read (filling in the sha256 of member(s) copied kernel-side) if
+        its sha256 is not known or _verify """
+    _magic = DNA_TGZ_CODECS[dna_tgz_codec(_codec)[0]][3]
+    with open(f'{_tmp}', 'rb') as _fr:
+        if os.fstat(_fr.fileno()).st_size != _size:
+            raise OSError(f'{_tmp} failed verification')
+        _h = _sha256
+        if _sha256 is None or _verify or any(_m.get('sha256') is None for _m in (_members or [])):
+            _h = dna_tgz_digest(_fr, _members)
+            if _sha256 is not None and _h != _sha256:
+                raise OSError(f'{_tmp} failed verification')
+        # every member (and the trailer) must start where the manifest says it does
+        for _offset in [_m['offset'] for _m in (_members or [])] + [_trailer]:
+            _fr.seek(_offset)
+            _block = _fr.read(tarfile.BLOCKSIZE)
+            try:
+                if _magic is not None and not _block.startswith(_magic):
+                    raise ValueError
+                if _magic is None and _offset != _trailer:
+                    tarfile.TarInfo.frombuf(_block, tarfile.ENCODING, 'surrogateescape')
+                if _magic is None and _offset == _trailer and _block != b'\0' * tarfile.BLOCKSIZE:
+                    raise ValueError
+            except Exception:
+                raise OSError(f'{_tmp} failed verification at offset {_offset}')
+    _warning = ''
+    try:
+        os.chown(f'{_tmp}', DNA_TGZ_OWNER['www-data'], DNA_TGZ_GROUP['www-data'])
+    except OSError as _e:
+        _warning = f'failed to chown {_tgz}, error={_e}'
+    os.chmod(f'{_tmp}', DNA_TGZ_CHMOD)
+    os.replace(f'{_tmp}', f'{_tgz}')
+    dna_tgz_sync(os.path.dirname(os.path.abspath(_tgz)))
+    return _warning, _h
+
+
+# +
+# function: dna_tgz_clean()
+# -
+# noinspection PyBroadException
+def dna_tgz_clean(_tgz: str = '') -> None:
+    """ removes temporary file(s) of _tgz left by killed runs """
+    for _f in glob.glob(os.path.join(os.path.dirname(os.path.abspath(_tgz)), f'.{os.path.basename(_tgz)}.*.tmp')):
+        try:
+            if os.path.getmtime(_f) < time.time() - DNA_TGZ_STALE:
+                os.remove(_f)
+        except Exception:
+            pass
+
+
+# +
+# function: dna_tgz_build()
+# -
+# noinspection PyBroadException
+def dna_tgz_build(_tgz: str = '', _files: list = None, _codec: str = 'gz', _store: str = '') -> dict:
+    """ builds, rebuilds, links or skips one archive and returns its statistics (with error='' on success) """
+    _files = list(dict.fromkeys(f'{_f}' for _f in (_files or [])))
+    _result = {'tgz': _tgz, 'codec': _codec, 'action': '', 'files': len(_files), 'encoded': 0, 'copied': 0,
+               'shared': 0, 'bytes': 0, 'size': 0, 'seconds': 0.0, 'publish': 0.0, 'error': '', 'warning': ''}
+    _t0 = time.monotonic()
+    _tmp, _sources, _s = '', {}, None
+    try:
+        _name, _level = dna_tgz_codec(_codec)
+        _norm = _name if _level is None else f'{_name}:{_level}'
+        _old = dna_tgz_manifest(_tgz, _codec)
+        _members = _old['members'] if _old is not None else []
+        _have = {(_m['file'], _m['size'], _m['mtime']): _m for _m in _members}
+        _want = [(_f, _st.st_size, _st.st_mtime_ns) for _f, _st in ((_f, os.stat(_f)) for _f in _files)]
+        _keys = [(_m['file'], _m['size'], _m['mtime']) for _m in _members]
+
+        # unchanged
+        if _old is not None and _keys == _want:
+            _result['action'], _result['copied'], _result['size'] = 'skipped', len(_members), _old['size']
+            _result['encoded'], _result['seconds'] = _result['files'] - _result['copied'], time.monotonic() - _t0
+            return _result
+
+        # an identical archive (same members, same codec) is published as a hard link to it
+        dna_tgz_clean(_tgz)
+        _dir = os.path.dirname(os.path.abspath(_tgz))
+        if _store.strip().lower() != 'none':
+            _s = DnaStore(_store if _store.strip() != '' else os.path.join(_dir, DNA_STORE_FILE))
+            _twin = _s.twin(dna_store_digest([_have[_k].get('address') if _k in _have else _s.address(*_k)
+                                              for _k in _want], _norm), _norm, os.path.abspath(_tgz))
+            _manifest = dna_tgz_manifest(_twin, _codec) if _twin is not None else None
+            if _manifest is not None:
+                try:
+                    os.link(_twin, f'{_dir}/.{os.path.basename(_tgz)}.{os.getpid()}.link.tmp')
+                    _tmp = f'{_dir}/.{os.path.basename(_tgz)}.{os.getpid()}.link.tmp'
+                except OSError:
+                    _manifest = None
+            if _manifest is not None:
+                _t1 = time.monotonic()
+                _result['warning'], _ = dna_tgz_publish(_tmp, _tgz, _manifest['size'], _manifest['sha256'],
+                                                        _manifest['members'], _manifest['trailer'], _codec)
+                _result['publish'], _tmp = time.monotonic() - _t1, ''
+                _result['action'], _result['copied'], _result['shared'] = 'linked', len(_want), len(_want)
+                _result['size'] = _manifest['size']
+                _manifest['archive'] = os.path.basename(_tgz)
+                dna_tgz_dump(f'{_tgz}{DNA_TGZ_MANIFEST}', _manifest)
+                _s.record(os.path.abspath(_tgz), _manifest)
+                _result['seconds'] = time.monotonic() - _t0
+                return _result
+
+        # copy (compressed) byte ranges of member(s) already in this or another archive, encode the rest
+        _fd, _tmp = tempfile.mkstemp(suffix='.tmp', prefix=f'.{os.path.basename(_tgz)}.', dir=_dir)
+        _tar, _new, _run = tarfile.open(fileobj=io.BytesIO(), mode='w'), [], ['', 0, 0]
+        with os.fdopen(_fd, 'wb') as _fb:
+            _fw = DnaTgzWriter(_fb)
+            for _k in _want:
+                _found = (f'{_tgz}', _have[_k]) if _k in _have else \
+                    (_s.locate(_s.address(*_k), _norm) if _s is not None else None)
+                if _found is not None and _found[0] not in _sources:
+                    _sources[_found[0]] = open(_found[0], 'rb')
+                if _run[2] > 0 and (_found is None or (_found[0], _found[1]['offset']) != (_run[0], _run[1] + _run[2])):
+                    _fw.copy(_sources[_run[0]], _run[1], _run[2])
+                    _run = ['', 0, 0]
+                if _found is not None:
+                    _run = [_found[0], _found[1]['offset'], 0] if _run[2] == 0 else _run
+                    _new.append({**_found[1], 'offset': _fw.tell() + _run[2]})
+                    _run[2] += _found[1]['length']
+                    _result['copied'] += 1
+                    _result['shared'] += 1 if _k not in _have else 0
+                else:
+                    _new.append(dna_tgz_member(_fw, _k[0], _codec, _tar))
+                    _result['bytes'] += _new[-1]['size']
+            if _run[2] > 0:
+                _fw.copy(_sources[_run[0]], _run[1], _run[2])
+            _trailer = _fw.tell()
+            dna_tgz_trailer(_fw, _new, _codec)
+            _t1 = time.monotonic()
+            _fb.flush()
+            os.fsync(_fb.fileno())
+        _result['warning'], _sha256 = dna_tgz_publish(_tmp, _tgz, _fw.tell(), _fw.sha256, _new, _trailer, _codec)
+        _result['publish'] = time.monotonic() - _t1
+        _tmp = ''
+        _result['action'] = 'created' if _old is None else 'rebuilt'
+        _result['encoded'] = _result['files'] - _result['copied']
+
+        # record the manifest (the completion marker), last and atomically, then index its members
+        _st = os.stat(_tgz)
+        _result['size'] = _st.st_size
+        _manifest = {'archive': os.path.basename(_tgz), 'codec': _norm, 'size': _st.st_size, 'mtime': _st.st_mtime_ns,
+                     'sha256': _sha256, 'trailer': _trailer, 'members': _new}
+        dna_tgz_dump(f'{_tgz}{DNA_TGZ_MANIFEST}', _manifest)
+        if _s is not None:
+            _s.record(os.path.abspath(_tgz), _manifest)
+    except Exception as _e:
+        _result['error'] = f'{_e}'
+    finally:
+        for _fr in _sources.values():
+            _fr.close()
+        if _s is not None:
+            _s.close()
+        if _tmp != '' and os.path.exists(_tmp):
+            os.remove(_tmp)
+    _result['seconds'] = time.monotonic() - _t0
+    return _result
+
+
+# +
+# function: dna_tgz_report()
+# -
+def dna_tgz_report(_result: dict = None, _log: Any = None) -> None:
+    """ logs the statistics of one archive """
+    _log = _log if _log is not None else dna_tgz_log
+    if _result.get('warning', '') != '':
+        _log.warning(_result['warning'])
+    if _result['error'] != '':
+        _log.error(f"failed to create {_result['tgz']} after {_result['seconds']:.2f}s, error={_result['error']}")
+        return
+    if _result['action'] == 'skipped':
+        _log.info(f"skipped {_result['tgz']} ({_result['codec']}): {_result['files']} file(s) unchanged")
+        return
+    _mb, _sec = _result['bytes'] / 1048576.0, max(_result['seconds'], 1.0e-6)
+    _log.info(f"{_result['action']} {_result['tgz']} ({_result['codec']}): {_result['files']} file(s), "
+              f"{_result['encoded']} encoded ({_mb:.1f} MB), {_result['copied']} copied "
+              f"({_result.get('shared', 0)} shared) -> "
+              f"{_result['size'] / 1048576.0:.1f} MB in {_result['seconds']:.2f}s ({_mb / _sec:.1f} MB/s)")
+
+
+# +
+# function: dna_tgz_group()
+# -
+def dna_tgz_group(_group: list = None) -> list:
+    """ builds [(archive, [files], codec)] in order, so later archive(s) copy the frames of earlier one(s) """
+    return [dna_tgz_build(_k, _v, _c) for _k, _v, _c in (_group or [])]
+
+
+# +
+# function: dna_tgz_groups()
+# -
+def dna_tgz_groups(_archives: dict = None) -> list:
+    """ returns the archive(s) of {archive: [files]} grouped by shared file(s), largest group first """
+    _parent = {_k: _k for _k in _archives}
+
+    def _root(_k):
+        while _parent[_k] != _k:
+            _parent[_k] = _parent[_parent[_k]]
+            _k = _parent[_k]
+        return _k
+
+    _owner = {}
+    for _k, _v in _archives.items():
+        for _f in _v:
+            _parent[_root(_k)] = _root(_owner.setdefault(os.path.abspath(_f), _k))
+    _groups = {}
+    for _k in sorted(_archives, key=lambda _a: dna_tgz_size(_archives[_a]), reverse=True):
+        _groups.setdefault(_root(_k), []).append(_k)
+    return sorted(_groups.values(), key=lambda _g: sum(dna_tgz_size(_archives[_k]) for _k in _g), reverse=True)
+
+
+# +
+# function: dna_tgz_builds()
+# -
+# noinspection PyBroadException
+def dna_tgz_builds(_archives: dict = None, workers: int = DNA_TGZ_WORKERS, log: Any = None, codec: Any = 'gz') -> dict:
+    """ builds {archive: [files]} concurrently on a bounded process pool and returns {archive: statistics} """
+
+    _archives = {f'{_k}': list(_v) for _k, _v in (_archives or {}).items()}
+    if not _archives:
+        return {}
+    _log = log if log is not None else dna_tgz_log
+
+    # archive(s) sharing frame(s) are built in turn by one worker (so each frame is compressed once), groups
+    # run concurrently and the largest start first so the pool drains evenly
+    _groups = dna_tgz_groups(_archives)
+    _codecs = {_k: (codec.get(_k, 'gz') if isinstance(codec, dict) else codec) for _k in _archives}
+    workers = min(workers if (isinstance(workers, int) and workers > 0) else DNA_TGZ_WORKERS, len(_groups))
+    _log.info(f'building {len(_archives)} archive(s) in {len(_groups)} group(s) with {workers} worker(s)')
+
+    _results, _t0 = {}, time.monotonic()
+    if workers == 1:
+        for _g in _groups:
+            for _k in _g:
+                _results[_k] = dna_tgz_build(_k, _archives[_k], _codecs[_k])
+                dna_tgz_report(_results[_k], _log)
+    else:
+        # never fork(): dna_all.py calls this from several threads, any of which may hold a logging, sqlite or
+        # smtp lock that a forked child would inherit held
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(DNA_TGZ_CONTEXT)) as _x:
+            _futures = {_x.submit(dna_tgz_group, [(_k, _archives[_k], _codecs[_k]) for _k in _g]): _g
+                        for _g in _groups}
+            for _f in as_completed(_futures):
+                try:
+                    _built = _f.result()
+                except Exception as _e:
+                    _built = [{'tgz': _k, 'codec': _codecs[_k], 'action': '', 'files': len(_archives[_k]),
+                               'encoded': 0, 'copied': 0, 'shared': 0, 'bytes': 0, 'size': 0, 'publish': 0.0,
+                               'seconds': time.monotonic() - _t0, 'error': f'{_e}', 'warning': ''}
+                              for _k in _futures[_f]]
+                for _r in _built:
+                    _results[_r['tgz']] = _r
+                    dna_tgz_report(_r, _log)
+
+    _log.info(f'built {len([_ for _ in _results.values() if _["error"] == ""])}/{len(_results)} archive(s) '
+              f'in {time.monotonic() - _t0:.2f}s')
+    return _results
+
+
+# +
+# function: dna_tgz_night()
+# -
+# noinspection PyBroadException
+def dna_tgz_night(_tel: str = 'Kuiper', _ins: str = 'Mont4k', _iso: str = '', _types: list = None,
+                  _data: str = DNA_TGZ_DATA, _dir: str = DNA_TGZ_DIR, _workers: int = DNA_TGZ_WORKERS,
+                  _dry_run: bool = False, _codec: str = DNA_TGZ_CALIBRATION) -> dict:
+    """ builds (or updates) the calibration archive(s) of one night, replaces cron/TGZ.sh's sequential tar calls """
+
+    _archives = {}
+    for _typ in (_types or DNA_TGZ_TYPES):
+        _files = sorted(glob.glob(os.path.join(_data, _tel, _ins, _iso, _typ, '*.fits')))
+        if _files:
+            _archives[dna_tgz_name(os.path.join(_dir, f'{_tel}.{_ins}.{_iso}.{_typ}.tgz'), _codec)] = _files
+    if _dry_run:
+        for _k, _v in _archives.items():
+            dna_tgz_log.info(f'Dry-Run> {_k} ({_codec}) <- {len(_v)} file(s) in {os.path.dirname(_v[0])}')
+        return {}
+
+    _metrics = DnaMetrics('dna_tgz', {'telescope': _tel, 'instrument': _ins, 'iso': _iso}, dna_tgz_log)
+    _metrics.count('files_scanned', sum(len(_v) for _v in _archives.values()))
+    with _metrics.timer('tgz'):
+        _results = dna_tgz_builds(_archives, workers=_workers, codec=_codec)
+    _metrics.tgz(_results).export()
+    return _results
+
+
+# +
+# main()
+# -
+if __name__ == '__main__':
+
+    # get command line argument(s)
+    _p = argparse.ArgumentParser(description=f'ARTN calibration archive builder',
+                                 formatter_class=argparse.RawTextHelpFormatter)
+    _p.add_argument(f'--tel', default='Kuiper', help=f"""Telescope <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--ins', default='Mont4k', help=f"""Instrument <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--iso', default=time.strftime('%Y%m%d'), help=f"""ISO date <yyyymmdd>, defaults to %(default)s""")
+    _p.add_argument(f'--types', default=','.join(DNA_TGZ_TYPES),
+                    help=f"""Comma separated observation type(s) <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--data', default=DNA_TGZ_DATA, help=f"""Data root <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--dir', default=DNA_TGZ_DIR, help=f"""Archive directory <str>, defaults to '%(default)s'""")
+    _p.add_argument(f'--workers', default=DNA_TGZ_WORKERS,
+                    help=f"""Concurrent archive(s) <int>, defaults to %(default)s""")
+    _p.add_argument(f'--codec', default=DNA_TGZ_CALIBRATION,
+                    help=f"""Codec <str>[:<level>], defaults to '%(default)s', choices: {list(DNA_TGZ_CODECS)}""")
+    _p.add_argument(f'--dry-run', default=False, action='store_true', help=f'if present, show (but do not build)')
+    _a = _p.parse_args()
+
+    # execute
+    logging.basicConfig(level=logging.INFO, format='%(asctime)-20s %(levelname)-9s %(filename)-15s %(message)s')
+    dna_tgz_night(_tel=_a.tel, _ins=_a.ins, _iso=_a.iso, _types=[_t for _t in _a.types.split(',') if _t.strip()],
+                  _data=_a.data, _dir=_a.dir, _workers=int(_a.workers), _dry_run=bool(_a.dry_run), _codec=_a.codec)